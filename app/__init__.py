@@ -11,12 +11,34 @@ application_directory = os.path.abspath(os.path.dirname(__file__))
 tweets_repo = Configurations.tweets_root
 accounts_df_filepath = Configurations.accounts_df_filepath
 cache_folderpath = Configurations.cache_folderpath
-os.makedirs(os.path.join(cache_folderpath, 'trajectory'), exist_ok=True)
+corpus_manifest_content_hash = Configurations.corpus_manifest_content_hash
+corpus_loader_worker_count = Configurations.corpus_loader_worker_count
+tweet_catalog_refresh_interval_in_seconds = Configurations.tweet_catalog_refresh_interval_in_seconds
+preprocessing_worker_count = Configurations.preprocessing_worker_count
+preprocessing_chunk_size = Configurations.preprocessing_chunk_size
+token_cache_max_size = Configurations.token_cache_max_size
+ngram_min_count = Configurations.ngram_min_count
+wildcard_max_expansions = Configurations.wildcard_max_expansions
+word_cloud_worker_count = Configurations.word_cloud_worker_count
+topic_inference_worker_count = Configurations.topic_inference_worker_count
+topic_inference_batch_size = Configurations.topic_inference_batch_size
+topic_model_cache_size = Configurations.topic_model_cache_size
+os.makedirs(os.path.join(cache_folderpath, 'tweet_store'), exist_ok=True)
+os.makedirs(os.path.join(cache_folderpath, 'manifest'), exist_ok=True)
 os.makedirs(os.path.join(cache_folderpath, 'word_clouds'), exist_ok=True)
+os.makedirs(os.path.join(cache_folderpath, 'word_clouds/layouts'), exist_ok=True)
 os.makedirs(os.path.join(cache_folderpath, 'word_frequencies'), exist_ok=True)
+os.makedirs(os.path.join(cache_folderpath, 'word_frequencies/partitions'), exist_ok=True)
+os.makedirs(os.path.join(cache_folderpath, 'word_frequencies/figures'), exist_ok=True)
+os.makedirs(os.path.join(cache_folderpath, 'count_cube'), exist_ok=True)
+os.makedirs(os.path.join(cache_folderpath, 'postings'), exist_ok=True)
 os.makedirs(os.path.join(cache_folderpath, 'lda_visualization'), exist_ok=True)
 os.makedirs(os.path.join(cache_folderpath, 'text_and_token'), exist_ok=True)
+os.makedirs(os.path.join(cache_folderpath, 'token_store'), exist_ok=True)
+os.makedirs(os.path.join(cache_folderpath, 'token_cache'), exist_ok=True)
 os.makedirs(os.path.join(cache_folderpath, 'trends'), exist_ok=True)
+os.makedirs(os.path.join(cache_folderpath, 'trends/partitions'), exist_ok=True)
+os.makedirs(os.path.join(cache_folderpath, 'trends/daily'), exist_ok=True)
 os.makedirs(os.path.join(cache_folderpath, 'topic_model'), exist_ok=True)
 os.makedirs(os.path.join(cache_folderpath, 'requests'), exist_ok=True)
 os.makedirs(os.path.join(cache_folderpath, 'requests/args'), exist_ok=True)
@@ -72,6 +94,13 @@ def create_app(configuration_class: object = Configurations):
         return render_template('errors/error.html', error_code=500,
                                error_message="Request Timeout"), 504
 
+    # - building the catalog of the tweet files before serving, it is then refreshed in the background
+    from app.libraries.io.tweet_filepaths import get_tweet_catalog
+    try:
+        get_tweet_catalog()
+    except Exception as e:
+        app.logger.error(f"failed to build the tweet catalog - error: {e}")
+
     scheduler.init_app(app)
     mail.init_app(app)
     return app
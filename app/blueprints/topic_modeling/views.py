@@ -1,10 +1,10 @@
-import pyLDAvis
-from flask import Blueprint, render_template, redirect
+from flask import Blueprint, render_template, redirect, request, url_for, abort
 import os
 from app import cache_folderpath
 from app.blueprints.topic_modeling.forms import TopicModelingForm
-from app.libraries.topic_modeling.utilities import get_topic_modeling_data, is_request_processed
-from app.libraries.utilities.plotly import jsonify_plotly_figure
+from app.libraries.topic_modeling.utilities import get_processed_request_cache, get_topic_modeling_figure_filepath, \
+    get_topic_modeling_visualization_html
+from app.libraries.utilities.plotly import send_figure_payload
 from app.libraries.io.read_write import write_pkl_gz
 from app.libraries.randomization.hashing import dict_hash
 topic_modeling_blueprint = Blueprint("topic_modeling", __name__)
@@ -29,11 +29,12 @@ def topic_modeling():
         args['query_step_in_days'] = int(form.query_step_in_days.data)
         args['query_min_date'] = str(form.query_min_date.data)
         args['query_max_date'] = str(form.query_max_date.data)
-        if is_request_processed(**args):
-            vis, fig = get_topic_modeling_data(**args)
-            graphJSON, layout, info_list = jsonify_plotly_figure(fig=fig)
+        request_cache = get_processed_request_cache(**args)
+        if request_cache is not None:
+            # - the figure is fetched by the page, see `topic_modeling_figure`
+            graphJSON = url_for('topic_modeling.topic_modeling_figure', **args)
             mode = 'data_received'
-            lda_vis = str(pyLDAvis.display(vis).data)
+            lda_vis = get_topic_modeling_visualization_html(request_cache) or ''
             return render_template("topic_modeling/palette.html",
                                    form=form, lda_vis=lda_vis, data=graphJSON, layout=layout, mode=mode,
                                    info_list=info_list)
@@ -45,3 +46,23 @@ def topic_modeling():
     return render_template("topic_modeling/palette.html",
                            form=form, lda_vis=lda_vis, data=graphJSON, layout=layout, mode=mode, info_list=info_list)
 
+
+@topic_modeling_blueprint.route('/topic_modeling/figure', methods=['GET'])
+def topic_modeling_figure():
+    try:
+        args = dict()
+        args['support_institutions'] = request.args.getlist('support_institutions')
+        args['query_institutions'] = request.args.getlist('query_institutions')
+        args['topic_counts'] = int(request.args['topic_counts'])
+        args['support_min_date'] = request.args['support_min_date']
+        args['support_max_date'] = request.args['support_max_date']
+        args['query_step_in_days'] = int(request.args['query_step_in_days'])
+        args['query_min_date'] = request.args['query_min_date']
+        args['query_max_date'] = request.args['query_max_date']
+    except (KeyError, ValueError):
+        abort(400)
+    figure_filepath = get_topic_modeling_figure_filepath(**args)
+    if figure_filepath is None:
+        # - the figures are only looked up here, the requests are queued on submission
+        abort(404)
+    return send_figure_payload(figure_filepath)
@@ -1,9 +1,10 @@
-from flask import Blueprint, render_template, redirect
+from flask import Blueprint, render_template, redirect, url_for, abort
 import os
 from app import cache_folderpath
 from app.blueprints.word_cloud.forms import WordCloudForm
-from app.libraries.utilities.plotly import jsonify_plotly_figure
-from app.libraries.word_clouds.utilities import get_word_cloud_data, is_request_processed
+from app.libraries.utilities.plotly import send_figure_payload
+from app.libraries.word_clouds.utilities import get_processed_word_clouds_trajectory_hash, get_word_cloud_timespans, \
+    get_word_cloud_panel_filepath
 from app.libraries.io.read_write import write_pkl_gz
 from app.libraries.randomization.hashing import dict_hash
 
@@ -64,23 +65,35 @@ def word_clouds():
         args['query_min_date'] = str(form.query_min_date.data)
         args['query_max_date'] = str(form.query_max_date.data)
         args['max_word_count'] = int(form.max_word_count.data)
-        if is_request_processed(**args):
-            figs, timespans = get_word_cloud_data(**args)
-            graphJSONs = []
-            layouts = []
-            info_lists = []
-            for fig in figs:
-                graphJSON, layout, info_list = jsonify_plotly_figure(fig=fig)
-                graphJSONs.append(graphJSON)
-                layouts.append(layout)
-                info_lists.append(info_list)
+        trajectory_hash = get_processed_word_clouds_trajectory_hash(**args)
+        if trajectory_hash is not None:
+            # - the panels are fetched one timespan at a time by the page, see `word_cloud_panel`
+            timespans = get_word_cloud_timespans(
+                query_min_date=args['query_min_date'],
+                query_max_date=args['query_max_date'],
+                query_step_in_days=args['query_step_in_days'])
+            panel_urls = [
+                url_for('word_clouds.word_cloud_panel',
+                        trajectory_hash=trajectory_hash, max_word_count=args['max_word_count'], bucket=j)
+                for j in range(len(timespans))]
             mode = 'data_received'
-            num_word_clouds = len(graphJSONs)
+            num_word_clouds = len(timespans)
             return render_template("word_cloud/palette.html",
-                                   form=form, data=graphJSONs, layouts=layouts, mode=mode, info_lists=info_lists,
+                                   form=form, data=panel_urls, layouts=layouts, mode=mode, info_lists=info_lists,
                                    timespans=timespans, num_word_clouds=num_word_clouds)
         else:
             write_pkl_gz(args, os.path.join(cache_folderpath, 'requests', 'args', 'word_cloud_' + dict_hash(args) + '.pkl.gz'))
             return redirect('/email_notification/word_cloud/' + dict_hash(args))
     return render_template("word_cloud/palette.html",
                            form=form, data=graphJSONs, layouts=layouts, mode=mode, info_lists=info_lists, timespans=timespans, num_word_clouds=num_word_clouds)
+
+
+@word_clouds_blueprint.route('/word_clouds/panel/<trajectory_hash>/<int:max_word_count>/<int:bucket>', methods=['GET'])
+def word_cloud_panel(trajectory_hash: str, max_word_count: int, bucket: int):
+    panel_filepath = get_word_cloud_panel_filepath(
+        trajectory_hash=trajectory_hash,
+        max_word_count=max_word_count,
+        bucket=bucket)
+    if panel_filepath is None:
+        abort(404)
+    return send_figure_payload(panel_filepath)
@@ -29,7 +29,7 @@ class WordFrequencyForm(FlaskForm):
     query_min_date = DateField("Start Date", validators=[DataRequired()])
     query_max_date = DateField("End Date", validators=[DataRequired()])
     query_step_in_days = StringField("Step in Days", validators=[DataRequired()])
-    query_terms = StringField("Query terms (comma separated, e.g. `word1,word2`)", validators=[DataRequired()])
+    query_terms = StringField("Query terms (comma separated, e.g. `word1,word2`, `public health` or `vaccin*`)", validators=[DataRequired()])
 
     submit = SubmitField("Submit query")
 
@@ -1,9 +1,12 @@
-from flask import Blueprint, render_template, redirect
+from flask import Blueprint, render_template, redirect, request, jsonify, url_for, abort
 import os
 from app import cache_folderpath
 from app.blueprints.word_frequency.forms import WordFrequencyForm
-from app.libraries.utilities.plotly import jsonify_plotly_figure
-from app.libraries.word_frequency.utilities import get_word_frequency_data, is_request_processed
+from app.libraries.utilities.plotly import send_figure_payload
+from app.libraries.word_frequency.utilities import is_request_processed, get_word_frequency_figure_payload_filepath, \
+    get_count_cube_word_frequency_data
+from app.libraries.word_frequency.postings import get_example_tweets
+from app.libraries.trajectory.utilities import get_filtered_twitter_handles
 from app.libraries.io.read_write import write_pkl_gz
 from app.libraries.randomization.hashing import dict_hash
 word_frequencies_blueprint = Blueprint("word_frequencies", __name__)
@@ -47,9 +50,14 @@ def word_frequencies():
         args['query_min_date'] = str(form.query_min_date.data)
         args['query_max_date'] = str(form.query_max_date.data)
         args['query_terms'] = [e.lower().strip() for e in form.query_terms.data.split(',')]
-        if is_request_processed(**args):
-            fig = get_word_frequency_data(**args)
-            graphJSON, layout, info_list = jsonify_plotly_figure(fig=fig)
+        processed = is_request_processed(**args)
+        if processed and get_word_frequency_figure_payload_filepath(**args) is None:
+            # - the requests covered by the count cube are plotted on submission, from a slice of the cube, and are
+            # queued if the count cube no longer covers them
+            processed = get_count_cube_word_frequency_data(**args) is not None
+        if processed:
+            # - the figure is fetched by the page, see `word_frequency_figure`
+            graphJSON = url_for('word_frequencies.word_frequency_figure', **args)
             mode = 'data_received'
             return render_template("word_frequency/palette.html",
                                    form=form, data=graphJSON, layout=layout, mode=mode, info_list=info_list)
@@ -60,3 +68,46 @@ def word_frequencies():
 
     return render_template("word_frequency/palette.html",
                            form=form, data=graphJSON, layout=layout, mode=mode, info_list=info_list)
+
+
+@word_frequencies_blueprint.route('/word_frequencies/figure', methods=['GET'])
+def word_frequency_figure():
+    try:
+        args = dict()
+        args['query_institutions'] = request.args.getlist('query_institutions')
+        args['query_step_in_days'] = int(request.args['query_step_in_days'])
+        args['query_min_date'] = request.args['query_min_date']
+        args['query_max_date'] = request.args['query_max_date']
+        args['query_terms'] = request.args.getlist('query_terms')
+    except (KeyError, ValueError):
+        abort(400)
+    figure_filepath = get_word_frequency_figure_payload_filepath(**args)
+    if figure_filepath is None:
+        # - the figures are only looked up here, the requests are queued on submission
+        abort(404)
+    return send_figure_payload(figure_filepath)
+
+
+@word_frequencies_blueprint.route('/word_frequencies/examples', methods=['GET'])
+def word_frequency_examples():
+    """
+    The top example tweets of a timespan of the word-frequency chart, e.g.
+    `/word_frequencies/examples?query_institutions=ethnic media&query_terms=vaccin*&query_min_date=2021-01-01&query_max_date=2021-01-08`.
+    """
+    query_institutions = request.args.getlist('query_institutions')
+    query_terms = [e.lower().strip() for e in request.args.get('query_terms', '').split(',') if len(e.strip()) > 0]
+    try:
+        top_n = max(1, min(int(request.args.get('top_n', 10)), 100))
+        handles = get_filtered_twitter_handles(trajectory=dict(
+            state=None, institution_type=query_institutions if len(query_institutions) > 0 else None, dates=None))
+        tweets = get_example_tweets(
+            query_terms=query_terms,
+            handles=list(handles),
+            min_date=request.args['query_min_date'],
+            max_date=request.args['query_max_date'],
+            top_n=top_n)
+    except (KeyError, ValueError) as e:
+        return jsonify(error=f"invalid parameters: {e}"), 400
+    if tweets is None:
+        return jsonify(error="the tweet index has not been built yet."), 503
+    return jsonify(tweets=tweets)
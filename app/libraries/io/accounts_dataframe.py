@@ -1,7 +1,16 @@
 import os
+import threading
+from collections import defaultdict
+from typing import Dict, Any, List, Set
 import pandas
 from app import accounts_df_filepath
 from app.libraries.meta.us import us_state_abbrs
+from app.libraries.utilities.logging import get_logger
+logger = get_logger(__name__)
+
+# - the process-wide account registry, see :func:`get_account_registry`
+account_registry = dict(signature=None, accounts_df=None, handles=set(), institution_type_index=dict(), state_index=dict())
+account_registry_lock = threading.Lock()
 
 
 def read_accounts_df() -> pandas.DataFrame:
@@ -16,3 +25,60 @@ def read_accounts_df() -> pandas.DataFrame:
     accounts_df.state = accounts_df.state.apply(lambda x: 'none' if pandas.isna(x) else us_state_abbrs[x])
 
     return accounts_df
+
+
+def get_account_registry() -> Dict[str, Any]:
+    """
+    Returns
+    -------
+    `Dict[str, Any]`: The process-wide account registry, which includes the `accounts_df`, the set of lower-cased
+    `handles`, and the `institution_type_index` and `state_index` from each institution type and state to the set of
+    its lower-cased handles. It is loaded once and only re-loaded when the accounts file changes.
+    """
+    stat = os.stat(accounts_df_filepath)
+    signature = (stat.st_size, stat.st_mtime_ns)
+    with account_registry_lock:
+        if account_registry['signature'] == signature:
+            return account_registry
+
+        logger.info(f"loading the account registry from {accounts_df_filepath}...")
+        accounts_df = read_accounts_df()
+        institution_type_index = defaultdict(set)
+        state_index = defaultdict(set)
+        for handle, institution_type, state in zip(
+                accounts_df.twitter_handle.tolist(), accounts_df.institution_type.tolist(), accounts_df.state.tolist()):
+            if not isinstance(handle, str):
+                continue
+            institution_type_index[institution_type].add(handle.lower())
+            state_index[state].add(handle.lower())
+
+        account_registry.update(
+            signature=signature,
+            accounts_df=accounts_df,
+            handles=set([e.lower() for e in accounts_df.twitter_handle.tolist() if isinstance(e, str)]),
+            institution_type_index=dict(institution_type_index),
+            state_index=dict(state_index))
+        return account_registry
+
+
+def get_registered_handles(state: List[str] = None, institution_type: List[str] = None) -> Set[str]:
+    """
+    Parameters
+    ----------
+    state: `List[str]`, optional (default=None)
+        The states to keep, all of them if `None`.
+
+    institution_type: `List[str]`, optional (default=None)
+        The institution types to keep, all of them if `None`.
+
+    Returns
+    -------
+    `Set[str]`: The lower-cased handles of the accounts matching both filters.
+    """
+    registry = get_account_registry()
+    handles = registry['handles']
+    if state is not None:
+        handles = handles & set().union(*[registry['state_index'].get(e, set()) for e in state])
+    if institution_type is not None:
+        handles = handles & set().union(*[registry['institution_type_index'].get(e, set()) for e in institution_type])
+    return handles
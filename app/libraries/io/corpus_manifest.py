@@ -0,0 +1,137 @@
+import os
+import hashlib
+from typing import Dict, List, Any, Tuple
+from app import tweets_repo, cache_folderpath, corpus_manifest_content_hash
+from app.libraries.io.read_write import write_pkl_gz, read_pkl_gz
+from app.libraries.randomization.hashing import dict_hash
+from app.libraries.utilities.logging import get_logger
+logger = get_logger(__name__)
+
+corpus_manifest_filepath = os.path.join(cache_folderpath, 'manifest', 'corpus_manifest.pkl.gz')
+
+
+def get_relative_tweet_filepath(tweet_filepath: str) -> str:
+    """
+    Parameters
+    ----------
+    tweet_filepath: `str`, required
+        The full path to a tweet file.
+
+    Returns
+    -------
+    `str`: The path of the tweet file relative to `TWEETS_ROOT`, which does not depend on where the corpus is mounted.
+    """
+    return os.path.relpath(tweet_filepath, tweets_repo).replace(os.sep, '/')
+
+
+def get_file_content_hash(filepath: str, chunk_size: int = 1 << 20) -> str:
+    """
+    Parameters
+    ----------
+    filepath: `str`, required
+        The path to the file.
+
+    chunk_size: `int`, optional (default=1MB)
+        The size of the chunks the file is read in.
+
+    Returns
+    -------
+    `str`: The MD5 hash of the file content.
+    """
+    fhash = hashlib.md5()
+    with open(filepath, 'rb') as handle:
+        for chunk in iter(lambda: handle.read(chunk_size), b''):
+            fhash.update(chunk)
+    return fhash.hexdigest()
+
+
+def read_corpus_manifest() -> Dict[str, Dict[str, Any]]:
+    if not os.path.exists(corpus_manifest_filepath):
+        return dict()
+    try:
+        return read_pkl_gz(corpus_manifest_filepath)
+    except Exception as e:
+        logger.error(f"failed to load the corpus manifest located in {corpus_manifest_filepath} - error: {e}")
+        return dict()
+
+
+def get_corpus_manifest(
+        tweet_filepaths: List[str],
+        content_hash: bool = None,
+        persist: bool = True
+) -> Dict[str, Dict[str, Any]]:
+    """
+    Fingerprinting the tweet files. The fingerprints of the files whose size and modification time have not changed
+    are taken from the persisted manifest, so that content hashes are only computed for new or modified files.
+
+    Parameters
+    ----------
+    tweet_filepaths: `List[str]`, required
+        The list of tweet filepaths.
+
+    content_hash: `bool`, optional (default=None)
+        Whether to fingerprint the files by their content hash rather than their modification time,
+        `CORPUS_MANIFEST_CONTENT_HASH` if `None`.
+
+    persist: `bool`, optional (default=True)
+        Whether to write the updated fingerprints back to the persisted manifest.
+
+    Returns
+    -------
+    `Dict[str, Dict[str, Any]]`: The fingerprint (`size`, `mtime_ns` and `content_hash`) of every given file,
+    keyed by its path relative to `TWEETS_ROOT`.
+    """
+    content_hash = corpus_manifest_content_hash if content_hash is None else content_hash
+    manifest = read_corpus_manifest()
+    output = dict()
+    is_updated = False
+    for tweet_filepath in tweet_filepaths:
+        relative_filepath = get_relative_tweet_filepath(tweet_filepath)
+        stat = os.stat(tweet_filepath)
+        entry = manifest.get(relative_filepath, None)
+        if entry is None or entry['size'] != stat.st_size or entry['mtime_ns'] != stat.st_mtime_ns:
+            entry = dict(size=stat.st_size, mtime_ns=stat.st_mtime_ns, content_hash=None)
+            is_updated = True
+        if content_hash and entry['content_hash'] is None:
+            entry = dict(entry, content_hash=get_file_content_hash(tweet_filepath))
+            is_updated = True
+        manifest[relative_filepath] = entry
+        output[relative_filepath] = entry
+
+    if is_updated and persist:
+        try:
+            write_pkl_gz(manifest, corpus_manifest_filepath)
+        except Exception as e:
+            logger.error(f"failed to write the corpus manifest to {corpus_manifest_filepath} - error: {e}")
+    return output
+
+
+def get_file_fingerprint(entry: Dict[str, Any]) -> Tuple:
+    """
+    Parameters
+    ----------
+    entry: `Dict[str, Any]`, required
+        The manifest entry of a file.
+
+    Returns
+    -------
+    `Tuple`: The `(size, content_hash)` of the file if its content is hashed, and `(size, mtime_ns)` otherwise.
+    """
+    if entry['content_hash'] is not None:
+        return entry['size'], entry['content_hash']
+    return entry['size'], entry['mtime_ns']
+
+
+def get_manifest_version(manifest: Dict[str, Dict[str, Any]]) -> str:
+    """
+    Parameters
+    ----------
+    manifest: `Dict[str, Dict[str, Any]]`, required
+        The manifest entries of the files, from :func:`get_corpus_manifest`.
+
+    Returns
+    -------
+    `str`: A compact identifier of the given files which does not depend on their listing order or on where the
+    corpus is mounted, to be used in the cache keys instead of the filepaths themselves.
+    """
+    return dict_hash(dict(files=sorted([[k, *get_file_fingerprint(v)] for k, v in manifest.items()])))
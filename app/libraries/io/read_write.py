@@ -1,10 +1,33 @@
+import os
 import gzip
+import fcntl
 import pickle
 import threading
+from contextlib import contextmanager
+import numpy
 
 thread_lock = threading.Lock()
 
 
+@contextmanager
+def file_lock(filepath):
+    """
+    Holding an exclusive advisory lock on `<filepath>.lock` for the duration of the block, so that the
+    read-modify-write of a file shared by several processes (and hosts mounting the same cache) is serialized.
+
+    Parameters
+    ----------
+    filepath: `str`, required
+        The path to the file (or folder) to lock.
+    """
+    with open(filepath + '.lock', 'a') as handle:
+        fcntl.flock(handle.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(handle.fileno(), fcntl.LOCK_UN)
+
+
 def write_pkl_gz(data, filepath):
     with thread_lock:
         with gzip.open(filepath, 'wb') as handle:
@@ -14,3 +37,54 @@ def write_pkl_gz(data, filepath):
 def read_pkl_gz(filepath):
     with gzip.open(filepath, 'rb') as handle:
         return pickle.load(handle)
+
+
+def write_versioned_arrays(folderpath, meta, arrays):
+    """
+    Writing a set of numpy arrays as `<name>-<version>.npy` files along with their `meta.pkl.gz`, which is replaced
+    last, so that the readers either see the previous version or the new one. The writers are serialized, and only
+    the files of the versions older than the previous one are then removed, so that a reader that has just read the
+    previous meta can still load its arrays, while the processes that memory-map them keep them until they re-load.
+
+    Parameters
+    ----------
+    folderpath: `str`, required
+        The path to the folder.
+
+    meta: `Dict[str, Any]`, required
+        The metadata, including the `version`.
+
+    arrays: `Dict[str, numpy.ndarray]`, required
+        The arrays to write.
+    """
+    os.makedirs(folderpath, exist_ok=True)
+    version = meta['version']
+    meta_filepath = os.path.join(folderpath, 'meta.pkl.gz')
+    with file_lock(meta_filepath):
+        versions = {version}
+        if os.path.exists(meta_filepath):
+            versions.add(read_pkl_gz(meta_filepath)['version'])
+        for name, array in arrays.items():
+            numpy.save(os.path.join(folderpath, f'{name}-{version}.npy'), array)
+        write_pkl_gz(dict(meta, arrays=sorted(arrays.keys())), meta_filepath + '.tmp')
+        os.replace(meta_filepath + '.tmp', meta_filepath)
+        for filename in os.listdir(folderpath):
+            if filename.endswith('.npy') and filename[:-len('.npy')].rsplit('-', 1)[-1] not in versions:
+                os.remove(os.path.join(folderpath, filename))
+
+
+def read_versioned_arrays(folderpath):
+    """
+    Parameters
+    ----------
+    folderpath: `str`, required
+        The path to a folder written by :func:`write_versioned_arrays`.
+
+    Returns
+    -------
+    `Dict[str, Any]`: The metadata along with the memory-mapped arrays.
+    """
+    output = read_pkl_gz(os.path.join(folderpath, 'meta.pkl.gz'))
+    for name in output['arrays']:
+        output[name] = numpy.load(os.path.join(folderpath, f"{name}-{output['version']}.npy"), mmap_mode='r')
+    return output
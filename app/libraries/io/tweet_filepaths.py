@@ -1,9 +1,140 @@
 import os
-from typing import List
-from app import tweets_repo
+import time
+import threading
+from typing import List, Dict, Any
+from app import tweets_repo, tweet_catalog_refresh_interval_in_seconds
+from app.libraries.io.corpus_manifest import get_corpus_manifest, get_manifest_version, get_relative_tweet_filepath
+from app.libraries.utilities.logging import get_logger
+logger = get_logger(__name__)
+
+# - the process-wide snapshot of the tweet files, see :func:`get_tweet_catalog`; it is replaced as a whole on refresh,
+# so a request never sees the filepaths of one refresh with the manifest of another
+tweet_catalog = dict(refreshed_at=None, root_mtime_ns=None, folders=dict(), filepaths=[], manifest=dict(), version=None)
+tweet_catalog_lock = threading.Lock()
+
+# - the process that runs the background refresh of the catalog, see :func:`start_tweet_catalog_refresher`
+tweet_catalog_refresher_pid = None
+
+
+def list_tweet_folder(folderpath: str) -> List[str]:
+    return sorted([os.path.join(folderpath, e) for e in os.listdir(folderpath) if e.lower().endswith('.csv')])
+
+
+def refresh_tweet_catalog(initial: bool = False) -> Dict[str, Any]:
+    """
+    Refreshing the catalog of the tweet files. Only the folders whose modification time has changed are listed again,
+    and the files are only stat-ed (through the corpus manifest) to pick up appended tweets.
+
+    Parameters
+    ----------
+    initial: `bool`, optional (default=False)
+        Whether this is the initial build of the catalog, which is skipped if another thread has built it meanwhile.
+
+    Returns
+    -------
+    `Dict[str, Any]`: The catalog, see :func:`get_tweet_catalog`.
+    """
+    global tweet_catalog
+    with tweet_catalog_lock:
+        previous = tweet_catalog
+        if initial and previous['refreshed_at'] is not None:
+            return previous
+        root_mtime_ns = os.stat(tweets_repo).st_mtime_ns
+        if root_mtime_ns != previous['root_mtime_ns']:
+            folderpaths = [os.path.join(tweets_repo, e) for e in os.listdir(tweets_repo)]
+            folderpaths = [e for e in folderpaths if os.path.isdir(e)]
+        else:
+            folderpaths = list(previous['folders'].keys())
+
+        folders = dict()
+        for folderpath in folderpaths:
+            try:
+                mtime_ns = os.stat(folderpath).st_mtime_ns
+            except FileNotFoundError:
+                continue
+            folder = previous['folders'].get(folderpath, None)
+            if folder is None or folder['mtime_ns'] != mtime_ns:
+                folder = dict(mtime_ns=mtime_ns, filepaths=list_tweet_folder(folderpath))
+            folders[folderpath] = folder
+
+        filepaths = [e for folderpath in sorted(folders.keys()) for e in folders[folderpath]['filepaths']]
+        manifest = get_corpus_manifest(filepaths)
+        tweet_catalog = dict(
+            refreshed_at=time.monotonic(),
+            root_mtime_ns=root_mtime_ns,
+            folders=folders,
+            filepaths=filepaths,
+            manifest=manifest,
+            version=get_manifest_version(manifest))
+        return tweet_catalog
+
+
+def refresh_tweet_catalog_periodically(interval_in_seconds: float) -> None:
+    while True:
+        time.sleep(interval_in_seconds)
+        try:
+            refresh_tweet_catalog()
+        except Exception as e:
+            logger.error(f"failed to refresh the tweet catalog - error: {e}")
+
+
+def start_tweet_catalog_refresher(interval_in_seconds: float = None) -> None:
+    """
+    Starting the daemon thread that refreshes the catalog of this process in the background, once per process (the
+    thread of a parent process does not survive a fork).
+
+    Parameters
+    ----------
+    interval_in_seconds: `float`, optional (default=None)
+        The time between two refreshes, `TWEET_CATALOG_REFRESH_INTERVAL_IN_SECONDS` if `None`.
+    """
+    global tweet_catalog_refresher_pid
+    interval_in_seconds = tweet_catalog_refresh_interval_in_seconds if interval_in_seconds is None else interval_in_seconds
+    with tweet_catalog_lock:
+        if tweet_catalog_refresher_pid == os.getpid():
+            return
+        tweet_catalog_refresher_pid = os.getpid()
+    threading.Thread(
+        target=refresh_tweet_catalog_periodically,
+        args=(interval_in_seconds,),
+        name='tweet-catalog-refresher',
+        daemon=True).start()
+
+
+def get_tweet_catalog() -> Dict[str, Any]:
+    """
+    Returns
+    -------
+    `Dict[str, Any]`: The process-wide snapshot of the tweet files, which includes the `filepaths`, their
+    corpus `manifest` entries and the corpus `version`. The snapshot is only built in the calling thread the first
+    time, and is then refreshed every `TWEET_CATALOG_REFRESH_INTERVAL_IN_SECONDS` by a background thread, so request
+    handling does not scan `TWEETS_ROOT`.
+    """
+    catalog = tweet_catalog
+    if catalog['refreshed_at'] is None:
+        catalog = refresh_tweet_catalog(initial=True)
+    start_tweet_catalog_refresher()
+    return catalog
 
 
 def get_tweet_filepaths() -> List[str]:
-    root_dirs = [os.path.join(tweets_repo, e) for e in os.listdir(tweets_repo) if os.path.isdir(os.path.join(tweets_repo, e))]
-    tweet_filepaths = [os.path.join(root_dir, e) for root_dir in root_dirs for e in os.listdir(root_dir) if os.path.exists(os.path.join(root_dir,  e)) and e.lower().endswith('.csv')]
-    return tweet_filepaths
+    return list(get_tweet_catalog()['filepaths'])
+
+
+def get_tweet_file_manifest(tweet_filepaths: List[str]) -> Dict[str, Dict[str, Any]]:
+    """
+    Parameters
+    ----------
+    tweet_filepaths: `List[str]`, required
+        The list of tweet filepaths.
+
+    Returns
+    -------
+    `Dict[str, Dict[str, Any]]`: The manifest entries of the given files, taken from the catalog of this process if it
+    covers all of them, and from :func:`get_corpus_manifest` otherwise (e.g. in the ingestion workers).
+    """
+    relative_filepaths = [get_relative_tweet_filepath(e) for e in tweet_filepaths]
+    manifest = tweet_catalog['manifest']
+    if all([e in manifest for e in relative_filepaths]):
+        return {e: manifest[e] for e in relative_filepaths}
+    return get_corpus_manifest(tweet_filepaths, persist=False)
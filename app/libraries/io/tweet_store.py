@@ -0,0 +1,583 @@
+import os
+import hashlib
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Any, Tuple
+import numpy
+import pandas
+import dateutil.parser as date_parser
+from dateutil.relativedelta import relativedelta
+
+from app import cache_folderpath, corpus_loader_worker_count
+from app.libraries.meta.features import important_twint_columns, important_twint_column_dtypes
+from app.libraries.io.read_write import write_pkl_gz, read_pkl_gz, file_lock
+from app.libraries.io.corpus_manifest import get_file_fingerprint, get_relative_tweet_filepath
+from app.libraries.io.tweet_filepaths import get_tweet_file_manifest
+from app.libraries.utilities.logging import get_logger
+logger = get_logger(__name__)
+
+tweet_store_folderpath = os.path.join(cache_folderpath, 'tweet_store')
+
+
+def get_handle_for_tweet_filepath(tweet_filepath: str) -> str:
+    """
+    Parameters
+    ----------
+    tweet_filepath: `str`, required
+        The path to a twint tweet file (e.g. `.../CNN.csv`).
+
+    Returns
+    -------
+    `str`: The lower-cased twitter handle that the file belongs to.
+    """
+    return os.path.basename(tweet_filepath)[:-4].lower()
+
+
+def group_tweet_filepaths_by_handle(tweet_filepaths: List[str]) -> Dict[str, List[str]]:
+    """
+    Parameters
+    ----------
+    tweet_filepaths: `List[str]`, required
+        The list of tweet filepaths.
+
+    Returns
+    -------
+    `Dict[str, List[str]]`: The (sorted) tweet filepaths of each lower-cased twitter handle.
+    """
+    output = defaultdict(list)
+    for tweet_filepath in tweet_filepaths:
+        output[get_handle_for_tweet_filepath(tweet_filepath)].append(tweet_filepath)
+    return {handle: sorted(filepaths) for handle, filepaths in output.items()}
+
+
+def normalize_tweet_dataframe(df: pandas.DataFrame) -> pandas.DataFrame:
+    """
+    Restricting a raw twint dataframe to the :obj:`important_twint_columns` and casting them to
+    their proper dtypes. Rows with an unparsable `id` or `date` are dropped. Every dataframe written to the tweet
+    store goes through it, so that the partitions have the same dtypes whichever way they are ingested.
+
+    Parameters
+    ----------
+    df: `pandas.DataFrame`, required
+        The raw twint dataframe.
+
+    Returns
+    -------
+    `pandas.DataFrame`: The normalized dataframe.
+    """
+    df = df[[e for e in important_twint_columns if e in df.columns]].copy()
+    for column in important_twint_columns:
+        if column not in df.columns:
+            df[column] = None
+
+    df['id'] = pandas.to_numeric(df['id'], errors='coerce')
+    df['date'] = pandas.to_datetime(df['date'], errors='coerce')
+    df = df[df['id'].notna() & df['date'].notna()].copy()
+
+    for column, dtype in important_twint_column_dtypes.items():
+        if column in ['id', 'date']:
+            df[column] = df[column].astype(dtype)
+        elif dtype == 'int64':
+            df[column] = pandas.to_numeric(df[column], errors='coerce').fillna(0).astype(dtype)
+        elif dtype == 'category':
+            # - re-building the categories, which the concatenation of dataframes turns into objects
+            df[column] = df[column].astype(object).astype(dtype)
+        else:
+            df[column] = df[column].astype(dtype)
+
+    return df[important_twint_columns].reset_index(drop=True)
+
+
+def read_tweet_csv(tweet_filepath: str) -> pandas.DataFrame:
+    """
+    Parameters
+    ----------
+    tweet_filepath: `str`, required
+        The path to a twint (tab-delimited) tweet file.
+
+    Returns
+    -------
+    `pandas.DataFrame`: The normalized dataframe, only including the :obj:`important_twint_columns`.
+    """
+    df = pandas.read_csv(
+        tweet_filepath,
+        on_bad_lines='skip',
+        delimiter='\t',
+        usecols=lambda e: e in important_twint_columns,
+        dtype=str)
+    return normalize_tweet_dataframe(df)
+
+
+def get_empty_tweet_dataframe(columns: List[str] = None) -> pandas.DataFrame:
+    """
+    Parameters
+    ----------
+    columns: `List[str]`, optional (default=None)
+        The columns to include, all the :obj:`important_twint_columns` if `None`.
+
+    Returns
+    -------
+    `pandas.DataFrame`: An empty tweet dataframe with the store dtypes.
+    """
+    columns = important_twint_columns if columns is None else columns
+    return pandas.DataFrame({e: pandas.Series([], dtype=important_twint_column_dtypes[e]) for e in columns})
+
+
+def get_months_for_daterange(min_date: Any, max_date: Any) -> List[str]:
+    """
+    Parameters
+    ----------
+    min_date: `Any`, required
+        The start of the date range (inclusive), as a `str` or a `date`.
+
+    max_date: `Any`, required
+        The end of the date range (exclusive), as a `str` or a `date`.
+
+    Returns
+    -------
+    `List[str]`: The ordered `YYYY-MM` month keys of the partitions overlapping with the range.
+    """
+    if isinstance(min_date, str):
+        min_date = date_parser.parse(min_date).date()
+    if isinstance(max_date, str):
+        max_date = date_parser.parse(max_date).date()
+
+    months = []
+    month = min_date.replace(day=1)
+    while month < max_date or not months:
+        months.append(month.strftime('%Y-%m'))
+        month += relativedelta(months=1)
+    return months
+
+
+def get_handle_store_folderpath(handle: str) -> str:
+    return os.path.join(tweet_store_folderpath, handle)
+
+
+def get_source_signature(tweet_filepaths: List[str]) -> List[Any]:
+    """
+    Parameters
+    ----------
+    tweet_filepaths: `List[str]`, required
+        The tweet filepaths of a single handle.
+
+    Returns
+    -------
+    `List[Any]`: The ordered list of `(relative filepath, *fingerprint)` entries from the corpus manifest, used to
+    decide whether a handle needs to be re-ingested.
+    """
+    manifest = get_tweet_file_manifest(tweet_filepaths)
+    return sorted([(k, *get_file_fingerprint(v)) for k, v in manifest.items()])
+
+
+def write_handle_meta(handle: str, meta: Dict[str, Any]) -> None:
+    meta_filepath = os.path.join(get_handle_store_folderpath(handle), 'meta.pkl.gz')
+    write_pkl_gz(meta, meta_filepath + f'.tmp{os.getpid()}')
+    os.replace(meta_filepath + f'.tmp{os.getpid()}', meta_filepath)
+
+
+def read_handle_meta(handle: str) -> Dict[str, Any]:
+    meta_filepath = os.path.join(get_handle_store_folderpath(handle), 'meta.pkl.gz')
+    if not os.path.exists(meta_filepath):
+        return None
+    try:
+        return read_pkl_gz(meta_filepath)
+    except Exception as e:
+        logger.error(f"failed to load the tweet store metadata for {handle} - error: {e}")
+        return None
+
+
+def get_ingested_partitions(handles: List[str]) -> List[Tuple[str, str, str]]:
+    """
+    Parameters
+    ----------
+    handles: `List[str]`, required
+        The lower-cased twitter handles.
+
+    Returns
+    -------
+    `List[Tuple[str, str, str]]`: The `(handle, month, fingerprint)` of every partition of the given handles that is in
+    the tweet store.
+    """
+    partitions = []
+    for handle in handles:
+        meta = read_handle_meta(handle)
+        if meta is not None:
+            partitions += [(handle, month, meta['partitions'][month]) for month in sorted(meta['partitions'].keys())]
+    return partitions
+
+
+def get_partition_fingerprint(df: pandas.DataFrame) -> str:
+    """
+    Parameters
+    ----------
+    df: `pandas.DataFrame`, required
+        The tweets of a partition.
+
+    Returns
+    -------
+    `str`: The MD5 hash of the partition content, which stays the same as long as the tweets of the partition do.
+    """
+    return hashlib.md5(pandas.util.hash_pandas_object(df, index=False).values.tobytes()).hexdigest()
+
+
+def is_handle_ingested(handle: str, tweet_filepaths: List[str]) -> bool:
+    """
+    Parameters
+    ----------
+    handle: `str`, required
+        The lower-cased twitter handle.
+
+    tweet_filepaths: `List[str]`, required
+        All the tweet files of this handle.
+
+    Returns
+    -------
+    `bool`: Whether the tweet store is up-to-date with the given tweet files of the handle.
+    """
+    meta = read_handle_meta(handle)
+    return meta is not None and meta['sources'] == get_source_signature(tweet_filepaths)
+
+
+def get_id_index_filepath(handle: str) -> str:
+    return os.path.join(get_handle_store_folderpath(handle), 'ids.npy')
+
+
+def get_id_months_filepath(handle: str) -> str:
+    return os.path.join(get_handle_store_folderpath(handle), 'id_months.npy')
+
+
+def read_id_index(handle: str) -> numpy.ndarray:
+    """
+    Parameters
+    ----------
+    handle: `str`, required
+        The lower-cased twitter handle.
+
+    Returns
+    -------
+    `numpy.ndarray`: The sorted `int64` ids of the tweets of the handle that are in the tweet store, empty if the
+    handle has no id index.
+    """
+    id_index_filepath = get_id_index_filepath(handle)
+    if not os.path.exists(id_index_filepath):
+        return numpy.array([], dtype=numpy.int64)
+    return numpy.load(id_index_filepath, mmap_mode='r')
+
+
+def read_id_months(handle: str) -> numpy.ndarray:
+    """
+    Parameters
+    ----------
+    handle: `str`, required
+        The lower-cased twitter handle.
+
+    Returns
+    -------
+    `numpy.ndarray`: The `datetime64[M]` month of the partition of every tweet of the id index, see
+    :func:`read_id_index`, empty if the handle has no id index.
+    """
+    id_months_filepath = get_id_months_filepath(handle)
+    if not os.path.exists(id_months_filepath):
+        return numpy.array([], dtype='datetime64[M]')
+    return numpy.load(id_months_filepath, mmap_mode='r')
+
+
+def write_id_index(handle: str, ids: numpy.ndarray, months: numpy.ndarray) -> None:
+    order = numpy.argsort(ids, kind='stable')
+    for filepath, array in [
+            (get_id_months_filepath(handle), numpy.asarray(months, dtype='datetime64[M]')[order]),
+            (get_id_index_filepath(handle), numpy.asarray(ids, dtype=numpy.int64)[order])]:
+        with open(filepath + f'.tmp{os.getpid()}', 'wb') as handle_file:
+            numpy.save(handle_file, array)
+        os.replace(filepath + f'.tmp{os.getpid()}', filepath)
+
+
+def is_in_id_index(ids: numpy.ndarray, id_index: numpy.ndarray) -> numpy.ndarray:
+    """
+    Parameters
+    ----------
+    ids: `numpy.ndarray`, required
+        The tweet ids to look up.
+
+    id_index: `numpy.ndarray`, required
+        The sorted ids of an id index.
+
+    Returns
+    -------
+    `numpy.ndarray`: The boolean mask of the ids that are already in the id index.
+    """
+    if len(id_index) == 0:
+        return numpy.zeros(len(ids), dtype=bool)
+    positions = numpy.minimum(numpy.searchsorted(id_index, ids), len(id_index) - 1)
+    return numpy.asarray(id_index)[positions] == ids
+
+
+def get_changed_tweet_filepaths(
+        tweet_filepaths: List[str],
+        signature: List[Any],
+        previous_signature: List[Any]
+) -> List[str]:
+    """
+    Parameters
+    ----------
+    tweet_filepaths: `List[str]`, required
+        All the tweet files of a handle.
+
+    signature: `List[Any]`, required
+        The current source signature of the handle.
+
+    previous_signature: `List[Any]`, required
+        The source signature of the handle at its last ingestion.
+
+    Returns
+    -------
+    `List[str]`: The tweet files that are new or whose signature has changed (e.g. appended to or edited) since the
+    last ingestion, or `None` if any of the previous files has been removed or has shrunk, in which case tweets may
+    have been removed and the handle cannot be ingested incrementally.
+    """
+    previous_sizes = {e[0]: e[1] for e in previous_signature}
+    sizes = {e[0]: e[1] for e in signature}
+    if any([k not in sizes or sizes[k] < v for k, v in previous_sizes.items()]):
+        return None
+    changed = set([e[0] for e in set(map(tuple, signature)) - set(map(tuple, previous_signature))])
+    return sorted([e for e in tweet_filepaths if get_relative_tweet_filepath(e) in changed])
+
+
+def write_tweet_store_partition(handle: str, month: str, df: pandas.DataFrame) -> str:
+    """
+    Parameters
+    ----------
+    handle: `str`, required
+        The lower-cased twitter handle.
+
+    month: `str`, required
+        The `YYYY-MM` month of the partition.
+
+    df: `pandas.DataFrame`, required
+        The date-sorted tweets of the partition.
+
+    Returns
+    -------
+    `str`: The fingerprint of the written partition.
+    """
+    partition_filepath = os.path.join(get_handle_store_folderpath(handle), f'{month}.parquet')
+    df.to_parquet(partition_filepath + f'.tmp{os.getpid()}', index=False)
+    os.replace(partition_filepath + f'.tmp{os.getpid()}', partition_filepath)
+    return get_partition_fingerprint(df)
+
+
+def ingest_handle(
+        handle: str,
+        tweet_filepaths: List[str],
+        overwrite: bool = False
+) -> Dict[str, Any]:
+    """
+    Converting the twint tweet files of a single handle into the columnar tweet store, where
+    the tweets are stored as one parquet file per month (`tweet_store/<handle>/<YYYY-MM>.parquet`),
+    de-duplicated by their `id`.
+    The handle is skipped if its source files have not changed since its last ingestion. If files have only been
+    added or changed without shrinking, only those files are read, and their tweets replace the stored tweets with the
+    same `id`, wherever the id index of the handle (`tweet_store/<handle>/ids.npy` and `id_months.npy`) locates them,
+    so that only the partitions receiving new or edited tweets are re-written. The
+    ingestions of a handle are serialized with a lock, and every file is written to a temporary file that is then
+    swapped in, the metadata last.
+
+    Parameters
+    ----------
+    handle: `str`, required
+        The lower-cased twitter handle.
+
+    tweet_filepaths: `List[str]`, required
+        All the tweet files of this handle.
+
+    overwrite: `bool`, optional (default=False)
+        Whether to re-ingest the handle from scratch even if its sources have not changed.
+
+    Returns
+    -------
+    `Dict[str, Any]`: The metadata of the ingested handle, including its source signature and the fingerprint
+    of every monthly partition.
+    """
+    signature = get_source_signature(tweet_filepaths)
+    meta = read_handle_meta(handle)
+    if meta is not None and meta['sources'] == signature and not overwrite:
+        return meta
+
+    handle_folderpath = get_handle_store_folderpath(handle)
+    os.makedirs(handle_folderpath, exist_ok=True)
+    # - the handle is ingested by one process at a time, the others finding it up-to-date once they get the lock
+    with file_lock(handle_folderpath):
+        meta = read_handle_meta(handle)
+        if meta is not None and meta['sources'] == signature and not overwrite:
+            return meta
+
+        changed_filepaths = None
+        if meta is not None and not overwrite and os.path.exists(get_id_months_filepath(handle)):
+            changed_filepaths = get_changed_tweet_filepaths(
+                tweet_filepaths=tweet_filepaths, signature=signature, previous_signature=meta['sources'])
+
+        if changed_filepaths is not None:
+            logger.info(f"ingesting {len(changed_filepaths)} new or changed tweet files of {handle} into the tweet store...")
+            id_index, id_months = numpy.asarray(read_id_index(handle)), numpy.asarray(read_id_months(handle))
+            df = pandas.concat([read_tweet_csv(e) for e in changed_filepaths] + [get_empty_tweet_dataframe()], axis=0, ignore_index=True)
+            df = normalize_tweet_dataframe(df.drop_duplicates(subset='id', keep='last'))
+            ids = df.id.to_numpy()
+            months = df.date.to_numpy().astype('datetime64[M]')
+            # - the stored copies of the re-read tweets are replaced, even in another partition if their date changed
+            stored_months = id_months[numpy.searchsorted(id_index, ids[is_in_id_index(ids, id_index)])]
+            partitions = dict(meta['partitions'])
+            for month in numpy.datetime_as_string(numpy.union1d(months, stored_months), unit='M').tolist():
+                month_df = df[months == numpy.datetime64(month, 'M')]
+                if month in partitions:
+                    stored_df = read_tweet_store_partition(handle=handle, month=month)
+                    month_df = pandas.concat([stored_df[~stored_df.id.isin(ids)], month_df], axis=0, ignore_index=True)
+                if month_df.shape[0] == 0:
+                    os.remove(os.path.join(handle_folderpath, f'{month}.parquet'))
+                    del partitions[month]
+                    continue
+                month_df = month_df.sort_values(by='date', ascending=True, kind='mergesort')
+                partitions[month] = write_tweet_store_partition(
+                    handle=handle, month=month, df=normalize_tweet_dataframe(month_df))
+            if df.shape[0] > 0:
+                kept = ~is_in_id_index(id_index, numpy.sort(ids))
+                write_id_index(
+                    handle,
+                    numpy.concatenate([id_index[kept], ids]),
+                    numpy.concatenate([id_months[kept], months]))
+        else:
+            logger.info(f"ingesting the tweets of {handle} into the tweet store...")
+            previous_partitions = dict() if meta is None or overwrite else meta['partitions']
+            df = pandas.concat([read_tweet_csv(e) for e in sorted(tweet_filepaths)], axis=0, ignore_index=True)
+            df = df.drop_duplicates(subset='id', keep='last')
+            df.sort_values(by='date', ascending=True, inplace=True, kind='mergesort')
+
+            partitions = dict()
+            for month, month_df in df.groupby(df.date.dt.strftime('%Y-%m'), sort=True):
+                month_df = normalize_tweet_dataframe(month_df)
+                partition_filepath = os.path.join(handle_folderpath, f'{month}.parquet')
+                fingerprint = get_partition_fingerprint(month_df)
+                if previous_partitions.get(month, None) == fingerprint and os.path.exists(partition_filepath):
+                    partitions[month] = fingerprint
+                    continue
+                partitions[month] = write_tweet_store_partition(handle=handle, month=month, df=month_df)
+
+            # - removing the partitions that no longer exist in the sources
+            for filename in os.listdir(handle_folderpath):
+                if filename.endswith('.parquet') and filename[:-len('.parquet')] not in partitions:
+                    os.remove(os.path.join(handle_folderpath, filename))
+            write_id_index(handle, df.id.to_numpy(), df.date.to_numpy().astype('datetime64[M]'))
+
+        meta = dict(sources=signature, partitions=partitions)
+        write_handle_meta(handle, meta)
+        return meta
+
+
+def ingest_handle_safely(handle: str, tweet_filepaths: List[str], overwrite: bool = False) -> None:
+    try:
+        ingest_handle(handle=handle, tweet_filepaths=tweet_filepaths, overwrite=overwrite)
+    except Exception as e:
+        logger.error(f"failed to ingest the tweets of {handle} - error: {e}")
+
+
+def ingest_tweet_store(
+        tweet_filepaths: List[str],
+        overwrite: bool = False,
+        worker_count: int = None
+) -> None:
+    """
+    Ingesting every handle in the given tweet files that is not up-to-date into the columnar tweet store.
+
+    Parameters
+    ----------
+    tweet_filepaths: `List[str]`, required
+        The list of tweet filepaths.
+
+    overwrite: `bool`, optional (default=False)
+        Whether to re-ingest the handles even if their sources have not changed.
+
+    worker_count: `int`, optional (default=None)
+        The number of worker processes, `CORPUS_LOADER_WORKER_COUNT` if `None`.
+    """
+    worker_count = corpus_loader_worker_count if worker_count is None else worker_count
+    handle_tweet_filepaths = [
+        (handle, filepaths) for handle, filepaths in group_tweet_filepaths_by_handle(tweet_filepaths).items()
+        if overwrite or not is_handle_ingested(handle, filepaths)]
+
+    if worker_count <= 1 or len(handle_tweet_filepaths) <= 1:
+        for handle, filepaths in handle_tweet_filepaths:
+            ingest_handle_safely(handle, filepaths, overwrite)
+        return
+
+    with ProcessPoolExecutor(max_workers=worker_count) as executor:
+        list(executor.map(
+            ingest_handle_safely,
+            [e[0] for e in handle_tweet_filepaths],
+            [e[1] for e in handle_tweet_filepaths],
+            [overwrite] * len(handle_tweet_filepaths)))
+
+
+def read_tweet_store_partition(handle: str, month: str, columns: List[str] = None) -> pandas.DataFrame:
+    """
+    Parameters
+    ----------
+    handle: `str`, required
+        The lower-cased twitter handle.
+
+    month: `str`, required
+        The `YYYY-MM` key of the partition.
+
+    columns: `List[str]`, optional (default=None)
+        The columns to read, all the :obj:`important_twint_columns` if `None`.
+
+    Returns
+    -------
+    `pandas.DataFrame`: The tweets of the partition, sorted by date.
+    """
+    columns = important_twint_columns if columns is None else columns
+    partition_filepath = os.path.join(get_handle_store_folderpath(handle), f'{month}.parquet')
+    if not os.path.exists(partition_filepath):
+        return get_empty_tweet_dataframe(columns=columns)
+    return pandas.read_parquet(partition_filepath, columns=columns)
+
+
+def read_tweet_store(
+        handle: str,
+        min_date: Any,
+        max_date: Any,
+        columns: List[str] = None
+) -> pandas.DataFrame:
+    """
+    Reading the tweets of a handle within a date range, only touching the monthly partitions and columns that are
+    needed.
+
+    Parameters
+    ----------
+    handle: `str`, required
+        The lower-cased twitter handle.
+
+    min_date: `Any`, required
+        The start of the date range (inclusive), as a `str` or a `date`.
+
+    max_date: `Any`, required
+        The end of the date range (exclusive), as a `str` or a `date`.
+
+    columns: `List[str]`, optional (default=None)
+        The columns to read, all the :obj:`important_twint_columns` if `None`.
+
+    Returns
+    -------
+    `pandas.DataFrame`: The tweets of the handle in the given range, sorted by date.
+    """
+    columns = important_twint_columns if columns is None else columns
+    read_columns = columns if 'date' in columns else columns + ['date']
+    handle_folderpath = get_handle_store_folderpath(handle)
+    partition_filepaths = [os.path.join(handle_folderpath, f'{e}.parquet') for e in get_months_for_daterange(min_date, max_date)]
+    dfs = [pandas.read_parquet(e, columns=read_columns) for e in partition_filepaths if os.path.exists(e)]
+    if len(dfs) == 0:
+        return get_empty_tweet_dataframe(columns=columns)
+
+    df = pandas.concat(dfs, axis=0, ignore_index=True)
+    df = df[(df.date >= pandas.Timestamp(str(min_date))) & (df.date < pandas.Timestamp(str(max_date)))]
+    return df[columns].reset_index(drop=True)
+
@@ -12,3 +12,16 @@ important_twint_columns = [
                      'name'
 ]
 
+important_twint_column_dtypes = {
+    'id': 'int64',
+    'date': 'datetime64[ns]',
+    'timezone': 'string',
+    'replies_count': 'int64',
+    'retweets_count': 'int64',
+    'likes_count': 'int64',
+    'hashtags': 'string',
+    'tweet': 'string',
+    'user_id': 'int64',
+    'username': 'category',
+    'name': 'string'
+}
@@ -0,0 +1,327 @@
+import os
+import uuid
+import shutil
+from typing import List, Dict, Any, Tuple
+import numpy
+
+from app.libraries.io.read_write import write_pkl_gz, read_pkl_gz, file_lock
+
+token_corpus_streams = ['words', 'tokens']
+
+
+def get_token_corpus_version_filepath(folderpath: str) -> str:
+    return os.path.join(folderpath, 'version.txt')
+
+
+def get_token_corpus_data_folderpath(folderpath: str) -> str:
+    """
+    Parameters
+    ----------
+    folderpath: `str`, required
+        The path to a corpus folder, see :meth:`TokenCorpus.write`.
+
+    Returns
+    -------
+    `str`: The folder of the current version of the corpus, the corpus folder itself if it was written before the
+    corpora were versioned, or `None` if no corpus has been written to it.
+    """
+    version_filepath = get_token_corpus_version_filepath(folderpath)
+    if os.path.exists(version_filepath):
+        with open(version_filepath, 'r') as handle:
+            return os.path.join(folderpath, handle.read().strip())
+    if os.path.exists(os.path.join(folderpath, 'vocabulary.pkl.gz')):
+        return folderpath
+    return None
+
+
+def is_token_corpus_written(folderpath: str) -> bool:
+    return get_token_corpus_data_folderpath(folderpath) is not None
+
+
+def get_csr_positions(offsets: numpy.ndarray, rows: numpy.ndarray) -> Tuple[numpy.ndarray, numpy.ndarray]:
+    """
+    Parameters
+    ----------
+    offsets: `numpy.ndarray`, required
+        The CSR offsets of a stream.
+
+    rows: `numpy.ndarray`, required
+        The rows to gather.
+
+    Returns
+    -------
+    `Tuple[numpy.ndarray, numpy.ndarray]`: The offsets of the gathered rows, and the positions of their values in the
+    values array of the stream.
+    """
+    starts = numpy.asarray(offsets[:-1])[rows]
+    lengths = numpy.asarray(offsets[1:])[rows] - starts
+    new_offsets = numpy.zeros(len(rows) + 1, dtype=numpy.int64)
+    numpy.cumsum(lengths, out=new_offsets[1:])
+    positions = numpy.arange(new_offsets[-1], dtype=numpy.int64) + numpy.repeat(starts - new_offsets[:-1], lengths)
+    return new_offsets, positions
+
+
+class TokenCorpus(object):
+    """
+    The :class:`TokenCorpus` is the compact representation of preprocessed tweets: a vocabulary interning every
+    distinct string to an `int32` id, and two CSR streams (an `int64` offsets array and an `int32` values array), the
+    `words` of the preprocessed text and the `tokens` of the preprocessed tokens, along with the `ids` and
+    `dates` of the tweets. When read from disk, the arrays are memory-mapped.
+    """
+    def __init__(
+            self,
+            vocabulary: List[str],
+            ids: numpy.ndarray,
+            dates: numpy.ndarray,
+            offsets: Dict[str, numpy.ndarray],
+            values: Dict[str, numpy.ndarray]
+    ):
+        """
+        Parameters
+        ----------
+        vocabulary: `List[str]`, required
+            The interned strings, where the i-th string has the id `i`.
+
+        ids: `numpy.ndarray`, required
+            The `int64` tweet ids.
+
+        dates: `numpy.ndarray`, required
+            The `datetime64[ns]` tweet dates.
+
+        offsets: `Dict[str, numpy.ndarray]`, required
+            The CSR offsets of every stream in :obj:`token_corpus_streams`.
+
+        values: `Dict[str, numpy.ndarray]`, required
+            The CSR values (string ids) of every stream in :obj:`token_corpus_streams`.
+        """
+        self.vocabulary = vocabulary
+        self.ids = ids
+        self.dates = dates
+        self.offsets = offsets
+        self.values = values
+        self._vocabulary_array = None
+        self._vocabulary_index = None
+
+    @classmethod
+    def from_lists(
+            cls,
+            ids: List[int],
+            dates: List[Any],
+            text_list: List[str],
+            tokens_list: List[List[str]]
+    ) -> 'TokenCorpus':
+        """
+        Parameters
+        ----------
+        ids: `List[int]`, required
+            The tweet ids.
+
+        dates: `List[Any]`, required
+            The tweet dates.
+
+        text_list: `List[str]`, required
+            The preprocessed text of the tweets, which is split into `words`.
+
+        tokens_list: `List[List[str]]`, required
+            The preprocessed tokens of the tweets.
+
+        Returns
+        -------
+        `TokenCorpus`: The interned corpus.
+        """
+        index = dict()
+        offsets, values = dict(), dict()
+        for stream, sequences in [('words', [e.split() for e in text_list]), ('tokens', tokens_list)]:
+            lengths = numpy.fromiter((len(e) for e in sequences), dtype=numpy.int64, count=len(sequences))
+            offsets[stream] = numpy.zeros(len(sequences) + 1, dtype=numpy.int64)
+            numpy.cumsum(lengths, out=offsets[stream][1:])
+            values[stream] = numpy.fromiter(
+                (index.setdefault(e, len(index)) for sequence in sequences for e in sequence),
+                dtype=numpy.int32,
+                count=int(offsets[stream][-1]))
+        return cls(
+            vocabulary=list(index.keys()),
+            ids=numpy.asarray(ids, dtype=numpy.int64),
+            dates=numpy.asarray(dates, dtype='datetime64[ns]'),
+            offsets=offsets,
+            values=values)
+
+    @classmethod
+    def concatenate(cls, corpora: List['TokenCorpus']) -> 'TokenCorpus':
+        """
+        Parameters
+        ----------
+        corpora: `List[TokenCorpus]`, required
+            The corpora to concatenate, whose vocabularies are merged.
+
+        Returns
+        -------
+        `TokenCorpus`: The concatenated corpus.
+        """
+        index = dict()
+        mappings = [
+            numpy.array([index.setdefault(e, len(index)) for e in corpus.vocabulary], dtype=numpy.int32)
+            for corpus in corpora]
+        offsets, values = dict(), dict()
+        for stream in token_corpus_streams:
+            offsets[stream] = numpy.zeros(sum([len(e) for e in corpora]) + 1, dtype=numpy.int64)
+            row, shift = 0, 0
+            for corpus in corpora:
+                offsets[stream][row + 1:row + len(corpus) + 1] = numpy.asarray(corpus.offsets[stream][1:]) + shift
+                row += len(corpus)
+                shift += int(corpus.offsets[stream][-1])
+            values[stream] = numpy.concatenate(
+                [mapping[numpy.asarray(corpus.values[stream])] for corpus, mapping in zip(corpora, mappings)] +
+                [numpy.array([], dtype=numpy.int32)])
+        return cls(
+            vocabulary=list(index.keys()),
+            ids=numpy.concatenate([numpy.asarray(e.ids) for e in corpora] + [numpy.array([], dtype=numpy.int64)]),
+            dates=numpy.concatenate([numpy.asarray(e.dates) for e in corpora] + [numpy.array([], dtype='datetime64[ns]')]),
+            offsets=offsets,
+            values=values)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @property
+    def vocabulary_array(self) -> numpy.ndarray:
+        if self._vocabulary_array is None:
+            self._vocabulary_array = numpy.array(self.vocabulary, dtype=object)
+        return self._vocabulary_array
+
+    @property
+    def vocabulary_index(self) -> Dict[str, int]:
+        if self._vocabulary_index is None:
+            self._vocabulary_index = {e: i for i, e in enumerate(self.vocabulary)}
+        return self._vocabulary_index
+
+    def select(self, rows: numpy.ndarray) -> 'TokenCorpus':
+        """
+        Parameters
+        ----------
+        rows: `numpy.ndarray`, required
+            The indices (or boolean mask) of the tweets to keep, in their new order.
+
+        Returns
+        -------
+        `TokenCorpus`: The corpus of the selected tweets, sharing the vocabulary of this corpus.
+        """
+        rows = numpy.asarray(rows)
+        rows = numpy.flatnonzero(rows) if rows.dtype == bool else rows.astype(numpy.int64)
+        offsets, values = dict(), dict()
+        for stream in token_corpus_streams:
+            offsets[stream], positions = get_csr_positions(self.offsets[stream], rows)
+            values[stream] = numpy.asarray(self.values[stream])[positions]
+        return TokenCorpus(
+            vocabulary=self.vocabulary,
+            ids=numpy.asarray(self.ids)[rows],
+            dates=numpy.asarray(self.dates)[rows],
+            offsets=offsets,
+            values=values)
+
+    def get_sequences(self, stream: str = 'tokens') -> List[List[str]]:
+        strings = self.vocabulary_array[numpy.asarray(self.values[stream])].tolist()
+        offsets = numpy.asarray(self.offsets[stream]).tolist()
+        return [strings[offsets[i]:offsets[i + 1]] for i in range(len(self))]
+
+    def get_tokens_list(self) -> List[List[str]]:
+        """
+        Returns
+        -------
+        `List[List[str]]`: The tokens of the tweets, which is the input of the fitting and inference methods of
+        `TransformerLDATopicModelingPipeline` (it builds its own gensim dictionary from them). The token lists are
+        therefore only materialized per fitting corpus or inference batch, rather than kept as the stored format.
+        """
+        return self.get_sequences(stream='tokens')
+
+    def get_text_list(self) -> List[str]:
+        return [' '.join(e) for e in self.get_sequences(stream='words')]
+
+    def get_term_counts(self, rows: numpy.ndarray = None, stream: str = 'words') -> Dict[str, int]:
+        """
+        Parameters
+        ----------
+        rows: `numpy.ndarray`, optional (default=None)
+            The indices of the tweets to count over, all of them if `None`.
+
+        stream: `str`, optional (default='words')
+            The stream to count.
+
+        Returns
+        -------
+        `Dict[str, int]`: The number of occurrences of every string in the stream of the given tweets.
+        """
+        values = numpy.asarray(self.values[stream])
+        if rows is not None:
+            _, positions = get_csr_positions(self.offsets[stream], numpy.asarray(rows, dtype=numpy.int64))
+            values = values[positions]
+        counts = numpy.bincount(values, minlength=len(self.vocabulary))
+        nonzero = numpy.flatnonzero(counts)
+        return dict(zip(self.vocabulary_array[nonzero].tolist(), counts[nonzero].tolist()))
+
+    def write(self, folderpath: str, extra_arrays: Dict[str, numpy.ndarray] = None) -> None:
+        """
+        Writing the corpus as a new version (sub-folder) of a corpus folder, and then pointing the `version.txt` of
+        the folder to it, so that the readers either see the previous version or the new one. The writers are
+        serialized, and the files of the previous version are kept for the readers that have just resolved it, while
+        the older ones are removed (the processes that memory-map them keep them until they re-load).
+
+        Parameters
+        ----------
+        folderpath: `str`, required
+            The path to the corpus folder.
+
+        extra_arrays: `Dict[str, numpy.ndarray]`, optional (default=None)
+            Additional arrays to store in the folder as `<name>.npy`.
+        """
+        os.makedirs(folderpath, exist_ok=True)
+        version_filepath = get_token_corpus_version_filepath(folderpath)
+        with file_lock(version_filepath):
+            previous_folderpath = get_token_corpus_data_folderpath(folderpath)
+            version = uuid.uuid4().hex
+            version_folderpath = os.path.join(folderpath, version)
+            os.makedirs(version_folderpath)
+            numpy.save(os.path.join(version_folderpath, 'ids.npy'), numpy.asarray(self.ids))
+            numpy.save(os.path.join(version_folderpath, 'dates.npy'), numpy.asarray(self.dates))
+            for stream in token_corpus_streams:
+                numpy.save(os.path.join(version_folderpath, f'{stream}_offsets.npy'), numpy.asarray(self.offsets[stream]))
+                numpy.save(os.path.join(version_folderpath, f'{stream}_values.npy'), numpy.asarray(self.values[stream]))
+            for name, array in (extra_arrays or dict()).items():
+                numpy.save(os.path.join(version_folderpath, f'{name}.npy'), numpy.asarray(array))
+            write_pkl_gz(self.vocabulary, os.path.join(version_folderpath, 'vocabulary.pkl.gz'))
+
+            with open(version_filepath + f'.tmp{os.getpid()}', 'w') as handle:
+                handle.write(version)
+            os.replace(version_filepath + f'.tmp{os.getpid()}', version_filepath)
+            kept = [version, None if previous_folderpath is None else os.path.basename(previous_folderpath)]
+            for filename in os.listdir(folderpath):
+                filepath = os.path.join(folderpath, filename)
+                if os.path.isdir(filepath) and filename not in kept:
+                    shutil.rmtree(filepath, ignore_errors=True)
+                elif previous_folderpath != folderpath and (filename.endswith('.npy') or filename == 'vocabulary.pkl.gz'):
+                    # - the files of a corpus written before the corpora were versioned
+                    os.remove(filepath)
+
+    @classmethod
+    def read(cls, folderpath: str, mmap: bool = True) -> 'TokenCorpus':
+        """
+        Parameters
+        ----------
+        folderpath: `str`, required
+            The path to the corpus folder, or to one of its versions.
+
+        mmap: `bool`, optional (default=True)
+            Whether to memory-map the arrays rather than reading them.
+
+        Returns
+        -------
+        `TokenCorpus`: The corpus.
+        """
+        mmap_mode = 'r' if mmap else None
+        folderpath = get_token_corpus_data_folderpath(folderpath) or folderpath
+        return cls(
+            vocabulary=read_pkl_gz(os.path.join(folderpath, 'vocabulary.pkl.gz')),
+            ids=numpy.load(os.path.join(folderpath, 'ids.npy'), mmap_mode=mmap_mode),
+            dates=numpy.load(os.path.join(folderpath, 'dates.npy'), mmap_mode=mmap_mode),
+            offsets={e: numpy.load(os.path.join(folderpath, f'{e}_offsets.npy'), mmap_mode=mmap_mode) for e in token_corpus_streams},
+            values={e: numpy.load(os.path.join(folderpath, f'{e}_values.npy'), mmap_mode=mmap_mode) for e in token_corpus_streams})
@@ -0,0 +1,167 @@
+import os
+from collections import OrderedDict
+from typing import List, Dict, Any
+from fame.text_processing.token_processor import TokenProcessor
+
+from app import cache_folderpath, token_cache_max_size
+from app.libraries.io.read_write import write_pkl_gz, read_pkl_gz, file_lock
+from app.libraries.randomization.hashing import dict_hash
+from app.libraries.utilities.logging import get_logger
+logger = get_logger(__name__)
+
+# - the methods whose output for a token depends on its neighbours, which cannot be memoized per token
+context_sensitive_token_processor_methods = [
+    'keep_nouns_only'
+]
+
+
+class CachedTokenProcessor(TokenProcessor):
+    """
+    The :class:`CachedTokenProcessor` is a :class:`TokenProcessor` which memoizes the output of its method chain per
+    distinct token, so that the expensive methods (e.g. `spell_check_and_typo_fix` and `stem_words`) run once per
+    surface form rather than once per occurrence. The memo is a bounded LRU which is persisted to
+    `cache/token_cache/<methods hash>.pkl.gz` by :meth:`save`, to be shared across jobs. The preprocessing workers
+    hand their new entries back to the parent (see :meth:`pop_new_entries`), which saves them once per job.
+
+    If any of the methods is context-sensitive, the tokens are processed as they would by :class:`TokenProcessor`.
+    """
+    def __init__(self, methods: List[str], max_size: int = None):
+        """
+        Parameters
+        ----------
+        methods: `List[str]`, required
+            The token processing methods, as in :class:`TokenProcessor`.
+
+        max_size: `int`, optional (default=None)
+            The maximum number of memoized tokens, `TOKEN_CACHE_MAX_SIZE` if `None`.
+        """
+        super(CachedTokenProcessor, self).__init__(methods=methods)
+        self.memoized_methods = list(methods)
+        self.max_size = token_cache_max_size if max_size is None else max_size
+        self.is_memoizable = not any([e in context_sensitive_token_processor_methods for e in methods])
+        self.cache_filepath = os.path.join(
+            cache_folderpath, 'token_cache', dict_hash(dict(methods=self.memoized_methods)) + '.pkl.gz')
+        self._cache = None
+        self._new_entries = OrderedDict()
+
+    def read_cache(self) -> Dict[str, List[str]]:
+        if not os.path.exists(self.cache_filepath):
+            return dict()
+        try:
+            return read_pkl_gz(self.cache_filepath)
+        except Exception as e:
+            logger.error(f"failed to load the token cache located in {self.cache_filepath} - error: {e}")
+            return dict()
+
+    @property
+    def cache(self) -> OrderedDict:
+        if self._cache is None:
+            self._cache = OrderedDict(self.read_cache())
+        return self._cache
+
+    def process_token(self, token: str) -> List[str]:
+        cache = self.cache
+        if token in cache:
+            cache.move_to_end(token)
+            return cache[token]
+        output = list(super(CachedTokenProcessor, self).__call__([token]))
+        self.add_entry(token, output)
+        return output
+
+    def add_entry(self, token: str, output: List[str]) -> None:
+        cache = self.cache
+        cache[token] = output
+        cache.move_to_end(token)
+        if len(cache) > self.max_size:
+            cache.popitem(last=False)
+        self._new_entries[token] = output
+        if len(self._new_entries) > self.max_size:
+            self._new_entries.popitem(last=False)
+
+    def pop_new_entries(self) -> Dict[str, List[str]]:
+        """
+        Returns
+        -------
+        `Dict[str, List[str]]`: The entries memoized since the last call, or since the last :meth:`save`.
+        """
+        new_entries, self._new_entries = self._new_entries, OrderedDict()
+        return dict(new_entries)
+
+    def add_entries(self, entries: Dict[str, List[str]]) -> None:
+        for token, output in entries.items():
+            self.add_entry(token, output)
+
+    def __call__(self, tokens: List[str]) -> List[str]:
+        if not self.is_memoizable:
+            return super(CachedTokenProcessor, self).__call__(tokens)
+        return [e for token in tokens for e in self.process_token(token)]
+
+    def save(self) -> None:
+        """
+        Merging the new memoized tokens into the persisted token cache, under a file lock so that concurrent jobs
+        neither lose each other's entries nor write to the same temporary file. Entries written by other processes
+        are kept, up to `max_size` entries.
+        """
+        if len(self._new_entries) == 0:
+            return
+        tmp_filepath = f'{self.cache_filepath}.{os.getpid()}.tmp'
+        try:
+            with file_lock(self.cache_filepath):
+                cache = OrderedDict(self.read_cache())
+                cache.update(self._new_entries)
+                while len(cache) > self.max_size:
+                    cache.popitem(last=False)
+                write_pkl_gz(dict(cache), tmp_filepath)
+                os.replace(tmp_filepath, self.cache_filepath)
+            self._new_entries = OrderedDict()
+        except Exception as e:
+            logger.error(f"failed to write the token cache to {self.cache_filepath} - error: {e}")
+
+    def __getstate__(self) -> Dict[str, Any]:
+        # - the memo is re-read from disk rather than shipped along with the pipeline
+        state = self.__dict__.copy()
+        state['_cache'] = None
+        state['_new_entries'] = OrderedDict()
+        return state
+
+
+def get_token_caches(pipeline: Any) -> Dict[str, CachedTokenProcessor]:
+    output = dict()
+    for attribute in ['token_processor_light', 'token_processor_heavy']:
+        token_processor = getattr(pipeline, attribute, None)
+        if isinstance(token_processor, CachedTokenProcessor):
+            output[attribute] = token_processor
+    return output
+
+
+def pop_new_token_cache_entries(pipeline: Any) -> Dict[str, Dict[str, List[str]]]:
+    """
+    Parameters
+    ----------
+    pipeline: `TransformerLDATopicModelingPipeline`, required
+        The pipeline of a preprocessing worker.
+
+    Returns
+    -------
+    `Dict[str, Dict[str, List[str]]]`: The new entries of each :class:`CachedTokenProcessor` of the pipeline, keyed
+    by its attribute, to be merged into the pipeline of the parent with :func:`update_token_caches`.
+    """
+    return {k: v.pop_new_entries() for k, v in get_token_caches(pipeline).items()}
+
+
+def update_token_caches(pipeline: Any, entries: Dict[str, Dict[str, List[str]]]) -> None:
+    token_caches = get_token_caches(pipeline)
+    for attribute, attribute_entries in entries.items():
+        if attribute in token_caches:
+            token_caches[attribute].add_entries(attribute_entries)
+
+
+def save_token_caches(pipeline: Any) -> None:
+    """
+    Parameters
+    ----------
+    pipeline: `TransformerLDATopicModelingPipeline`, required
+        The pipeline whose :class:`CachedTokenProcessor` token processors are to be persisted.
+    """
+    for token_processor in get_token_caches(pipeline).values():
+        token_processor.save()
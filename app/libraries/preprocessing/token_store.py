@@ -0,0 +1,235 @@
+import os
+from typing import List, Tuple, Any, Iterable
+from concurrent.futures import ProcessPoolExecutor
+import numpy
+from fame.topic_modeling.cortex.pipeline.bert_lda import TransformerLDATopicModelingPipeline
+
+from app import cache_folderpath, preprocessing_worker_count, preprocessing_chunk_size
+from app.libraries.io.tweet_store import is_in_id_index
+from app.libraries.io.read_write import file_lock
+from app.libraries.preprocessing.corpus import TokenCorpus, get_token_corpus_data_folderpath
+from app.libraries.preprocessing.utilities import iterate_preprocessed_chunks, get_preprocessing_executor
+from app.libraries.preprocessing.token_cache import save_token_caches
+from app.libraries.utilities.logging import get_logger
+logger = get_logger(__name__)
+
+token_store_folderpath = os.path.join(cache_folderpath, 'token_store')
+
+
+def get_token_store_shard_folderpath(preprocessing_hash: str, handle: str, month: str) -> str:
+    return os.path.join(token_store_folderpath, preprocessing_hash, handle, month)
+
+
+def read_token_store_shard(preprocessing_hash: str, handle: str, month: str) -> Tuple[TokenCorpus, numpy.ndarray]:
+    """
+    Parameters
+    ----------
+    preprocessing_hash: `str`, required
+        The fingerprint of the text and token processors.
+
+    handle: `str`, required
+        The lower-cased twitter handle.
+
+    month: `str`, required
+        The `YYYY-MM` month of the shard.
+
+    Returns
+    -------
+    `Tuple[TokenCorpus, numpy.ndarray]`: The (memory-mapped) corpus of the preprocessed tweets of the shard, sorted by
+    id, and the sorted ids of the tweets that the preprocessing dropped.
+    """
+    shard_folderpath = get_token_store_shard_folderpath(preprocessing_hash, handle, month)
+    # - the version of the shard is resolved once, so that the corpus and its dropped ids are read from the same one
+    data_folderpath = get_token_corpus_data_folderpath(shard_folderpath) if os.path.exists(shard_folderpath) else None
+    if data_folderpath is not None:
+        try:
+            return TokenCorpus.read(data_folderpath), numpy.load(os.path.join(data_folderpath, 'dropped_ids.npy'))
+        except Exception as e:
+            logger.error(f"failed to load the token store shard located in {shard_folderpath} - error: {e}")
+    return TokenCorpus.from_lists(ids=[], dates=[], text_list=[], tokens_list=[]), numpy.array([], dtype=numpy.int64)
+
+
+def write_token_store_shard(
+        preprocessing_hash: str,
+        handle: str,
+        month: str,
+        missed: TokenCorpus,
+        missed_ids: numpy.ndarray
+) -> None:
+    """
+    Adding newly preprocessed tweets to a shard. The shard is re-read under a lock, so that the tweets added by a
+    concurrent writer of the same shard are kept.
+
+    Parameters
+    ----------
+    preprocessing_hash: `str`, required
+        The fingerprint of the text and token processors.
+
+    handle: `str`, required
+        The lower-cased twitter handle.
+
+    month: `str`, required
+        The `YYYY-MM` month of the shard.
+
+    missed: `TokenCorpus`, required
+        The newly preprocessed tweets that survived the preprocessing.
+
+    missed_ids: `numpy.ndarray`, required
+        The ids of all the newly preprocessed tweets, including the dropped ones.
+    """
+    shard_folderpath = get_token_store_shard_folderpath(preprocessing_hash, handle, month)
+    try:
+        os.makedirs(os.path.dirname(shard_folderpath), exist_ok=True)
+        with file_lock(shard_folderpath):
+            shard, dropped_ids = read_token_store_shard(preprocessing_hash, handle, month)
+            missed = missed.select(~numpy.isin(numpy.asarray(missed.ids), numpy.asarray(shard.ids)))
+            shard = TokenCorpus.concatenate([shard, missed])
+            shard = shard.select(numpy.argsort(shard.ids, kind='stable'))
+            dropped_ids = numpy.union1d(dropped_ids, numpy.setdiff1d(missed_ids, numpy.asarray(shard.ids)))
+            shard.write(shard_folderpath, extra_arrays=dict(dropped_ids=dropped_ids))
+    except Exception as e:
+        logger.error(f"failed to write the token store shard to {shard_folderpath} - error: {e}")
+
+
+def update_token_store(
+        pipeline: TransformerLDATopicModelingPipeline,
+        preprocessing_hash: str,
+        shards: Iterable[Tuple[str, str, List[int], List[Any], List[str]]],
+        worker_count: int = None,
+        chunk_size: int = None
+) -> None:
+    """
+    Preprocessing the given tweets that are missing from the token store, and adding them to their shards. The misses
+    of many shards are preprocessed together in rounds of about two chunks per worker, so that a single process pool
+    serves the whole job and small shards still keep every worker busy. The token caches of the pipeline are saved
+    once, at the end of the job.
+
+    Parameters
+    ----------
+    pipeline: `TransformerLDATopicModelingPipeline`, required
+        The pipeline whose processors are used for the preprocessing.
+
+    preprocessing_hash: `str`, required
+        The fingerprint of the processors of the pipeline, from
+        :func:`app.libraries.preprocessing.utilities.get_preprocessing_hash`.
+
+    shards: `Iterable[Tuple[str, str, List[int], List[Any], List[str]]]`, required
+        The `(handle, month, ids, dates, text_list)` of the tweets of each shard, which is consumed lazily.
+
+    worker_count: `int`, optional (default=None)
+        The number of worker processes, `PREPROCESSING_WORKER_COUNT` if `None`.
+
+    chunk_size: `int`, optional (default=None)
+        The number of tweets per chunk, `PREPROCESSING_CHUNK_SIZE` if `None`.
+    """
+    worker_count = preprocessing_worker_count if worker_count is None else worker_count
+    chunk_size = preprocessing_chunk_size if chunk_size is None else chunk_size
+    round_size = 2 * chunk_size * max(worker_count, 1)
+
+    executor = None
+    round_shards, round_text_list = [], []
+
+    def preprocess_round(executor: ProcessPoolExecutor) -> None:
+        round_starts = numpy.array([e[-1] for e in round_shards] + [len(round_text_list)], dtype=numpy.int64)
+        missed_text_list, missed_tokens_list, kept = [], [], []
+        for chunk_text_list, chunk_tokens_list, indices in iterate_preprocessed_chunks(
+                pipeline=pipeline,
+                text_list=round_text_list,
+                executor=executor,
+                worker_count=worker_count,
+                chunk_size=chunk_size):
+            missed_text_list += list(chunk_text_list)
+            missed_tokens_list += list(chunk_tokens_list)
+            kept += list(indices)
+
+        # - splitting the kept tweets (in the input order) back into their shards
+        kept = numpy.array(kept, dtype=numpy.int64)
+        bounds = numpy.searchsorted(kept, round_starts)
+        for i, (handle, month, ids, dates, start) in enumerate(round_shards):
+            rows = kept[bounds[i]:bounds[i + 1]] - start
+            missed = TokenCorpus.from_lists(
+                ids=ids[rows],
+                dates=dates[rows],
+                text_list=missed_text_list[bounds[i]:bounds[i + 1]],
+                tokens_list=missed_tokens_list[bounds[i]:bounds[i + 1]])
+            write_token_store_shard(preprocessing_hash, handle, month, missed, ids)
+
+    try:
+        for handle, month, ids, dates, text_list in shards:
+            ids = numpy.asarray(ids, dtype=numpy.int64)
+            shard, dropped_ids = read_token_store_shard(preprocessing_hash, handle, month)
+            misses = numpy.flatnonzero(~(is_in_id_index(ids, numpy.asarray(shard.ids)) | is_in_id_index(ids, dropped_ids)))
+            if len(misses) == 0:
+                continue
+            logger.info(f"preprocessing {len(misses)} out of {len(ids)} tweets of {handle} in {month}...")
+            round_shards.append((
+                handle, month, ids[misses], numpy.asarray(dates, dtype='datetime64[ns]')[misses], len(round_text_list)))
+            round_text_list += [text_list[i] for i in misses.tolist()]
+            if len(round_text_list) < round_size:
+                continue
+
+            if executor is None and worker_count > 1:
+                executor = get_preprocessing_executor(pipeline=pipeline, worker_count=worker_count)
+            preprocess_round(executor)
+            round_shards, round_text_list = [], []
+
+        if len(round_shards) > 0:
+            if executor is None and worker_count > 1 and len(round_text_list) > chunk_size:
+                executor = get_preprocessing_executor(pipeline=pipeline, worker_count=worker_count)
+            preprocess_round(executor)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+        # - the token caches are saved once per job rather than after every chunk
+        save_token_caches(pipeline)
+
+
+def get_preprocessed_tweets(
+        pipeline: TransformerLDATopicModelingPipeline,
+        preprocessing_hash: str,
+        handle: str,
+        month: str,
+        ids: List[int],
+        dates: List[Any],
+        text_list: List[str]
+) -> TokenCorpus:
+    """
+    Looking the tweets up in the token store, which keeps the preprocessed text and tokens of every tweet per
+    `(tweet id, processor fingerprint)` as a :class:`TokenCorpus`, sharded by handle and month. Only the tweets that
+    are missing from the store are preprocessed, see :func:`update_token_store`.
+
+    Parameters
+    ----------
+    pipeline: `TransformerLDATopicModelingPipeline`, required
+        The pipeline whose processors are used for the preprocessing.
+
+    preprocessing_hash: `str`, required
+        The fingerprint of the processors of the pipeline, from
+        :func:`app.libraries.preprocessing.utilities.get_preprocessing_hash`.
+
+    handle: `str`, required
+        The lower-cased twitter handle.
+
+    month: `str`, required
+        The `YYYY-MM` month of the tweets.
+
+    ids: `List[int]`, required
+        The tweet ids.
+
+    dates: `List[Any]`, required
+        The tweet dates.
+
+    text_list: `List[str]`, required
+        The raw text of the tweets.
+
+    Returns
+    -------
+    `TokenCorpus`: The corpus of the given tweets that survived the preprocessing, in their given order.
+    """
+    ids = numpy.asarray(ids, dtype=numpy.int64)
+    update_token_store(
+        pipeline=pipeline, preprocessing_hash=preprocessing_hash, shards=[(handle, month, ids, dates, text_list)])
+    shard, _ = read_token_store_shard(preprocessing_hash, handle, month)
+    shard_ids = numpy.asarray(shard.ids)
+    rows = numpy.flatnonzero(is_in_id_index(ids, shard_ids))
+    return shard.select(numpy.searchsorted(shard_ids, ids[rows]))
@@ -0,0 +1,232 @@
+from typing import Dict, Any, List, Tuple, Iterator
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import torch
+from fame.text_processing.text_processor import TextProcessor
+from fame.text_processing.token_processor import TokenProcessor
+from fame.topic_modeling.cortex.pipeline.bert_lda import TransformerLDATopicModelingPipeline
+
+from app import preprocessing_worker_count, preprocessing_chunk_size
+from app.libraries.randomization.hashing import dict_hash
+from app.libraries.preprocessing.token_cache import CachedTokenProcessor, pop_new_token_cache_entries, \
+    update_token_caches
+
+text_processor_methods = [
+    'remove_url',
+    'convert_to_lowercase',
+    'uppercase_based_missing_delimiter_fix',
+    # 'gtlt_normalize',
+    # 'substitute_more_than_two_letter_repetition_with_one',
+    'non_character_repetition_elimination',
+    # 'use_star_as_delimiter',
+    # 'remove_parantheses_and_their_contents',
+    'remove_questionexlamation_in_brackets',
+    'eliminate_phrase_repetition',
+    'strip'
+]
+
+light_token_processor_methods = [
+    'keep_alphabetics_only',
+    # 'keep_nouns_only',
+    # 'spell_check_and_typo_fix',
+    # 'stem_words',
+    # 'remove_stopwords'
+]
+
+heavy_token_processor_methods = [
+    'keep_alphabetics_only',
+    # 'keep_nouns_only',
+    'spell_check_and_typo_fix',
+    'stem_words',
+    'remove_stopwords'
+]
+
+
+def get_pipeline_args_to_hash(
+        number_of_topics_for_lda: int = 2,
+        heavy_token_processing: bool = False
+) -> Dict[str, Any]:
+    """
+    Parameters
+    ----------
+    number_of_topics_for_lda: `int`, optional (default=2)
+        The number of topics to use.
+
+    heavy_token_processing: `bool`, optional (default=False)
+        Whether the heavy token processor spell-checks, stems and removes the stopwords, as it does for topic modeling.
+
+    Returns
+    -------
+    `Dict[str, Any]`: The hashable description of the pipeline arguments.
+    """
+    return dict(
+        number_of_topics_for_lda=number_of_topics_for_lda,
+        autoencoder=None,
+        representation_clustering=None,
+        use_transformer=False,
+        use_lda=True,
+        use_tfidf=False,
+        device='cpu',
+        transformer_modelname='paraphrase-mpnet-base-v2',
+        text_processor=dict(methods=text_processor_methods),
+        token_processor_light=dict(methods=light_token_processor_methods),
+        token_processor_heavy=dict(
+            methods=heavy_token_processor_methods if heavy_token_processing else light_token_processor_methods))
+
+
+def get_preprocessing_hash(heavy_token_processing: bool = False) -> str:
+    """
+    Parameters
+    ----------
+    heavy_token_processing: `bool`, optional (default=False)
+        Whether the heavy token processor spell-checks, stems and removes the stopwords.
+
+    Returns
+    -------
+    `str`: The fingerprint of the text and token processors, which is all that the preprocessed text and tokens
+    depend on.
+    """
+    pipeline_args_to_hash = get_pipeline_args_to_hash(heavy_token_processing=heavy_token_processing)
+    return dict_hash({k: pipeline_args_to_hash[k] for k in ['text_processor', 'token_processor_light', 'token_processor_heavy']})
+
+
+def get_pipeline(
+        number_of_topics_for_lda: int = 2,
+        heavy_token_processing: bool = False
+) -> TransformerLDATopicModelingPipeline:
+    """
+    Parameters
+    ----------
+    number_of_topics_for_lda: `int`, optional (default=2)
+        The number of topics to use.
+
+    heavy_token_processing: `bool`, optional (default=False)
+        Whether the heavy token processor spell-checks, stems and removes the stopwords, as it does for topic modeling.
+
+    Returns
+    -------
+    `TransformerLDATopicModelingPipeline`: The (unfitted) pipeline.
+    """
+    # - the heavy token processing is memoized per distinct token
+    if heavy_token_processing:
+        token_processor_heavy = CachedTokenProcessor(methods=heavy_token_processor_methods)
+    else:
+        token_processor_heavy = TokenProcessor(methods=light_token_processor_methods)
+
+    return TransformerLDATopicModelingPipeline(
+        number_of_topics_for_lda=number_of_topics_for_lda,
+        autoencoder=None,
+        representation_clustering=None,
+        use_transformer=False,
+        use_lda=True,
+        use_tfidf=False,
+        device=torch.device('cpu'),
+        transformer_modelname='paraphrase-mpnet-base-v2',
+        text_processor=TextProcessor(methods=text_processor_methods),
+        token_processor_light=TokenProcessor(methods=light_token_processor_methods),
+        token_processor_heavy=token_processor_heavy)
+
+
+# - the pipeline of a preprocessing worker process, see :func:`iterate_preprocessed_chunks`
+worker_pipeline = None
+
+
+def set_worker_pipeline(pipeline: TransformerLDATopicModelingPipeline) -> None:
+    global worker_pipeline
+    worker_pipeline = pipeline
+
+
+def preprocess_chunk(text_list: List[str]) -> Tuple[Tuple[List[str], List[List[str]], List[int]], Dict[str, Any]]:
+    output = worker_pipeline.preprocess_and_get_text_and_tokens(text_list=text_list, verbose=0)
+    # - the new token cache entries go back to the parent, which saves them once per job
+    return output, pop_new_token_cache_entries(worker_pipeline)
+
+
+def get_preprocessing_executor(pipeline: TransformerLDATopicModelingPipeline, worker_count: int = None) -> ProcessPoolExecutor:
+    """
+    Parameters
+    ----------
+    pipeline: `TransformerLDATopicModelingPipeline`, required
+        The pipeline whose processors are used for the preprocessing.
+
+    worker_count: `int`, optional (default=None)
+        The number of worker processes, `PREPROCESSING_WORKER_COUNT` if `None`.
+
+    Returns
+    -------
+    `ProcessPoolExecutor`: A pool of preprocessing workers, to be shared by all the chunks of a job and shut down by
+    the caller.
+    """
+    worker_count = preprocessing_worker_count if worker_count is None else worker_count
+    return ProcessPoolExecutor(max_workers=worker_count, initializer=set_worker_pipeline, initargs=(pipeline,))
+
+
+def iterate_preprocessed_chunks(
+        pipeline: TransformerLDATopicModelingPipeline,
+        text_list: List[str],
+        executor: ProcessPoolExecutor = None,
+        worker_count: int = None,
+        chunk_size: int = None
+) -> Iterator[Tuple[List[str], List[List[str]], List[int]]]:
+    """
+    Running the text and token processors of the pipeline over chunks of the text list in a process pool, and
+    yielding the results chunk by chunk in the input order. At most two chunks per worker are in flight, so the
+    preprocessed corpus is never held in memory alongside a full copy of its input.
+
+    Parameters
+    ----------
+    pipeline: `TransformerLDATopicModelingPipeline`, required
+        The pipeline whose processors are used for the preprocessing.
+
+    text_list: `List[str]`, required
+        The raw text of the tweets.
+
+    executor: `ProcessPoolExecutor`, optional (default=None)
+        The pool of the job, from :func:`get_preprocessing_executor`. If `None`, a pool is started for this call
+        when there is more than one chunk.
+
+    worker_count: `int`, optional (default=None)
+        The number of worker processes, `PREPROCESSING_WORKER_COUNT` if `None`.
+
+    chunk_size: `int`, optional (default=None)
+        The number of tweets per chunk, `PREPROCESSING_CHUNK_SIZE` if `None`.
+
+    Returns
+    -------
+    `Iterator[Tuple[List[str], List[List[str]], List[int]]]`: The `(text_list, tokens_list, indices)` of each chunk,
+    as returned by `preprocess_and_get_text_and_tokens`, with the `indices` pointing into the full `text_list`. The
+    token cache entries of the workers are merged into the pipeline, to be saved by the caller with
+    :func:`app.libraries.preprocessing.token_cache.save_token_caches`.
+    """
+    worker_count = preprocessing_worker_count if worker_count is None else worker_count
+    chunk_size = preprocessing_chunk_size if chunk_size is None else chunk_size
+    starts = list(range(0, len(text_list), chunk_size))
+
+    if executor is None and (worker_count <= 1 or len(starts) <= 1):
+        for start in starts:
+            chunk_text_list, chunk_tokens_list, indices = pipeline.preprocess_and_get_text_and_tokens(
+                text_list=text_list[start:start + chunk_size], verbose=0)
+            yield chunk_text_list, chunk_tokens_list, [start + i for i in indices]
+        return
+
+    is_owned = executor is None
+    if is_owned:
+        executor = get_preprocessing_executor(pipeline=pipeline, worker_count=worker_count)
+    try:
+        in_flight = deque()
+        for start in starts:
+            in_flight.append((start, executor.submit(preprocess_chunk, text_list[start:start + chunk_size])))
+            if len(in_flight) >= 2 * worker_count:
+                start, future = in_flight.popleft()
+                (chunk_text_list, chunk_tokens_list, indices), token_cache_entries = future.result()
+                update_token_caches(pipeline, token_cache_entries)
+                yield chunk_text_list, chunk_tokens_list, [start + i for i in indices]
+        while len(in_flight) > 0:
+            start, future = in_flight.popleft()
+            (chunk_text_list, chunk_tokens_list, indices), token_cache_entries = future.result()
+            update_token_caches(pipeline, token_cache_entries)
+            yield chunk_text_list, chunk_tokens_list, [start + i for i in indices]
+    finally:
+        if is_owned:
+            executor.shutdown()
+
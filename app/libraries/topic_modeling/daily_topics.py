@@ -0,0 +1,207 @@
+import os
+from typing import List, Any, Dict, Tuple
+import numpy
+from fame.topic_modeling.cortex.pipeline.bert_lda import TransformerLDATopicModelingPipeline
+
+from app import cache_folderpath
+from app.libraries.io.read_write import read_pkl_gz, write_versioned_arrays, read_versioned_arrays, file_lock
+from app.libraries.randomization.hashing import dict_hash
+from app.libraries.trajectory.partitions import get_partition_piece_filepath, get_bucket_indices_for_days
+from app.libraries.topic_modeling.inference import get_partition_daily_topic_sums_key, infer_partition_daily_topic_sums
+from app.libraries.utilities.logging import get_logger
+logger = get_logger(__name__)
+
+daily_topics_folderpath = os.path.join(cache_folderpath, 'trends', 'daily')
+
+
+def get_daily_topics_folderpath(exp_id: str) -> str:
+    return os.path.join(daily_topics_folderpath, exp_id)
+
+
+def read_daily_topics(exp_id: str) -> Dict[str, Any]:
+    """
+    Parameters
+    ----------
+    exp_id: `str`, required
+        The identifier of the fitted topic model.
+
+    Returns
+    -------
+    `Dict[str, Any]`: The per-day topic table of the model, with the `partitions` it covers and its memory-mapped
+    `row_partitions`, `row_days`, `row_topic_sums` and `row_counts`, or `None` if it has not been built.
+    """
+    folderpath = get_daily_topics_folderpath(exp_id)
+    if not os.path.exists(os.path.join(folderpath, 'meta.pkl.gz')):
+        return None
+    try:
+        return read_versioned_arrays(folderpath)
+    except Exception as e:
+        logger.error(f"failed to load the daily topics located in {folderpath} - error: {e}")
+        return None
+
+
+def is_covered_by_daily_topics(exp_id: str, partitions: List[Tuple[str, str, str]]) -> bool:
+    """
+    Parameters
+    ----------
+    exp_id: `str`, required
+        The identifier of the fitted topic model.
+
+    partitions: `List[Tuple[str, str, str]]`, required
+        The `(handle, month, fingerprint)` of the partitions of a query trajectory.
+
+    Returns
+    -------
+    `bool`: Whether the topic sums of all the given partitions are in the per-day topic table of the model.
+    """
+    daily_topics = read_daily_topics(exp_id)
+    if daily_topics is None:
+        return False
+    covered = set([tuple(e) for e in daily_topics['partitions']])
+    return all([tuple(e) in covered for e in partitions])
+
+
+def update_daily_topics(
+        pipeline: TransformerLDATopicModelingPipeline,
+        preprocessing_hash: str,
+        exp_id: str,
+        partitions: List[Tuple[str, str, str]]
+) -> Dict[str, Any]:
+    """
+    Adding the per-day topic sums of the given partitions to the per-day topic table of the model, inferring the
+    topics of the partitions that have not been seen by the model yet. The rows of the stale partitions (whose
+    `(handle, month)` has a new fingerprint) are replaced.
+
+    Parameters
+    ----------
+    pipeline: `TransformerLDATopicModelingPipeline`, required
+        The fitted pipeline.
+
+    preprocessing_hash: `str`, required
+        The fingerprint of the processors of the pipeline.
+
+    exp_id: `str`, required
+        The identifier of the fitted topic model.
+
+    partitions: `List[Tuple[str, str, str]]`, required
+        The `(handle, month, fingerprint)` of the tweet store partitions.
+
+    Returns
+    -------
+    `Dict[str, Any]`: The updated table, see :func:`read_daily_topics`.
+    """
+    daily_topics = read_daily_topics(exp_id)
+    old_partitions = [] if daily_topics is None else [tuple(e) for e in daily_topics['partitions']]
+    missing = sorted(set([tuple(e) for e in partitions]) - set(old_partitions))
+    if len(missing) == 0:
+        return daily_topics
+
+    infer_partition_daily_topic_sums(
+        pipeline=pipeline,
+        preprocessing_hash=preprocessing_hash,
+        exp_id=exp_id,
+        partitions=missing)
+
+    # - the table is re-read under the lock, so that the rows added by a concurrent update are not lost
+    with file_lock(get_daily_topics_folderpath(exp_id)):
+        daily_topics = read_daily_topics(exp_id)
+        old_partitions = [] if daily_topics is None else [tuple(e) for e in daily_topics['partitions']]
+        missing = sorted(set([tuple(e) for e in partitions]) - set(old_partitions))
+        if len(missing) == 0:
+            return daily_topics
+        # - only the partitions that the concurrent update made stale are left to infer, if any
+        infer_partition_daily_topic_sums(
+            pipeline=pipeline,
+            preprocessing_hash=preprocessing_hash,
+            exp_id=exp_id,
+            partitions=missing)
+
+        # - the partitions whose piece cannot be read are left out of the table, to be inferred by the next update
+        pieces = dict()
+        for partition in missing:
+            piece_filepath = get_partition_piece_filepath(
+                namespace='trends', key=get_partition_daily_topic_sums_key(preprocessing_hash, exp_id, partition))
+            try:
+                pieces[partition] = read_pkl_gz(piece_filepath)
+            except Exception as e:
+                logger.error(f"failed to load the daily topic sums of {partition} located in {piece_filepath}, "
+                             f"skipping it...\n\terror: {e}")
+        added = [e for e in missing if e in pieces]
+
+        # - keeping the rows of the partitions that are not replaced by a newer fingerprint
+        replaced = set([e[:2] for e in added])
+        kept = [i for i, e in enumerate(old_partitions) if e[:2] not in replaced]
+        new_partitions = [old_partitions[i] for i in kept] + added
+        row_partitions, row_days, row_topic_sums, row_counts = [], [], [], []
+        if daily_topics is not None:
+            partition_map = numpy.full(len(old_partitions), -1, dtype=numpy.int64)
+            partition_map[kept] = numpy.arange(len(kept))
+            keep = partition_map[numpy.asarray(daily_topics['row_partitions'])] >= 0
+            row_partitions.append(partition_map[numpy.asarray(daily_topics['row_partitions'])[keep]])
+            row_days.append(numpy.asarray(daily_topics['row_days'])[keep])
+            row_topic_sums.append(numpy.asarray(daily_topics['row_topic_sums'])[keep])
+            row_counts.append(numpy.asarray(daily_topics['row_counts'])[keep])
+
+        for i, partition in enumerate(added):
+            piece = pieces[partition]
+            if len(piece) == 0:
+                continue
+            days = sorted(piece.keys())
+            row_partitions.append(numpy.full(len(days), len(kept) + i, dtype=numpy.int64))
+            row_days.append(numpy.array(days, dtype='datetime64[D]'))
+            row_topic_sums.append(numpy.stack([piece[e][0] for e in days]))
+            row_counts.append(numpy.array([piece[e][1] for e in days], dtype=numpy.int64))
+
+        topic_count = pipeline.lda_model.num_topics
+        write_versioned_arrays(
+            folderpath=get_daily_topics_folderpath(exp_id),
+            meta=dict(
+                version=dict_hash(dict(exp_id=exp_id, partitions=[list(e) for e in new_partitions])),
+                partitions=new_partitions),
+            arrays=dict(
+                row_partitions=numpy.concatenate(row_partitions + [numpy.array([], dtype=numpy.int64)]).astype(numpy.int32),
+                row_days=numpy.concatenate(row_days + [numpy.array([], dtype='datetime64[D]')]),
+                row_topic_sums=numpy.concatenate(row_topic_sums + [numpy.zeros((0, topic_count))]),
+                row_counts=numpy.concatenate(row_counts + [numpy.array([], dtype=numpy.int64)])))
+        return read_daily_topics(exp_id)
+
+
+def get_daily_topics_trajectory(
+        daily_topics: Dict[str, Any],
+        trajectory: Dict[str, Any],
+        partitions: List[Tuple[str, str, str]],
+        bucket_count: int
+) -> Tuple[numpy.ndarray, numpy.ndarray]:
+    """
+    Parameters
+    ----------
+    daily_topics: `Dict[str, Any]`, required
+        The per-day topic table of the model, see :func:`read_daily_topics`.
+
+    trajectory: `Dict[str, Any]`, required
+        The query trajectory.
+
+    partitions: `List[Tuple[str, str, str]]`, required
+        The `(handle, month, fingerprint)` of the partitions of the trajectory.
+
+    bucket_count: `int`, required
+        The number of timespans of the trajectory.
+
+    Returns
+    -------
+    `Tuple[numpy.ndarray, numpy.ndarray]`: The `(bucket count, topic count)` sums of the topic distributions of the
+    tweets of every timespan, and their tweet counts, regrouped from the daily rows of the given partitions.
+    """
+    partition_index = {tuple(e): i for i, e in enumerate(daily_topics['partitions'])}
+    partition_mask = numpy.zeros(len(partition_index), dtype=bool)
+    partition_mask[[partition_index[tuple(e)] for e in partitions if tuple(e) in partition_index]] = True
+
+    row_topic_sums = numpy.asarray(daily_topics['row_topic_sums'])
+    keep = numpy.flatnonzero(partition_mask[numpy.asarray(daily_topics['row_partitions'])])
+    buckets = get_bucket_indices_for_days(days=numpy.asarray(daily_topics['row_days'])[keep], trajectory=trajectory)
+    keep, buckets = keep[buckets >= 0], buckets[buckets >= 0]
+
+    topic_sums = numpy.zeros((bucket_count, row_topic_sums.shape[1]))
+    numpy.add.at(topic_sums, buckets, row_topic_sums[keep])
+    tweet_counts = numpy.bincount(buckets, weights=numpy.asarray(daily_topics['row_counts'])[keep], minlength=bucket_count)
+    return topic_sums, tweet_counts
@@ -0,0 +1,209 @@
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Any, Dict, Tuple, Iterator
+import numpy
+from tqdm import tqdm
+from fame.topic_modeling.cortex.pipeline.bert_lda import TransformerLDATopicModelingPipeline
+
+from app import topic_inference_worker_count, topic_inference_batch_size
+from app.libraries.trajectory.partitions import get_partition_piece, get_partition_piece_filepath, \
+    get_preprocessed_partition, preprocess_partitions, get_days
+from app.libraries.topic_modeling.model_registry import is_topic_model_saved, load_topic_model, migrate_topic_model
+from app.libraries.utilities.logging import get_logger
+logger = get_logger(__name__)
+
+# - the segment key of a tweet in an inference round is `partition index * day_key_stride + day_key_offset + day`,
+# where the day is counted from the epoch
+day_key_stride = 1 << 20
+day_key_offset = 1 << 19
+
+# - the fitted pipeline of an inference worker process, see :func:`iterate_lda_representations`
+worker_pipeline = None
+
+
+def set_worker_pipeline(pipeline: TransformerLDATopicModelingPipeline) -> None:
+    global worker_pipeline
+    worker_pipeline = pipeline
+
+
+def set_worker_topic_model(exp_id: str) -> None:
+    global worker_pipeline
+    worker_pipeline = load_topic_model(exp_id)
+
+
+def get_lda_representations(tokens_list: List[List[str]]) -> numpy.ndarray:
+    return numpy.asarray(worker_pipeline.get_lda_representations(tokens_list))
+
+
+def get_partition_daily_topic_sums_key(
+        preprocessing_hash: str,
+        exp_id: str,
+        partition: Tuple[str, str, str]
+) -> Dict[str, Any]:
+    return dict(partition=list(partition), preprocessing=preprocessing_hash, model=exp_id)
+
+
+def get_segment_sums(
+        representations: numpy.ndarray,
+        keys: numpy.ndarray
+) -> Tuple[numpy.ndarray, numpy.ndarray, numpy.ndarray]:
+    """
+    Parameters
+    ----------
+    representations: `numpy.ndarray`, required
+        The `(tweet count, topic count)` topic distributions of the tweets.
+
+    keys: `numpy.ndarray`, required
+        The segment (e.g. day) of every tweet.
+
+    Returns
+    -------
+    `Tuple[numpy.ndarray, numpy.ndarray, numpy.ndarray]`: The sorted distinct keys, the sum of the topic distributions
+    of the tweets of each key, and their count, reduced in one pass over the tweets sorted by key.
+    """
+    order = numpy.argsort(keys, kind='stable')
+    keys = keys[order]
+    if len(keys) == 0:
+        return keys, numpy.zeros((0,) + representations.shape[1:]), numpy.zeros(0, dtype=numpy.int64)
+    starts = numpy.flatnonzero(numpy.r_[True, keys[1:] != keys[:-1]])
+    sums = numpy.add.reduceat(representations[order], starts, axis=0)
+    counts = numpy.diff(numpy.r_[starts, len(keys)])
+    return keys[starts], sums, counts
+
+
+def iterate_lda_representations(
+        pipeline: TransformerLDATopicModelingPipeline,
+        tokens_list: List[List[str]],
+        executor: ProcessPoolExecutor = None,
+        worker_count: int = 1,
+        batch_size: int = None
+) -> Iterator[numpy.ndarray]:
+    """
+    Parameters
+    ----------
+    pipeline: `TransformerLDATopicModelingPipeline`, required
+        The fitted pipeline.
+
+    tokens_list: `List[List[str]]`, required
+        The tokens of the tweets.
+
+    executor: `ProcessPoolExecutor`, optional (default=None)
+        The pool of the workers set up with :func:`set_worker_pipeline` or :func:`set_worker_topic_model`, or `None`
+        to run in-process.
+
+    worker_count: `int`, optional (default=1)
+        The number of workers of the pool, two batches per worker being kept in flight.
+
+    batch_size: `int`, optional (default=None)
+        The number of tweets per inference call, `TOPIC_INFERENCE_BATCH_SIZE` if `None`.
+
+    Returns
+    -------
+    `Iterator[numpy.ndarray]`: The topic distributions of the tweets, batch by batch in the input order.
+    """
+    batch_size = topic_inference_batch_size if batch_size is None else batch_size
+    starts = list(range(0, len(tokens_list), batch_size))
+    if executor is None:
+        for start in starts:
+            yield numpy.asarray(pipeline.get_lda_representations(tokens_list[start:start + batch_size]))
+        return
+
+    in_flight = deque()
+    for start in starts:
+        in_flight.append(executor.submit(get_lda_representations, tokens_list[start:start + batch_size]))
+        if len(in_flight) >= 2 * worker_count:
+            yield in_flight.popleft().result()
+    while len(in_flight) > 0:
+        yield in_flight.popleft().result()
+
+
+def infer_partition_daily_topic_sums(
+        pipeline: TransformerLDATopicModelingPipeline,
+        preprocessing_hash: str,
+        exp_id: str,
+        partitions: List[Tuple[str, str, str]],
+        worker_count: int = None,
+        batch_size: int = None
+) -> None:
+    """
+    Computing the per-day topic sums of the partitions that are not cached yet, i.e. the sum of the topic
+    distributions of the tweets of every partition per day and their count, which do not depend on the query range or
+    time-step. Rather than one inference call per partition, the tweets of many partitions are run through the topic
+    model in large batches across a process pool, and the sums of every `(partition, day)` are then reduced from the
+    batch results with a single segment-sum.
+
+    Parameters
+    ----------
+    pipeline: `TransformerLDATopicModelingPipeline`, required
+        The fitted pipeline.
+
+    preprocessing_hash: `str`, required
+        The fingerprint of the processors of the pipeline.
+
+    exp_id: `str`, required
+        The identifier of the fitted topic model.
+
+    partitions: `List[Tuple[str, str, str]]`, required
+        The `(handle, month, fingerprint)` of the tweet store partitions.
+
+    worker_count: `int`, optional (default=None)
+        The number of worker processes, `TOPIC_INFERENCE_WORKER_COUNT` if `None`.
+
+    batch_size: `int`, optional (default=None)
+        The number of tweets per inference call, `TOPIC_INFERENCE_BATCH_SIZE` if `None`.
+    """
+    worker_count = topic_inference_worker_count if worker_count is None else worker_count
+    batch_size = topic_inference_batch_size if batch_size is None else batch_size
+    missing = [
+        e for e in partitions
+        if not os.path.exists(get_partition_piece_filepath(
+            namespace='trends', key=get_partition_daily_topic_sums_key(preprocessing_hash, exp_id, e)))]
+    if len(missing) == 0:
+        return
+    preprocess_partitions(pipeline=pipeline, preprocessing_hash=preprocessing_hash, partitions=missing)
+
+    # - the workers memory-map the model from the registry rather than each receiving a pickled copy of the pipeline
+    if is_topic_model_saved(exp_id):
+        migrate_topic_model(exp_id)
+        initializer, initargs = set_worker_topic_model, (exp_id,)
+    else:
+        initializer, initargs = set_worker_pipeline, (pipeline,)
+    executor = ProcessPoolExecutor(
+        max_workers=worker_count, initializer=initializer, initargs=initargs) if worker_count > 1 else None
+    try:
+        # - the partitions are inferred in rounds of about a batch per worker, bounding the memory of a round
+        round_size = batch_size * max(worker_count, 1)
+        round_partitions, round_tokens_list, round_keys = [], [], []
+        for i, partition in enumerate(tqdm(missing)):
+            corpus = get_preprocessed_partition(pipeline=pipeline, preprocessing_hash=preprocessing_hash, partition=partition)
+            round_partitions.append(partition)
+            round_tokens_list += corpus.get_tokens_list()
+            # - the segment of a tweet is its (partition within the round, day)
+            round_keys.append(
+                (len(round_partitions) - 1) * day_key_stride + day_key_offset + get_days(corpus.dates).astype(numpy.int64))
+            if len(round_tokens_list) < round_size and i < len(missing) - 1:
+                continue
+
+            representations = list(iterate_lda_representations(
+                pipeline=pipeline,
+                tokens_list=round_tokens_list,
+                executor=executor,
+                worker_count=worker_count,
+                batch_size=batch_size))
+            keys, sums, counts = get_segment_sums(
+                representations=numpy.concatenate(representations) if len(representations) > 0 else numpy.zeros((0, 0)),
+                keys=numpy.concatenate(round_keys))
+            pieces = [dict() for _ in round_partitions]
+            for key, topic_sums, count in zip(keys.tolist(), sums, counts.tolist()):
+                pieces[key // day_key_stride][numpy.datetime64(key % day_key_stride - day_key_offset, 'D')] = \
+                    (topic_sums, int(count))
+            for round_partition, piece in zip(round_partitions, pieces):
+                get_partition_piece(
+                    namespace='trends',
+                    key=get_partition_daily_topic_sums_key(preprocessing_hash, exp_id, round_partition),
+                    compute=lambda: piece)
+            round_partitions, round_tokens_list, round_keys = [], [], []
+    finally:
+        if executor is not None:
+            executor.shutdown()
@@ -0,0 +1,143 @@
+import os
+import gzip
+import pickle
+import shutil
+import threading
+from collections import OrderedDict
+from gensim.models import LdaModel
+from gensim.corpora import Dictionary
+from fame.topic_modeling.cortex.pipeline.bert_lda import TransformerLDATopicModelingPipeline
+
+from app import cache_folderpath, topic_model_cache_size
+from app.libraries.io.read_write import write_pkl_gz, read_pkl_gz, file_lock
+from app.libraries.preprocessing.utilities import get_pipeline
+from app.libraries.utilities.logging import get_logger
+logger = get_logger(__name__)
+
+topic_models_folderpath = os.path.join(cache_folderpath, 'topic_model')
+
+# - the process-wide LRU of the loaded models, see :func:`load_topic_model`
+topic_models = OrderedDict()
+topic_models_lock = threading.Lock()
+
+
+def get_topic_model_folderpath(exp_id: str) -> str:
+    return os.path.join(topic_models_folderpath, exp_id)
+
+
+def get_legacy_checkpoint_filepath(exp_id: str) -> str:
+    return os.path.join(topic_models_folderpath, f"{exp_id}_ckpt.pkl.gz")
+
+
+def is_topic_model_saved(exp_id: str) -> bool:
+    """
+    Parameters
+    ----------
+    exp_id: `str`, required
+        The identifier of the fitted topic model.
+
+    Returns
+    -------
+    `bool`: Whether the model is in the registry, or in a (legacy) pickled checkpoint that is moved to the registry
+    by :func:`migrate_topic_model`.
+    """
+    return os.path.exists(os.path.join(get_topic_model_folderpath(exp_id), 'meta.pkl.gz')) or \
+        os.path.exists(get_legacy_checkpoint_filepath(exp_id))
+
+
+def save_topic_model(exp_id: str, pipeline: TransformerLDATopicModelingPipeline) -> None:
+    """
+    Saving the LDA model and the dictionary of a fitted pipeline in their native gensim formats, with every array
+    of the model stored as a separate `.npy` file so that it can be memory-mapped. The training corpus and the
+    processors are not saved, the processors being re-created by
+    :func:`app.libraries.preprocessing.utilities.get_pipeline`.
+
+    Parameters
+    ----------
+    exp_id: `str`, required
+        The identifier of the fitted topic model.
+
+    pipeline: `TransformerLDATopicModelingPipeline`, required
+        The fitted pipeline.
+    """
+    folderpath = get_topic_model_folderpath(exp_id)
+    # - the model is written to a folder of its own and swapped in, the live folder being removed only once replaced
+    tmp_folderpath = f"{folderpath}.tmp.{os.getpid()}"
+    old_folderpath = f"{folderpath}.old.{os.getpid()}"
+    shutil.rmtree(tmp_folderpath, ignore_errors=True)
+    os.makedirs(tmp_folderpath)
+    pipeline.lda_model.save(os.path.join(tmp_folderpath, 'lda_model'), sep_limit=0)
+    pipeline.vocabulary.save(os.path.join(tmp_folderpath, 'dictionary'))
+    # - the meta is written last, marking the model as complete
+    write_pkl_gz(
+        dict(exp_id=exp_id, number_of_topics_for_lda=pipeline.lda_model.num_topics),
+        os.path.join(tmp_folderpath, 'meta.pkl.gz'))
+    with file_lock(folderpath):
+        if os.path.exists(folderpath):
+            os.rename(folderpath, old_folderpath)
+        os.rename(tmp_folderpath, folderpath)
+    shutil.rmtree(old_folderpath, ignore_errors=True)
+
+
+def migrate_topic_model(exp_id: str) -> None:
+    """
+    Moving a (legacy) pickled checkpoint into the registry, if the model is not in the registry yet. It is meant to
+    be called by the parent process before the models are loaded, e.g. by the workers of a pool, which only load.
+
+    Parameters
+    ----------
+    exp_id: `str`, required
+        The identifier of the fitted topic model.
+    """
+    meta_filepath = os.path.join(get_topic_model_folderpath(exp_id), 'meta.pkl.gz')
+    checkpoint_filepath = get_legacy_checkpoint_filepath(exp_id)
+    if os.path.exists(meta_filepath) or not os.path.exists(checkpoint_filepath):
+        return
+    # - the checkpoint is unpickled by one process at a time, the others finding the model in the registry
+    with file_lock(checkpoint_filepath):
+        if os.path.exists(meta_filepath):
+            return
+        logger.info(f"moving the checkpoint of the topic model {exp_id} into the registry...")
+        with gzip.open(checkpoint_filepath, 'rb') as handle:
+            save_topic_model(exp_id=exp_id, pipeline=pickle.load(handle))
+
+
+def read_topic_model(exp_id: str) -> TransformerLDATopicModelingPipeline:
+    folderpath = get_topic_model_folderpath(exp_id)
+    meta = read_pkl_gz(os.path.join(folderpath, 'meta.pkl.gz'))
+    pipeline = get_pipeline(number_of_topics_for_lda=meta['number_of_topics_for_lda'], heavy_token_processing=True)
+    pipeline.lda_model = LdaModel.load(os.path.join(folderpath, 'lda_model'), mmap='r')
+    pipeline.vocabulary = Dictionary.load(os.path.join(folderpath, 'dictionary'))
+    return pipeline
+
+
+def load_topic_model(exp_id: str, cache_size: int = None) -> TransformerLDATopicModelingPipeline:
+    """
+    Parameters
+    ----------
+    exp_id: `str`, required
+        The identifier of the fitted topic model.
+
+    cache_size: `int`, optional (default=None)
+        The number of models kept loaded in the process, `TOPIC_MODEL_CACHE_SIZE` if `None`.
+
+    Returns
+    -------
+    `TransformerLDATopicModelingPipeline`: A pipeline with the LDA model and the dictionary of the fitted model,
+    which is only meant for inference. The arrays of the model are memory-mapped read-only, so the processes loading
+    the same model share them through the page cache. A (legacy) checkpoint is not loaded, see
+    :func:`migrate_topic_model`.
+    """
+    cache_size = topic_model_cache_size if cache_size is None else cache_size
+    with topic_models_lock:
+        if exp_id in topic_models:
+            topic_models.move_to_end(exp_id)
+            return topic_models[exp_id]
+
+    pipeline = read_topic_model(exp_id)
+    with topic_models_lock:
+        topic_models[exp_id] = pipeline
+        topic_models.move_to_end(exp_id)
+        while len(topic_models) > max(cache_size, 0):
+            topic_models.popitem(last=False)
+    return pipeline
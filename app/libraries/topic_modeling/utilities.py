@@ -1,30 +1,38 @@
-from typing import List, Any
+from typing import List, Any, Dict, Tuple
 import os
 import pickle
 import gzip
 import numpy
 from tqdm import tqdm
 import pyLDAvis
-import torch
+import pyLDAvis.gensim_models
 import dateutil.parser as date_parser
 from datetime import date, datetime
 from dateutil.relativedelta import relativedelta
 import pandas
 import plotly_express as px
-from fame.text_processing.text_processor import TextProcessor
-from fame.text_processing.token_processor import TokenProcessor
 from fame.topic_modeling.cortex.pipeline.bert_lda import TransformerLDATopicModelingPipeline
 
 from app.libraries.io.tweet_filepaths import get_tweet_filepaths
 from app.libraries.randomization.hashing import dict_hash
-from app.libraries.trajectory.utilities import prepare_trajectory_dataset
+from app.libraries.preprocessing.utilities import get_pipeline, get_pipeline_args_to_hash, get_preprocessing_hash
+from app.libraries.trajectory.utilities import get_timespan_partition_for_trajectory, get_trajectory_hash, \
+    get_trajectory_partitions, get_partitions_version
+from app.libraries.preprocessing.corpus import TokenCorpus, is_token_corpus_written
+from app.libraries.utilities.plotly import write_figure_payload
+from app.libraries.topic_modeling.model_registry import is_topic_model_saved, load_topic_model, save_topic_model, \
+    migrate_topic_model
+from app.libraries.topic_modeling.daily_topics import update_daily_topics, get_daily_topics_trajectory, \
+    is_covered_by_daily_topics, read_daily_topics
+from app.libraries.trajectory.partitions import get_preprocessed_partition, get_bucket_indices, \
+    preprocess_partitions
 
 from app import cache_folderpath
 from app.libraries.utilities.logging import get_logger
 logger = get_logger(__name__)
 
 
-def is_request_processed(
+def get_request_cache(
         support_institutions: List[str],
         query_institutions: List[str],
         topic_counts: int,
@@ -32,8 +40,9 @@ def is_request_processed(
         support_max_date: str,
         query_step_in_days: int,
         query_min_date: str,
-        query_max_date: str
-) -> bool:
+        query_max_date: str,
+        ingest: bool = True
+) -> Dict[str, Any]:
     """
     Parameters
     ----------
@@ -61,11 +70,15 @@ def is_request_processed(
     query_max_date: `str`, required
         The maximum date to query.
 
+    ingest: `bool`, optional (default=True)
+        Whether to ingest the handles whose tweet files are not in the tweet store yet, see
+        :func:`app.libraries.trajectory.utilities.get_trajectory_partitions`.
+
     Returns
     -------
-    The topic modeling data.
+    `Dict[str, Any]`: The `trajectories`, `partitions`, `trajectory_hashes` and `exp_id` of the request along with the
+    paths of its cached results, or `None` if `ingest` is `False` and some of the handles are not ingested yet.
     """
-    logger.info("1) getting filepaths...")
     tweet_filepaths = get_tweet_filepaths()
     trajectories = dict(
         support=dict(
@@ -77,153 +90,200 @@ def is_request_processed(
             institution_type=query_institutions,
             dates=(query_min_date, query_max_date, dict(years=0, months=0, days=query_step_in_days))))
 
+    partitions = dict(
+        support=get_trajectory_partitions(trajectory=trajectories['support'], tweet_filepaths=tweet_filepaths, ingest=ingest),
+        query=get_trajectory_partitions(trajectory=trajectories['query'], tweet_filepaths=tweet_filepaths, ingest=ingest))
+    if partitions['support'] is None or partitions['query'] is None:
+        return None
+
     trajectory_hashes = dict(
-        support=dict_hash(dict(
-            tweet_filepaths=tweet_filepaths,
-            trajectory=trajectories['support'],
-        )),
-        query=dict_hash(dict(
-            tweet_filepaths=tweet_filepaths,
-            trajectory=trajectories['query'],
-        )))
-
-    # - preparing the topic models based on support
-    pipeline_args = dict(
-        number_of_topics_for_lda=topic_counts,
-                         autoencoder=None,
-        representation_clustering=None,
-        use_transformer=False,
-        use_lda=True,
-        use_tfidf=False,
-        device=torch.device('cpu'),
-        transformer_modelname='paraphrase-mpnet-base-v2',
-        text_processor=TextProcessor(
-         methods=[
-             'remove_url',
-             'convert_to_lowercase',
-             'uppercase_based_missing_delimiter_fix',
-             # 'gtlt_normalize',
-             # 'substitute_more_than_two_letter_repetition_with_one',
-             'non_character_repetition_elimination',
-             # 'use_star_as_delimiter',
-             # 'remove_parantheses_and_their_contents',
-             'remove_questionexlamation_in_brackets',
-             'eliminate_phrase_repetition',
-             'strip'
-         ]
-        ),
-        token_processor_light=TokenProcessor(
-         methods=[
-             'keep_alphabetics_only',
-             # 'keep_nouns_only',
-             # 'spell_check_and_typo_fix',
-             # 'stem_words',
-             # 'remove_stopwords'
-         ]
-        ),
-        token_processor_heavy=TokenProcessor(
-         methods=[
-             'keep_alphabetics_only',
-             # 'keep_nouns_only',
-             'spell_check_and_typo_fix',
-             'stem_words',
-             'remove_stopwords'
-         ]
-    ))
-
-    pipeline_args_to_hash = dict(
-        number_of_topics_for_lda=topic_counts,
-        autoencoder=None,
-        representation_clustering=None,
-        use_transformer=False,
-        use_lda=True,
-        use_tfidf=False,
-        device='cpu',
-        transformer_modelname='paraphrase-mpnet-base-v2',
-        text_processor=dict(
-         methods=[
-             'remove_url',
-             'convert_to_lowercase',
-             'uppercase_based_missing_delimiter_fix',
-             # 'gtlt_normalize',
-             # 'substitute_more_than_two_letter_repetition_with_one',
-             'non_character_repetition_elimination',
-             # 'use_star_as_delimiter',
-             # 'remove_parantheses_and_their_contents',
-             'remove_questionexlamation_in_brackets',
-             'eliminate_phrase_repetition',
-             'strip'
-         ]
-        ),
-        token_processor_light=dict(
-         methods=[
-             'keep_alphabetics_only',
-             # 'keep_nouns_only',
-             # 'spell_check_and_typo_fix',
-             # 'stem_words',
-             # 'remove_stopwords'
-         ]
-        ),
-        token_processor_heavy=dict(
-         methods=[
-             'keep_alphabetics_only',
-             # 'keep_nouns_only',
-             'spell_check_and_typo_fix',
-             'stem_words',
-             'remove_stopwords'
-         ]
-    ))
-
-    pipeline_hash = dict_hash(pipeline_args_to_hash)
+        support=get_trajectory_hash(trajectories['support'], get_partitions_version(partitions['support'])),
+        query=get_trajectory_hash(trajectories['query'], get_partitions_version(partitions['query'])))
+
+    # - the topic models are based on the support
+    pipeline_hash = dict_hash(get_pipeline_args_to_hash(number_of_topics_for_lda=topic_counts, heavy_token_processing=True))
     exp_id = f"{pipeline_hash}_{trajectory_hashes['support']}"
-    pipeline_filepath = os.path.join(cache_folderpath, 'topic_model', f"{exp_id}_ckpt.pkl.gz")
-    pipeline_vis_filepath = os.path.join(cache_folderpath, 'lda_visualization', f'{exp_id}.pkl.gz')
+    return dict(
+        trajectories=trajectories,
+        partitions=partitions,
+        trajectory_hashes=trajectory_hashes,
+        exp_id=exp_id,
+        pipeline_vis_filepath=os.path.join(cache_folderpath, 'lda_visualization', f'{exp_id}.pkl.gz'),
+        pipeline_vis_html_filepath=os.path.join(cache_folderpath, 'lda_visualization', f'{exp_id}.html.gz'),
+        support_corpus_folderpath=os.path.join(
+            cache_folderpath, 'text_and_token', f"{trajectory_hashes['support']}-token_corpus"),
+        trajectory_trends_filepath=os.path.join(
+            cache_folderpath, 'trends', f"{trajectory_hashes['query']}_{exp_id}-trends.pkl.gz"),
+        trends_figure_filepath=os.path.join(
+            cache_folderpath, 'trends', f"{trajectory_hashes['query']}_{exp_id}-trends.json.gz"))
+
+
+def get_daily_topics_trends(
+        daily_topics: Dict[str, Any],
+        trajectory: Dict[str, Any],
+        partitions: List[Tuple[str, str, str]],
+        trajectory_trends_filepath: str
+) -> Tuple[pandas.DataFrame, numpy.ndarray]:
+    """
+    Parameters
+    ----------
+    daily_topics: `Dict[str, Any]`, required
+        The per-day topic table of the model, see :func:`app.libraries.topic_modeling.daily_topics.read_daily_topics`.
 
-    logger.info("2) preparing support trajectory dataset...")
+    trajectory: `Dict[str, Any]`, required
+        The query trajectory.
 
-    meta = dict(
-        tweet_filepaths=tweet_filepaths,
-        trajectory=trajectories['support']
-    )
-    # - reading from cache if needed
-    final_filename = os.path.join(cache_folderpath, 'trajectory', dict_hash(meta) + '.pkl.gz')
-    if not os.path.exists(final_filename):
-        return False
+    partitions: `List[Tuple[str, str, str]]`, required
+        The `(handle, month, fingerprint)` of the partitions of the query trajectory.
 
-    meta = dict(
-        tweet_filepaths=tweet_filepaths,
-        trajectory=trajectories['query']
-    )
-    # - reading from cache if needed
-    final_filename = os.path.join(cache_folderpath, 'trajectory', dict_hash(meta) + '.pkl.gz')
-    if not os.path.exists(final_filename):
-        return False
+    trajectory_trends_filepath: `str`, required
+        The path where the trends are stored.
 
-    pipeline = TransformerLDATopicModelingPipeline(
-        **pipeline_args
-    )
-    preprocessed_text_and_tokens_filepath = os.path.join(
-        cache_folderpath,
-        'text_and_token',
-        f"{trajectory_hashes['support']}-preprocessed_text_and_tokens.pkl.gz"
-    )
+    Returns
+    -------
+    `Tuple[pandas.DataFrame, numpy.ndarray]`: The topic probabilities of every timespan of the trajectory, as a
+    dataframe for plotting and as a `(bucket count, topic count)` array.
+    """
+    topic_sums, tweet_counts = get_daily_topics_trajectory(
+        daily_topics=daily_topics,
+        trajectory=trajectory,
+        partitions=partitions,
+        bucket_count=len(get_timespan_partition_for_trajectory(trajectory)))
+
+    # - the timespans without any tweets are left as `nan`
+    with numpy.errstate(invalid='ignore', divide='ignore'):
+        topic_probabilities = topic_sums / tweet_counts[:, None]
+    df_dict = {f't{i}': topic_probabilities[:, i - 1] for i in range(1, 1 + topic_probabilities.shape[1])}
+    df_dict['x'] = [
+        date_parser.parse(trajectory['dates'][0]).date() + e * relativedelta(**trajectory['dates'][2]) for e
+        in range(topic_probabilities.shape[0])]
+
+    df = pandas.DataFrame(df_dict)
+    with gzip.open(trajectory_trends_filepath, 'wb') as handle:
+        pickle.dump((df, topic_probabilities), handle)
+    return df, topic_probabilities
+
+
+def plot_and_store_topic_trajectories(
+        df: pandas.DataFrame,
+        topic_probabilities: numpy.ndarray,
+        figure_filepath: str
+) -> Any:
+    fig = px.line(df, x='x', y=[f't{i}' for i in range(1, 1+topic_probabilities.shape[1])], markers=True,
+                  template='plotly_white')
+    fig.update_layout(title="Topic trajectories through time", xaxis_title="Date", yaxis_title="Topic Probability",)
+    write_figure_payload(fig=fig, filepath=figure_filepath)
+    return fig
 
-    logger.info("3) preparing support trajectory data (processing)...")
-    if not os.path.exists(preprocessed_text_and_tokens_filepath):
-        return False
 
-    logger.info("4) fitting support topic model...")
-    if not os.path.exists(pipeline_filepath):
-        return False
+def get_processed_request_cache(
+        support_institutions: List[str],
+        query_institutions: List[str],
+        topic_counts: int,
+        support_min_date: str,
+        support_max_date: str,
+        query_step_in_days: int,
+        query_min_date: str,
+        query_max_date: str
+) -> Dict[str, Any]:
+    """
+    Parameters
+    ----------
+    support_institutions: `List[str]`, required
+        The institutions for building the support set.
 
-    logger.info("6) preparing query trajectory  trends...")
+    query_institutions: `List[str]`, required
+        The institutions for building the query set.
 
-    trajectory_trends_filepath = os.path.join(cache_folderpath, 'trends', f"{trajectory_hashes['query']}_{exp_id}-trends.pkl.gz")
+    topic_counts: `int`, required
+        The number of topics to use.
+
+    support_min_date: `str`, required
+        The minimum date to use for the support set.
+
+    support_max_date: `str`, required
+        The maximum date to use for the support set.
+
+    query_step_in_days: `int`, required
+        The length of the time-step in days.
+
+    query_min_date: `str`, required
+        The minimum date to query.
+
+    query_max_date: `str`, required
+        The maximum date to query.
+
+    Returns
+    -------
+    `Dict[str, Any]`: The cache of the request, see :func:`get_request_cache`, or `None` if the request has not been
+    processed yet. The trajectories figure is plotted here if the trends of the request are stored or covered by the
+    daily topic table of the model.
+    """
+    logger.info("1) getting filepaths...")
+    request_cache = get_request_cache(
+        support_institutions=support_institutions,
+        query_institutions=query_institutions,
+        topic_counts=topic_counts,
+        support_min_date=support_min_date,
+        support_max_date=support_max_date,
+        query_step_in_days=query_step_in_days,
+        query_min_date=query_min_date,
+        query_max_date=query_max_date,
+        ingest=False)
+    if request_cache is None:
+        return None
+    support_corpus_folderpath = request_cache['support_corpus_folderpath']
+    trajectory_trends_filepath = request_cache['trajectory_trends_filepath']
+
+    logger.info("2) preparing support trajectory data (processing)...")
+    if not is_token_corpus_written(support_corpus_folderpath):
+        return None
+
+    logger.info("3) fitting support topic model...")
+    if not is_topic_model_saved(request_cache['exp_id']):
+        return None
+
+    logger.info("4) preparing query trajectory  trends...")
+    if os.path.exists(request_cache['trends_figure_filepath']):
+        return request_cache
+
+    # - the figure is plotted on submission when the trends are stored, or can be summed from the daily topic table
+    # of the model, without the pipeline
+    if os.path.exists(trajectory_trends_filepath):
+        with gzip.open(trajectory_trends_filepath, 'rb') as handle:
+            df, topic_probabilities = pickle.load(handle)
+    elif is_covered_by_daily_topics(request_cache['exp_id'], request_cache['partitions']['query']):
+        df, topic_probabilities = get_daily_topics_trends(
+            daily_topics=read_daily_topics(request_cache['exp_id']),
+            trajectory=request_cache['trajectories']['query'],
+            partitions=request_cache['partitions']['query'],
+            trajectory_trends_filepath=trajectory_trends_filepath)
+    else:
+        return None
+    plot_and_store_topic_trajectories(
+        df=df, topic_probabilities=topic_probabilities, figure_filepath=request_cache['trends_figure_filepath'])
+    return request_cache
 
-    if not os.path.exists(trajectory_trends_filepath):
-        return False
 
-    return True
+def is_request_processed(
+        support_institutions: List[str],
+        query_institutions: List[str],
+        topic_counts: int,
+        support_min_date: str,
+        support_max_date: str,
+        query_step_in_days: int,
+        query_min_date: str,
+        query_max_date: str
+) -> bool:
+    return get_processed_request_cache(
+        support_institutions=support_institutions,
+        query_institutions=query_institutions,
+        topic_counts=topic_counts,
+        support_min_date=support_min_date,
+        support_max_date=support_max_date,
+        query_step_in_days=query_step_in_days,
+        query_min_date=query_min_date,
+        query_max_date=query_max_date) is not None
 
 
 def get_topic_modeling_data(
@@ -268,207 +328,164 @@ def get_topic_modeling_data(
     The topic modeling data.
     """
     logger.info("1) getting filepaths...")
-    tweet_filepaths = get_tweet_filepaths()
-    trajectories = dict(
-        support=dict(
-            state=None,
-            institution_type=support_institutions,
-            dates=(support_min_date, support_max_date, dict(years=10, months=0, days=0))),
-        query=dict(
-            state=None,
-            institution_type=query_institutions,
-            dates=(query_min_date, query_max_date, dict(years=0, months=0, days=query_step_in_days))))
-
-    trajectory_hashes = dict(
-        support=dict_hash(dict(
-            tweet_filepaths=tweet_filepaths,
-            trajectory=trajectories['support'],
-        )),
-        query=dict_hash(dict(
-            tweet_filepaths=tweet_filepaths,
-            trajectory=trajectories['query'],
-        )))
-
-    # - preparing the topic models based on support
-    pipeline_args = dict(
-        number_of_topics_for_lda=topic_counts,
-                         autoencoder=None,
-        representation_clustering=None,
-        use_transformer=False,
-        use_lda=True,
-        use_tfidf=False,
-        device=torch.device('cpu'),
-        transformer_modelname='paraphrase-mpnet-base-v2',
-        text_processor=TextProcessor(
-         methods=[
-             'remove_url',
-             'convert_to_lowercase',
-             'uppercase_based_missing_delimiter_fix',
-             # 'gtlt_normalize',
-             # 'substitute_more_than_two_letter_repetition_with_one',
-             'non_character_repetition_elimination',
-             # 'use_star_as_delimiter',
-             # 'remove_parantheses_and_their_contents',
-             'remove_questionexlamation_in_brackets',
-             'eliminate_phrase_repetition',
-             'strip'
-         ]
-        ),
-        token_processor_light=TokenProcessor(
-         methods=[
-             'keep_alphabetics_only',
-             # 'keep_nouns_only',
-             # 'spell_check_and_typo_fix',
-             # 'stem_words',
-             # 'remove_stopwords'
-         ]
-        ),
-        token_processor_heavy=TokenProcessor(
-         methods=[
-             'keep_alphabetics_only',
-             # 'keep_nouns_only',
-             'spell_check_and_typo_fix',
-             'stem_words',
-             'remove_stopwords'
-         ]
-    ))
-
-    pipeline_args_to_hash = dict(
-        number_of_topics_for_lda=topic_counts,
-        autoencoder=None,
-        representation_clustering=None,
-        use_transformer=False,
-        use_lda=True,
-        use_tfidf=False,
-        device='cpu',
-        transformer_modelname='paraphrase-mpnet-base-v2',
-        text_processor=dict(
-         methods=[
-             'remove_url',
-             'convert_to_lowercase',
-             'uppercase_based_missing_delimiter_fix',
-             # 'gtlt_normalize',
-             # 'substitute_more_than_two_letter_repetition_with_one',
-             'non_character_repetition_elimination',
-             # 'use_star_as_delimiter',
-             # 'remove_parantheses_and_their_contents',
-             'remove_questionexlamation_in_brackets',
-             'eliminate_phrase_repetition',
-             'strip'
-         ]
-        ),
-        token_processor_light=dict(
-         methods=[
-             'keep_alphabetics_only',
-             # 'keep_nouns_only',
-             # 'spell_check_and_typo_fix',
-             # 'stem_words',
-             # 'remove_stopwords'
-         ]
-        ),
-        token_processor_heavy=dict(
-         methods=[
-             'keep_alphabetics_only',
-             # 'keep_nouns_only',
-             'spell_check_and_typo_fix',
-             'stem_words',
-             'remove_stopwords'
-         ]
-    ))
-
-    pipeline_hash = dict_hash(pipeline_args_to_hash)
-    exp_id = f"{pipeline_hash}_{trajectory_hashes['support']}"
-    pipeline_filepath = os.path.join(cache_folderpath, 'topic_model', f"{exp_id}_ckpt.pkl.gz")
-    pipeline_vis_filepath = os.path.join(cache_folderpath, 'lda_visualization', f'{exp_id}.pkl.gz')
-
-    logger.info("2) preparing support trajectory dataset...")
-    data, meta = prepare_trajectory_dataset(
-        trajectory=trajectories['support'],
-        tweet_filepaths=tweet_filepaths,
-        overwrite=False
-    )
-
-    pipeline = TransformerLDATopicModelingPipeline(
-        **pipeline_args
-    )
-    preprocessed_text_and_tokens_filepath = os.path.join(
-        cache_folderpath,
-        'text_and_token',
-        f"{trajectory_hashes['support']}-preprocessed_text_and_tokens.pkl.gz"
-    )
-
-    logger.info("3) preparing support trajectory data (processing)...")
-    if os.path.exists(preprocessed_text_and_tokens_filepath):
-        with gzip.open(preprocessed_text_and_tokens_filepath, 'rb') as handle:
-            preprocessed_text_list, preprocessed_tokens_list, indices = pickle.load(handle)
+    request_cache = get_request_cache(
+        support_institutions=support_institutions,
+        query_institutions=query_institutions,
+        topic_counts=topic_counts,
+        support_min_date=support_min_date,
+        support_max_date=support_max_date,
+        query_step_in_days=query_step_in_days,
+        query_min_date=query_min_date,
+        query_max_date=query_max_date)
+    trajectories = request_cache['trajectories']
+    partitions = request_cache['partitions']
+    exp_id = request_cache['exp_id']
+    pipeline_vis_filepath = request_cache['pipeline_vis_filepath']
+    support_corpus_folderpath = request_cache['support_corpus_folderpath']
+    trajectory_trends_filepath = request_cache['trajectory_trends_filepath']
+
+    pipeline = get_pipeline(number_of_topics_for_lda=topic_counts, heavy_token_processing=True)
+    preprocessing_hash = get_preprocessing_hash(heavy_token_processing=True)
+
+    logger.info("2) preparing support trajectory data (processing)...")
+    if is_token_corpus_written(support_corpus_folderpath):
+        support_corpus = TokenCorpus.read(support_corpus_folderpath)
     else:
-        preprocessed_text_list, preprocessed_tokens_list, indices = pipeline.preprocess_and_get_text_and_tokens(
-            text_list=[e for e in data[0].tweet.tolist() if isinstance(e, str)],
-            verbose=1
-        )
-        with gzip.open(preprocessed_text_and_tokens_filepath, 'wb') as handle:
-            pickle.dump((preprocessed_text_list, preprocessed_tokens_list, indices), handle)
-
-    logger.info("4) fitting support topic model...")
-    if os.path.exists(pipeline_filepath):
+        preprocess_partitions(pipeline=pipeline, preprocessing_hash=preprocessing_hash, partitions=partitions['support'])
+        support_corpora = []
+        for partition in tqdm(partitions['support']):
+            corpus = get_preprocessed_partition(pipeline=pipeline, preprocessing_hash=preprocessing_hash, partition=partition)
+            # - the support set is the first timespan of the support trajectory
+            buckets = get_bucket_indices(dates=corpus.dates, trajectory=trajectories['support'])
+            support_corpora.append(corpus.select(buckets == 0))
+        support_corpus = TokenCorpus.concatenate(support_corpora)
+        support_corpus.write(support_corpus_folderpath)
+
+    logger.info("3) fitting support topic model...")
+    if is_topic_model_saved(exp_id):
         print(f"loading (already fitted) [exp id: {exp_id}]...")
-        with gzip.open(pipeline_filepath, 'rb') as handle:
-            pipeline = pickle.load(handle)
+        migrate_topic_model(exp_id)
+        pipeline = load_topic_model(exp_id)
 
         with gzip.open(pipeline_vis_filepath, 'rb') as handle:
             vis = pickle.load(handle)
     else:
         print(f"fitting [exp id: {exp_id}]...")
         pipeline.prepare_lda_model(
-            tokens_list=preprocessed_tokens_list,
+            tokens_list=support_corpus.get_tokens_list(),
             lda_worker_count=20)
         vis = pyLDAvis.gensim_models.prepare(
             pipeline.lda_model,
             pipeline.corpus,
             pipeline.vocabulary,
             mds='mmds')
-        with gzip.open(pipeline_filepath, 'wb') as handle:
-            pickle.dump(pipeline, handle)
+        save_topic_model(exp_id=exp_id, pipeline=pipeline)
         with gzip.open(pipeline_vis_filepath, 'wb') as handle:
             pickle.dump(vis, handle)
 
-    logger.info("5) preparing query trajectory data...")
-    # - computing the topic trajectories
-    data, meta = prepare_trajectory_dataset(
-        trajectory=trajectories['query'],
-        tweet_filepaths=tweet_filepaths,
-        overwrite=False
-    )
-
-    logger.info("6) preparing query trajectory  trends...")
-
-    trajectory_trends_filepath = os.path.join(cache_folderpath, 'trends', f"{trajectory_hashes['query']}_{exp_id}-trends.pkl.gz")
-
+    logger.info("4) preparing query trajectory  trends (per day)...")
     if os.path.exists(trajectory_trends_filepath):
         with gzip.open(trajectory_trends_filepath, 'rb') as handle:
             df, topic_probabilities = pickle.load(handle)
     else:
-        topic_probabilities = []
-
-        for tmp_query_data in tqdm(data):
-            query_preprocessed_text_list, query_preprocessed_tokens_list, query_indices = pipeline.preprocess_and_get_text_and_tokens(
-                text_list=[e for e in tmp_query_data.tweet.tolist() if isinstance(e, str)],
-                verbose=1
-            )
-            res = pipeline.get_lda_representations(query_preprocessed_tokens_list)
-            topic_probabilities += [res.mean(axis=0)]
-
-        topic_probabilities = numpy.stack(topic_probabilities, axis=0)
-        df_dict = {f't{i}': topic_probabilities[:, i - 1] for i in range(1, 1 + topic_probabilities.shape[1])}
-        df_dict['x'] = [
-            date_parser.parse(trajectories['query']['dates'][0]).date() + e * relativedelta(**trajectories['query']['dates'][2]) for e
-            in range(df_dict['t1'].shape[0])]
-
-        df = pandas.DataFrame(df_dict)
-        with gzip.open(trajectory_trends_filepath, 'wb') as handle:
-            pickle.dump((df, topic_probabilities), handle)
+        # - the daily rows of the model are shared by all of its query trajectories, only the new partitions are inferred
+        daily_topics = update_daily_topics(
+            pipeline=pipeline,
+            preprocessing_hash=preprocessing_hash,
+            exp_id=exp_id,
+            partitions=partitions['query'])
+        df, topic_probabilities = get_daily_topics_trends(
+            daily_topics=daily_topics,
+            trajectory=trajectories['query'],
+            partitions=partitions['query'],
+            trajectory_trends_filepath=trajectory_trends_filepath)
 
-    fig = px.line(df, x='x', y=[f't{i}' for i in range(1, 1+topic_probabilities.shape[1])], markers=True,
-                  template='plotly_white')
-    fig.update_layout(title="Topic trajectories through time", xaxis_title="Date", yaxis_title="Topic Probability",)
+    fig = plot_and_store_topic_trajectories(
+        df=df, topic_probabilities=topic_probabilities, figure_filepath=request_cache['trends_figure_filepath'])
     return vis, fig
+
+
+def get_topic_modeling_figure_filepath(
+        support_institutions: List[str],
+        query_institutions: List[str],
+        topic_counts: int,
+        support_min_date: str,
+        support_max_date: str,
+        query_step_in_days: int,
+        query_min_date: str,
+        query_max_date: str
+) -> str:
+    """
+    Parameters
+    ----------
+    support_institutions: `List[str]`, required
+        The institutions for building the support set.
+
+    query_institutions: `List[str]`, required
+        The institutions for building the query set.
+
+    topic_counts: `int`, required
+        The number of topics to use.
+
+    support_min_date: `str`, required
+        The minimum date to use for the support set.
+
+    support_max_date: `str`, required
+        The maximum date to use for the support set.
+
+    query_step_in_days: `int`, required
+        The length of the time-step in days.
+
+    query_min_date: `str`, required
+        The minimum date to query.
+
+    query_max_date: `str`, required
+        The maximum date to query.
+
+    Returns
+    -------
+    `str`: The path to the compressed figure JSON of the topic trajectories, from
+    :func:`app.libraries.utilities.plotly.write_figure_payload`, or `None` if it has not been stored yet. The figure
+    is only looked up, it is plotted by :func:`get_processed_request_cache` or :func:`get_topic_modeling_data`.
+    """
+    request_cache = get_request_cache(
+        support_institutions=support_institutions,
+        query_institutions=query_institutions,
+        topic_counts=topic_counts,
+        support_min_date=support_min_date,
+        support_max_date=support_max_date,
+        query_step_in_days=query_step_in_days,
+        query_min_date=query_min_date,
+        query_max_date=query_max_date,
+        ingest=False)
+    if request_cache is None or not os.path.exists(request_cache['trends_figure_filepath']):
+        return None
+    return request_cache['trends_figure_filepath']
+
+
+def get_topic_modeling_visualization_html(request_cache: Dict[str, Any]) -> str:
+    """
+    Parameters
+    ----------
+    request_cache: `Dict[str, Any]`, required
+        The cache of a processed request, from :func:`get_processed_request_cache`.
+
+    Returns
+    -------
+    `str`: The rendered pyLDAvis visualization of the support topic model, which is stored gzip-compressed on its
+    first render, or `None` if the visualization has not been prepared yet.
+    """
+    html_filepath = request_cache['pipeline_vis_html_filepath']
+    if os.path.exists(html_filepath):
+        with gzip.open(html_filepath, 'rt') as handle:
+            return handle.read()
+    if not os.path.exists(request_cache['pipeline_vis_filepath']):
+        return None
+
+    with gzip.open(request_cache['pipeline_vis_filepath'], 'rb') as handle:
+        vis = pickle.load(handle)
+    html = str(pyLDAvis.display(vis).data)
+    with gzip.open(html_filepath + '.tmp', 'wt') as handle:
+        handle.write(html)
+    os.replace(html_filepath + '.tmp', html_filepath)
+    return html
@@ -0,0 +1,203 @@
+from typing import Dict, Tuple, Any, Callable, List, Iterator
+import os
+import numpy
+from fame.topic_modeling.cortex.pipeline.bert_lda import TransformerLDATopicModelingPipeline
+
+from app import cache_folderpath
+from app.libraries.io.tweet_store import read_tweet_store_partition
+from app.libraries.io.read_write import write_pkl_gz, read_pkl_gz
+from app.libraries.randomization.hashing import dict_hash
+from app.libraries.trajectory.utilities import get_timespan_boundaries_for_trajectory
+from app.libraries.preprocessing.token_store import get_preprocessed_tweets, update_token_store
+from app.libraries.preprocessing.corpus import TokenCorpus
+from app.libraries.utilities.logging import get_logger
+logger = get_logger(__name__)
+
+
+def get_partition_piece_filepath(namespace: str, key: Dict[str, Any]) -> str:
+    return os.path.join(cache_folderpath, namespace, 'partitions', dict_hash(key) + '.pkl.gz')
+
+
+def get_partition_piece(namespace: str, key: Dict[str, Any], compute: Callable[[], Any]) -> Any:
+    """
+    Reading a cached per-partition piece of a computation, or computing and caching it if it does not exist.
+    Since the key of a piece includes the fingerprint of its partition, a data refresh only recomputes the
+    pieces of the partitions that have changed.
+
+    Parameters
+    ----------
+    namespace: `str`, required
+        The cache folder of the computation (e.g. `word_frequencies`).
+
+    key: `Dict[str, Any]`, required
+        The key of the piece, including the `(handle, month, fingerprint)` of its partition.
+
+    compute: `Callable[[], Any]`, required
+        The function computing the piece on a cache miss.
+
+    Returns
+    -------
+    `Any`: The piece.
+    """
+    piece_filepath = get_partition_piece_filepath(namespace=namespace, key=key)
+    if os.path.exists(piece_filepath):
+        try:
+            return read_pkl_gz(piece_filepath)
+        except Exception as e:
+            logger.error(f"failed to load the file located in {piece_filepath}, re-creating it...\n\terror: {e}")
+
+    piece = compute()
+    try:
+        write_pkl_gz(piece, piece_filepath)
+    except Exception as e:
+        logger.error(f"failed to write the partition piece to {piece_filepath} - error: {e}")
+    return piece
+
+
+def read_partition_tweets(partition: Tuple[str, str, str]) -> Tuple[List[int], numpy.ndarray, List[str]]:
+    """
+    Parameters
+    ----------
+    partition: `Tuple[str, str, str]`, required
+        The `(handle, month, fingerprint)` of the tweet store partition.
+
+    Returns
+    -------
+    `Tuple[List[int], numpy.ndarray, List[str]]`: The ids, `datetime64[ns]` dates and raw text of the tweets of the
+    partition that have a text.
+    """
+    handle, month, fingerprint = partition
+    df = read_tweet_store_partition(handle=handle, month=month, columns=['id', 'date', 'tweet'])
+    df = df[[isinstance(e, str) for e in df.tweet.tolist()]]
+    return df.id.tolist(), df.date.to_numpy(dtype='datetime64[ns]'), df.tweet.tolist()
+
+
+def preprocess_partitions(
+        pipeline: TransformerLDATopicModelingPipeline,
+        preprocessing_hash: str,
+        partitions: List[Tuple[str, str, str]],
+        worker_count: int = None
+) -> None:
+    """
+    Adding the tweets of the given partitions to the token store ahead of a job that reads them with
+    :func:`get_preprocessed_partition`, so that the job preprocesses all of its partitions over a single process
+    pool rather than one pool per partition.
+
+    Parameters
+    ----------
+    pipeline: `TransformerLDATopicModelingPipeline`, required
+        The pipeline whose processors are used for the preprocessing.
+
+    preprocessing_hash: `str`, required
+        The fingerprint of the processors of the pipeline.
+
+    partitions: `List[Tuple[str, str, str]]`, required
+        The `(handle, month, fingerprint)` of the tweet store partitions.
+
+    worker_count: `int`, optional (default=None)
+        The number of worker processes, `PREPROCESSING_WORKER_COUNT` if `None`.
+    """
+    def iterate_shards() -> Iterator[Tuple[str, str, List[int], numpy.ndarray, List[str]]]:
+        for partition in partitions:
+            yield (partition[0], partition[1]) + read_partition_tweets(partition)
+
+    update_token_store(
+        pipeline=pipeline, preprocessing_hash=preprocessing_hash, shards=iterate_shards(), worker_count=worker_count)
+
+
+def get_preprocessed_partition(
+        pipeline: TransformerLDATopicModelingPipeline,
+        preprocessing_hash: str,
+        partition: Tuple[str, str, str]
+) -> TokenCorpus:
+    """
+    Parameters
+    ----------
+    pipeline: `TransformerLDATopicModelingPipeline`, required
+        The pipeline whose processors are used for the preprocessing.
+
+    preprocessing_hash: `str`, required
+        The fingerprint of the processors of the pipeline, from
+        :func:`app.libraries.preprocessing.utilities.get_preprocessing_hash`.
+
+    partition: `Tuple[str, str, str]`, required
+        The `(handle, month, fingerprint)` of the tweet store partition.
+
+    Returns
+    -------
+    `TokenCorpus`: The corpus of the tweets of the partition that survived the preprocessing. The tweets are looked up
+    in the token store, so a changed partition only preprocesses its new tweets (jobs over many partitions fill the
+    store beforehand with :func:`preprocess_partitions`).
+    """
+    handle, month, fingerprint = partition
+    ids, dates, text_list = read_partition_tweets(partition)
+    return get_preprocessed_tweets(
+        pipeline=pipeline,
+        preprocessing_hash=preprocessing_hash,
+        handle=handle,
+        month=month,
+        ids=ids,
+        dates=dates,
+        text_list=text_list)
+
+
+def get_bucket_indices(dates: numpy.ndarray, trajectory: Dict[str, Any]) -> numpy.ndarray:
+    """
+    Parameters
+    ----------
+    dates: `numpy.ndarray`, required
+        The `datetime64[ns]` dates of the tweets.
+
+    trajectory: `Dict[str, Any]`, required
+        The trajectory, as an example:
+        ```python
+        trajectory=dict(
+            state=None,
+            institution_type=['television broadcast network'],
+            dates=(start_date, end_date, dict(years=5, months=0, days=0)))
+        ```
+
+    Returns
+    -------
+    `numpy.ndarray`: The index of the timespan that each tweet falls in, and `-1` for the tweets outside of the
+    trajectory, found in a single binary search over the timespan boundaries rather than one mask per timespan.
+    """
+    boundaries = get_timespan_boundaries_for_trajectory(trajectory=trajectory)
+    buckets = numpy.searchsorted(boundaries, dates, side='right') - 1
+    buckets[dates >= boundaries[-1]] = -1
+    return buckets
+
+
+def get_days(dates: numpy.ndarray) -> numpy.ndarray:
+    """
+    Parameters
+    ----------
+    dates: `numpy.ndarray`, required
+        The `datetime64[ns]` dates of the tweets.
+
+    Returns
+    -------
+    `numpy.ndarray`: The `datetime64[D]` day of every tweet, which is the unit the per-partition aggregates are
+    cached in, so that any range and time-step can be assembled from them.
+    """
+    return numpy.asarray(dates, dtype='datetime64[ns]').astype('datetime64[D]')
+
+
+def get_bucket_indices_for_days(days: List[numpy.datetime64], trajectory: Dict[str, Any]) -> numpy.ndarray:
+    """
+    Parameters
+    ----------
+    days: `List[numpy.datetime64]`, required
+        The days of the per-day aggregates.
+
+    trajectory: `Dict[str, Any]`, required
+        The trajectory, whose timespans are assumed to start at midnight so that each day falls in a single one.
+
+    Returns
+    -------
+    `numpy.ndarray`: The index of the timespan that each day falls in, and `-1` for the days outside of the
+    trajectory.
+    """
+    return get_bucket_indices(
+        dates=numpy.array(days, dtype='datetime64[D]').astype('datetime64[ns]'),
+        trajectory=trajectory)
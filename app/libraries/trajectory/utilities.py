@@ -12,14 +12,16 @@ import functools
 import dateutil.parser as date_parser
 from datetime import datetime, date, timedelta
 from dateutil.relativedelta import relativedelta
-from typing import Dict, Any
+from typing import Dict, Any, Set
 import hashlib
 import json
 from tqdm import tqdm
 import pyLDAvis.gensim_models
 
-from app.libraries.io.accounts_dataframe import read_accounts_df
+from app.libraries.io.accounts_dataframe import get_registered_handles
 from app.libraries.io.tweet_filepaths import get_tweet_filepaths
+from app.libraries.io.tweet_store import group_tweet_filepaths_by_handle, ingest_tweet_store, is_handle_ingested, \
+    read_handle_meta, get_months_for_daterange
 from app.libraries.randomization.hashing import dict_hash
 from app import cache_folderpath
 from app.libraries.utilities.logging import get_logger
@@ -72,19 +74,36 @@ def get_timespan_partition_for_trajectory(
     return partition_timespans
 
 
-def filter_per_trajectory(
-    df: pandas.DataFrame,
-    trajectory: Dict[str, Any],
-) -> List[pandas.DataFrame]:
+def get_trajectory_hash(trajectory: Dict[str, Any], trajectory_version: str) -> str:
     """
-    Given a trajectory and a full dataframe, this method
-    will split the dataframe into an ordered list of dataframes associated with the given trajectory.
-
     Parameters
     ----------
-    df: `pandas.DataFrame`, required
-        The input dataframe.
+    trajectory: `Dict[str, Any]`, required
+        The trajectory, as an example:
+        ```python
+        trajectory=dict(
+            state=None,
+            institution_type=['television broadcast network'],
+            dates=(start_date, end_date, dict(years=5, months=0, days=0)))
+        ```
+
+    trajectory_version: `str`, required
+        The version of the tweets that the trajectory covers, from :func:`get_partitions_version`.
+
+    Returns
+    -------
+    `str`: The cache key of the trajectory over the given version of its tweets.
+    """
+    return dict_hash(dict(
+        trajectory_version=trajectory_version,
+        trajectory=trajectory,
+    ))
 
+
+def get_timespan_boundaries_for_trajectory(trajectory: Dict[str, Any]) -> numpy.ndarray:
+    """
+    Parameters
+    ----------
     trajectory: `Dict[str, Any]`, required
         The trajectory, as an example:
         ```python
@@ -93,15 +112,18 @@ def filter_per_trajectory(
             institution_type=['television broadcast network'],
             dates=(start_date, end_date, dict(years=5, months=0, days=0)))
         ```
+
+    Returns
+    -------
+    `numpy.ndarray`: The `datetime64[ns]` boundaries of the timespan partition, where the i-th timespan
+    is `[boundaries[i], boundaries[i + 1])`.
     """
-    df = df.copy()
     timespans = get_timespan_partition_for_trajectory(trajectory=trajectory, convert_to_str=True)
-    df.sort_values(by='date', ascending=True, inplace=True)
-    output_dfs = [df[(df.date >= ts[0]) & (df.date < ts[1])].copy() for ts in timespans]
-    return output_dfs
+    boundaries = [e[0] for e in timespans] + [timespans[-1][1]]
+    return numpy.array(boundaries, dtype='datetime64[D]').astype('datetime64[ns]')
 
 
-def get_filtered_twitter_handles(trajectory: Dict[str, Any]) -> List[str]:
+def get_filtered_twitter_handles(trajectory: Dict[str, Any]) -> Set[str]:
     """
     Parameters
     ----------
@@ -116,26 +138,23 @@ def get_filtered_twitter_handles(trajectory: Dict[str, Any]) -> List[str]:
 
     Returns
     -------
-    `List[str]`: The list of tweet handles that have data for the trajectory.
+    `Set[str]`: The set of lower-cased tweet handles that have data for the trajectory.
     """
-    tmp_df = read_accounts_df()
     if trajectory['state'] is not None:
         if not isinstance(trajectory['state'], list):
             trajectory['state'] = [trajectory['state']]
-        tmp_df = tmp_df[tmp_df.state.isin(trajectory['state'])]
 
     if trajectory['institution_type'] is not None:
         if not isinstance(trajectory['institution_type'], list):
             trajectory['institution_type'] = [trajectory['institution_type']]
-        tmp_df = tmp_df[tmp_df.institution_type.isin(trajectory['institution_type'])]
-    return tmp_df.twitter_handle.unique().tolist()
+    return get_registered_handles(state=trajectory['state'], institution_type=trajectory['institution_type'])
 
 
-def prepare_trajectory_dataset(
+def get_trajectory_partitions(
     trajectory: Dict[str, Any],
     tweet_filepaths: List[str],
-    overwrite: bool = False
-) -> Tuple[List[pandas.DataFrame], Dict[str, Any]]:
+    ingest: bool = True
+) -> List[Tuple[str, str, str]]:
     """
     Parameters
     ----------
@@ -151,51 +170,48 @@ def prepare_trajectory_dataset(
     tweet_filepaths: `List[str]`, required
         The list of tweet filepaths.
 
-    overwrite: `bool`, optional (default=False)
-        Whether to overwrite the cached data.
+    ingest: `bool`, optional (default=True)
+        Whether to ingest the handles that are not up-to-date in the tweet store. If `False`, `None` is returned
+        when any of the handles of the trajectory is not up-to-date.
 
     Returns
     -------
-    `Tuple[List[pandas.DataFrame], Dict[str, Any]]`: The ordered list of associated segment dataframes as well as the
-    metadata, including the details of the trajectory and the full filepaths to the considered tweet corpora.
+    `List[Tuple[str, str, str]]`: The ordered `(handle, month, fingerprint)` of every tweet store partition that the
+    trajectory touches.
     """
-
-    # - preparing the metadata
-    meta = dict(
-        tweet_filepaths=tweet_filepaths,
-        trajectory=trajectory
-    )
-
-    # - reading from cache if needed
-    final_filename = os.path.join(cache_folderpath, 'trajectory', dict_hash(meta) + '.pkl.gz')
-    if os.path.exists(final_filename) and not overwrite:
-        try:
-            data_dict = read_pkl_gz(final_filename)
-            return data_dict['data'], data_dict['meta']
-        except Exception as e:
-            logger.error(f"failed to load the  file located in {final_filename} - error: {e}")
-
-    # - filtering the allowed accounts
-    allowed_handles = [e.lower() for e in get_filtered_twitter_handles(trajectory=trajectory)]
-
-    # - reading all the tweet files associated with the allowed handles and filtering them based on trajectory
-    outputs = []
-    for tweet_filepath in tweet_filepaths:
-        if os.path.basename(tweet_filepath)[:-4].lower() not in allowed_handles:
+    allowed_handles = get_filtered_twitter_handles(trajectory=trajectory)
+    handle_tweet_filepaths = {
+        handle: filepaths
+        for handle, filepaths in group_tweet_filepaths_by_handle(tweet_filepaths).items()
+        if handle in allowed_handles}
+
+    if ingest:
+        ingest_tweet_store([e for filepaths in handle_tweet_filepaths.values() for e in filepaths])
+    elif not all([is_handle_ingested(handle, filepaths) for handle, filepaths in handle_tweet_filepaths.items()]):
+        return None
+
+    start_date, end_date, _ = trajectory['dates']
+    months = get_months_for_daterange(start_date, end_date)
+    partitions = []
+    for handle in sorted(handle_tweet_filepaths.keys()):
+        meta = read_handle_meta(handle)
+        if meta is None:
+            logger.error(f"the tweets of {handle} are missing from the tweet store, they are left out of the trajectory")
             continue
-        tmp_df = pandas.read_csv(tweet_filepath, on_bad_lines='skip', delimiter='\t', low_memory=False)
-        outputs += [filter_per_trajectory(tmp_df, trajectory)]
-
-    # - concatenating the results across the time-segment
-    results = []
-    for i in range(len(outputs[0])):
-        results += [pandas.concat([e for e in zip(*outputs)][i], axis=0)]
-
-    # - caching the result
-    try:
-        write_pkl_gz(dict(meta=meta, data=results), final_filename)
-    except Exception as e:
-        logger.error(f"failed to write the trajectory data file to {final_filename} - error: {e} => deleting it for now.")
-        os.system(f'rm {final_filename}')
-
-    return results, meta
+        partitions += [(handle, month, meta['partitions'][month]) for month in months if month in meta['partitions']]
+    return partitions
+
+
+def get_partitions_version(partitions: List[Tuple[str, str, str]]) -> str:
+    """
+    Parameters
+    ----------
+    partitions: `List[Tuple[str, str, str]]`, required
+        The `(handle, month, fingerprint)` of the partitions, from :func:`get_trajectory_partitions`.
+
+    Returns
+    -------
+    `str`: A compact identifier of the tweets in the given partitions.
+    """
+    return dict_hash(dict(partitions=[list(e) for e in partitions]))
+
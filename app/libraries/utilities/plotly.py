@@ -1,6 +1,10 @@
+import os
+import gzip
 import json
+import hashlib
 import plotly.utils
 import plotly_express as px
+from flask import Response, request
 
 
 def jsonify_plotly_figure(fig):
@@ -20,3 +24,67 @@ def jsonify_plotly_figure(fig):
     graphJSON = json.dumps(fig.data, cls=plotly.utils.PlotlyJSONEncoder)
     layout = json.dumps(fig.layout, cls=plotly.utils.PlotlyJSONEncoder)
     return graphJSON, layout, info_list
+
+
+def write_figure_payload(fig, filepath):
+    """
+    Storing the final JSON (`data` and `layout`) of a plotly figure gzip-compressed, so that it is served as is by
+    :func:`send_figure_payload` instead of being unpickled and re-encoded on every view. The payload is compressed
+    without a timestamp, so the same figure always gives the same bytes (and ETag).
+
+    Parameters
+    ----------
+    fig: `plotly.graph_objects.Figure`, required
+        The plotly figure.
+
+    filepath: `str`, required
+        The path to the `.json.gz` payload.
+    """
+    os.makedirs(os.path.dirname(filepath), exist_ok=True)
+    tmp_filepath = filepath + f'.tmp{os.getpid()}'
+    with open(tmp_filepath, 'wb') as handle:
+        handle.write(gzip.compress(fig.to_json().encode('utf-8'), mtime=0))
+    os.replace(tmp_filepath, filepath)
+
+
+def read_figure_payload(filepath):
+    """
+    Parameters
+    ----------
+    filepath: `str`, required
+        The path to a payload written by :func:`write_figure_payload`.
+
+    Returns
+    -------
+    `str`: The figure JSON.
+    """
+    with open(filepath, 'rb') as handle:
+        return gzip.decompress(handle.read()).decode('utf-8')
+
+
+def send_figure_payload(filepath):
+    """
+    Parameters
+    ----------
+    filepath: `str`, required
+        The path to a payload written by :func:`write_figure_payload`.
+
+    Returns
+    -------
+    `flask.Response`: The payload with `Content-Encoding: gzip` (decompressed for the clients not accepting it) and
+    its content hash as a strong ETag (one per encoding), answering `If-None-Match` revalidations with `304 Not Modified`.
+    """
+    with open(filepath, 'rb') as handle:
+        payload = handle.read()
+
+    etag = hashlib.md5(payload).hexdigest()
+    if 'gzip' in request.accept_encodings:
+        response = Response(payload, mimetype='application/json')
+        response.headers['Content-Encoding'] = 'gzip'
+        etag = etag + '-gzip'
+    else:
+        response = Response(gzip.decompress(payload), mimetype='application/json')
+    response.headers['Vary'] = 'Accept-Encoding'
+    response.headers['Cache-Control'] = 'no-cache'
+    response.set_etag(etag)
+    return response.make_conditional(request)
@@ -1,38 +1,115 @@
-from typing import List, Any
+from typing import List, Any, Dict, Tuple
 import os
-import pickle
-import gzip
+from concurrent.futures import ProcessPoolExecutor
 import numpy
 import nltk
 from tqdm import tqdm
-import pyLDAvis
-import torch
 import dateutil.parser as date_parser
 from datetime import date, datetime
 from dateutil.relativedelta import relativedelta
 import pandas
 import plotly_express as px
-from fame.text_processing.text_processor import TextProcessor
-from fame.text_processing.token_processor import TokenProcessor
-from fame.topic_modeling.cortex.pipeline.bert_lda import TransformerLDATopicModelingPipeline
 from wordcloud import WordCloud, STOPWORDS
 import plotly.graph_objs as go
 from app.libraries.io.tweet_filepaths import get_tweet_filepaths
+from app.libraries.preprocessing.utilities import get_pipeline, get_preprocessing_hash
+from app.libraries.trajectory.utilities import get_timespan_partition_for_trajectory, get_trajectory_hash, \
+    get_trajectory_partitions, get_partitions_version
+from app.libraries.trajectory.partitions import get_bucket_indices_for_days
+from app.libraries.word_frequency.count_cube import get_partition_daily_word_frequencies, get_count_cube_top_words, \
+    preprocess_uncounted_partitions
+
+from app import cache_folderpath, word_cloud_worker_count
+from app.libraries.io.read_write import write_pkl_gz, read_pkl_gz
 from app.libraries.randomization.hashing import dict_hash
-from app.libraries.trajectory.utilities import prepare_trajectory_dataset, get_timespan_partition_for_trajectory
-
-from app import cache_folderpath
+from app.libraries.utilities.plotly import write_figure_payload, read_figure_payload
 from app.libraries.utilities.logging import get_logger
 logger = get_logger(__name__)
 
 
-# - from the github repository: https://raw.githubusercontent.com/PrashantSaikia/Wordcloud-in-Plotly/master/plotly_wordcloud.py
-def plotly_wordcloud(text, max_words):
-    wc = WordCloud(stopwords=set(STOPWORDS),
-                   max_words=max_words,
-                   max_font_size=20)
-    wc.generate(text)
+# - the canvas of the word clouds, which is part of the key of their cached layouts
+word_cloud_canvas = dict(width=400, height=200, max_font_size=20)
+
+
+def get_word_cloud_layout(frequencies: Dict[str, int], max_words: int) -> List[Tuple]:
+    """
+    Parameters
+    ----------
+    frequencies: `Dict[str, int]`, required
+        The counts of the words to lay out.
+
+    max_words: `int`, required
+        The maximum number of words to include in the word cloud
+
+    Returns
+    -------
+    `List[Tuple]`: The `((word, frequency), font size, position, orientation, color)` of every placed word, from
+    `WordCloud.layout_`.
+    """
+    wc = WordCloud(max_words=max_words, **word_cloud_canvas)
+    wc.generate_from_frequencies(frequencies)
+    return list(wc.layout_)
+
+
+def get_word_cloud_layouts(
+        bucket_word_frequencies: List[Dict[str, int]],
+        max_word_count: int,
+        worker_count: int = None
+) -> List[List[Tuple]]:
+    """
+    Laying out the word clouds of the timespans, where each layout is cached under the fingerprint of its word counts
+    so that repeated or overlapping requests reuse it, and the missing ones are laid out in parallel.
+
+    Parameters
+    ----------
+    bucket_word_frequencies: `List[Dict[str, int]]`, required
+        The counts of the most frequent words of every timespan.
+
+    max_word_count: `int`, required
+        The maximum number of words to include in the word cloud
+
+    worker_count: `int`, optional (default=None)
+        The number of worker processes, `WORD_CLOUD_WORKER_COUNT` if `None`.
+
+    Returns
+    -------
+    `List[List[Tuple]]`: The layout of every timespan, see :func:`get_word_cloud_layout`.
+    """
+    worker_count = word_cloud_worker_count if worker_count is None else worker_count
+    layout_filepaths = [
+        os.path.join(cache_folderpath, 'word_clouds', 'layouts', dict_hash(dict(
+            frequencies=sorted([[k, int(v)] for k, v in e.items()]),
+            max_word_count=max_word_count,
+            canvas=word_cloud_canvas)) + '.pkl.gz')
+        for e in bucket_word_frequencies]
+
+    layouts = [None] * len(bucket_word_frequencies)
+    for i, layout_filepath in enumerate(layout_filepaths):
+        if os.path.exists(layout_filepath):
+            try:
+                layouts[i] = read_pkl_gz(layout_filepath)
+            except Exception as e:
+                logger.error(f"failed to load the file located in {layout_filepath}, re-creating it...\n\terror: {e}")
+
+    missing = [i for i, e in enumerate(layouts) if e is None]
+    frequencies = [bucket_word_frequencies[i] for i in missing]
+    if worker_count <= 1 or len(missing) <= 1:
+        missing_layouts = [get_word_cloud_layout(e, max_word_count) for e in tqdm(frequencies)]
+    else:
+        with ProcessPoolExecutor(max_workers=min(worker_count, len(missing))) as executor:
+            missing_layouts = list(executor.map(get_word_cloud_layout, frequencies, [max_word_count] * len(missing)))
+
+    for i, layout in zip(missing, missing_layouts):
+        layouts[i] = layout
+        try:
+            write_pkl_gz(layout, layout_filepaths[i])
+        except Exception as e:
+            logger.error(f"failed to write the word cloud layout to {layout_filepaths[i]} - error: {e}")
+    return layouts
 
+
+# - from the github repository: https://raw.githubusercontent.com/PrashantSaikia/Wordcloud-in-Plotly/master/plotly_wordcloud.py
+def plotly_wordcloud(word_cloud_layout):
     word_list = []
     freq_list = []
     fontsize_list = []
@@ -40,7 +117,7 @@ def plotly_wordcloud(text, max_words):
     orientation_list = []
     color_list = []
 
-    for (word, freq), fontsize, position, orientation, color in wc.layout_:
+    for (word, freq), fontsize, position, orientation, color in word_cloud_layout:
         word_list.append(word)
         freq_list.append(freq)
         fontsize_list.append(fontsize)
@@ -79,6 +156,111 @@ def plotly_wordcloud(text, max_words):
     return fig
 
 
+def get_bucket_word_frequencies(
+        trajectory: Dict[str, Any],
+        partitions: List[Tuple[str, str, str]],
+        bucket_count: int,
+        max_word_count: int
+) -> List[Dict[str, int]]:
+    """
+    Parameters
+    ----------
+    trajectory: `Dict[str, Any]`, required
+        The query trajectory.
+
+    partitions: `List[Tuple[str, str, str]]`, required
+        The `(handle, month, fingerprint)` of the partitions of the trajectory.
+
+    bucket_count: `int`, required
+        The number of timespans of the trajectory.
+
+    max_word_count: `int`, required
+        The maximum number of words to include in the word cloud
+
+    Returns
+    -------
+    `List[Dict[str, int]]`: The counts of the most frequent preprocessed words (stopwords excluded) of every timespan,
+    sliced from the count cube if it covers the partitions, and summed from the per-partition daily word frequencies
+    otherwise.
+    """
+    stopwords = set(STOPWORDS)
+    frequencies = get_count_cube_top_words(
+        trajectory=trajectory,
+        partitions=partitions,
+        bucket_count=bucket_count,
+        top_n=max_word_count,
+        excluded_words=stopwords)
+    if frequencies is not None:
+        return frequencies
+
+    pipeline = get_pipeline()
+    preprocessing_hash = get_preprocessing_hash()
+    preprocess_uncounted_partitions(pipeline=pipeline, preprocessing_hash=preprocessing_hash, partitions=partitions)
+    word_freqs = [nltk.FreqDist() for _ in range(bucket_count)]
+    for partition in tqdm(partitions):
+        daily_word_freqs = get_partition_daily_word_frequencies(
+            pipeline=pipeline,
+            preprocessing_hash=preprocessing_hash,
+            partition=partition)
+        days = list(daily_word_freqs.keys())
+        for day, bucket in zip(days, get_bucket_indices_for_days(days=days, trajectory=trajectory).tolist()):
+            if bucket >= 0:
+                word_freqs[bucket].update(daily_word_freqs[day])
+    return [
+        dict([(k, v) for k, v in word_freq.most_common() if k not in stopwords][:max_word_count])
+        for word_freq in word_freqs]
+
+
+def get_word_clouds_folderpath(trajectory_hash: str, max_word_count: int) -> str:
+    return os.path.join(cache_folderpath, 'word_clouds', f"{trajectory_hash}-{max_word_count}-word_clouds")
+
+
+def get_processed_word_clouds_trajectory_hash(
+        query_institutions: List[str],
+        query_step_in_days: int,
+        query_min_date: str,
+        query_max_date: str,
+        max_word_count: int
+) -> str:
+    """
+    Parameters
+    ----------
+    query_institutions: `List[str]`, required
+        The institutions to query
+
+    query_step_in_days: `int`, required
+        The step in days to query
+
+    query_min_date: `str`, required
+        The minimum date to query
+
+    query_max_date: `str`, required
+        The maximum date to query
+
+    max_word_count: `int`, required
+        The maximum number of words to include in the word cloud
+
+    Returns
+    -------
+    `str`: The hash of the trajectory of the request over its current partitions, which locates its word cloud panels
+    (see :func:`get_word_clouds_folderpath`), or `None` if they have not been computed yet.
+    """
+    tweet_filepaths = get_tweet_filepaths()
+    trajectory = dict(
+        state=None,
+        institution_type=query_institutions,
+        dates=(query_min_date, query_max_date, dict(years=0, months=0, days=query_step_in_days)))
+
+    partitions = get_trajectory_partitions(trajectory=trajectory, tweet_filepaths=tweet_filepaths, ingest=False)
+    if partitions is None:
+        return None
+    trajectory_hash = get_trajectory_hash(trajectory, get_partitions_version(partitions))
+    word_clouds_folderpath = get_word_clouds_folderpath(trajectory_hash=trajectory_hash, max_word_count=max_word_count)
+    if not os.path.exists(os.path.join(word_clouds_folderpath, 'meta.pkl.gz')):
+        return None
+    return trajectory_hash
+
+
 def is_request_processed(query_institutions: List[str],
         query_step_in_days: int,
         query_min_date: str,
@@ -106,82 +288,49 @@ def is_request_processed(query_institutions: List[str],
     -------
     whether the request is already processed
     """
-    logger.info("1) getting filepaths...")
-    tweet_filepaths = get_tweet_filepaths()
+    logger.info("1) finding word clouds...")
+    return get_processed_word_clouds_trajectory_hash(
+        query_institutions=query_institutions,
+        query_step_in_days=query_step_in_days,
+        query_min_date=query_min_date,
+        query_max_date=query_max_date,
+        max_word_count=max_word_count) is not None
+
+
+def get_word_cloud_timespans(query_min_date: str, query_max_date: str, query_step_in_days: int) -> List[str]:
     trajectory = dict(
         state=None,
-        institution_type=query_institutions,
+        institution_type=None,
         dates=(query_min_date, query_max_date, dict(years=0, months=0, days=query_step_in_days)))
+    return [f'{e[0]} -> {e[1]}' for e in get_timespan_partition_for_trajectory(trajectory)]
 
-    timespans = [f'{e[0]} -> {e[1]}' for e in get_timespan_partition_for_trajectory(trajectory)]
 
-    trajectory_hash = dict_hash(dict(
-        tweet_filepaths=tweet_filepaths,
-        trajectory=trajectory,
-    ))
-
-    # - preparing the topic models based on support
-    pipeline_args = dict(
-        number_of_topics_for_lda=2,
-        autoencoder=None,
-        representation_clustering=None,
-        use_transformer=False,
-        use_lda=True,
-        use_tfidf=False,
-        device=torch.device('cpu'),
-        transformer_modelname='paraphrase-mpnet-base-v2',
-        text_processor=TextProcessor(
-            methods=[
-                'remove_url',
-                'convert_to_lowercase',
-                'uppercase_based_missing_delimiter_fix',
-                # 'gtlt_normalize',
-                # 'substitute_more_than_two_letter_repetition_with_one',
-                'non_character_repetition_elimination',
-                # 'use_star_as_delimiter',
-                # 'remove_parantheses_and_their_contents',
-                'remove_questionexlamation_in_brackets',
-                'eliminate_phrase_repetition',
-                'strip'
-            ]
-        ),
-        token_processor_light=TokenProcessor(
-            methods=[
-                'keep_alphabetics_only',
-                # 'keep_nouns_only',
-                # 'spell_check_and_typo_fix',
-                # 'stem_words',
-                # 'remove_stopwords'
-            ]
-        ),
-        token_processor_heavy=TokenProcessor(
-            methods=[
-                'keep_alphabetics_only',
-                # 'keep_nouns_only',
-                # 'spell_check_and_typo_fix',
-                # 'stem_words',
-                # 'remove_stopwords'
-            ]
-        ))
-
-    logger.info("2) preparing query trajectory dataset...")
-    # - preparing the metadata
-    meta = dict(
-        tweet_filepaths=tweet_filepaths,
-        trajectory=trajectory
-    )
-
-    # - reading from cache if needed
-    final_filename = os.path.join(cache_folderpath, 'trajectory', dict_hash(meta) + '.pkl.gz')
-    # if not os.path.exists(final_filename):
-    #     return False
+def get_word_cloud_panel_filepath(trajectory_hash: str, max_word_count: int, bucket: int) -> str:
+    """
+    Parameters
+    ----------
+    trajectory_hash: `str`, required
+        The hash of the trajectory of the request, from :func:`get_processed_word_clouds_trajectory_hash`.
 
-    logger.info("3) finding word clouds...")
-    word_clouds_filepath = os.path.join(cache_folderpath, 'word_clouds', f"{trajectory_hash}-word_clouds.pkl.gz")
-    if not os.path.exists(word_clouds_filepath):
-        return False
+    max_word_count: `int`, required
+        The maximum number of words to include in the word cloud
+
+    bucket: `int`, required
+        The index of the timespan.
 
-    return True
+    Returns
+    -------
+    `str`: The path to the compressed figure JSON of the word cloud of the timespan, from
+    :func:`app.libraries.utilities.plotly.write_figure_payload`, or `None` if there is no such panel. The panels are
+    looked up by the hash resolved once by the page, so fetching one does not re-resolve the partitions.
+    """
+    if not all([e in '0123456789abcdef' for e in trajectory_hash]) or bucket < 0:
+        return None
+    panel_filepath = os.path.join(
+        get_word_clouds_folderpath(trajectory_hash=trajectory_hash, max_word_count=max_word_count), f"{bucket}.json.gz")
+    if not os.path.exists(panel_filepath):
+        return None
+    return panel_filepath
 
 
 def get_word_cloud_data(
@@ -211,7 +360,8 @@ def get_word_cloud_data(
 
     Returns
     -------
-    The data for the plot
+    The plotly figure JSON of the word cloud of every timespan, which are also cached one file per timespan to be
+    served by :func:`get_word_cloud_panel_filepath`, and the timespans.
     """
     logger.info("1) getting filepaths...")
     tweet_filepaths = get_tweet_filepaths()
@@ -222,96 +372,38 @@ def get_word_cloud_data(
 
     timespans = [f'{e[0]} -> {e[1]}' for e in get_timespan_partition_for_trajectory(trajectory)]
 
-    trajectory_hash = dict_hash(dict(
-        tweet_filepaths=tweet_filepaths,
-        trajectory=trajectory,
-    ))
+    partitions = get_trajectory_partitions(trajectory=trajectory, tweet_filepaths=tweet_filepaths)
+    trajectory_hash = get_trajectory_hash(trajectory, get_partitions_version(partitions))
 
-    word_clouds_filepath = os.path.join(cache_folderpath, 'word_clouds', f"{trajectory_hash}-word_clouds.pkl.gz")
-    if os.path.exists(word_clouds_filepath):
+    word_clouds_folderpath = get_word_clouds_folderpath(trajectory_hash=trajectory_hash, max_word_count=max_word_count)
+    if os.path.exists(os.path.join(word_clouds_folderpath, 'meta.pkl.gz')):
         try:
-            with gzip.open(word_clouds_filepath, 'rb') as handle:
-                word_clouds = pickle.load(handle)
+            word_clouds = []
+            for bucket in range(len(timespans)):
+                word_clouds.append(read_figure_payload(os.path.join(word_clouds_folderpath, f"{bucket}.json.gz")))
             return word_clouds, timespans
         except Exception as e:
-            logger.error(f"failed to load the file located in {word_clouds_filepath}, re-creating it...\n\t error: {e}")
-
-    # - preparing the topic models based on support
-    pipeline_args = dict(
-        number_of_topics_for_lda=2,
-                         autoencoder=None,
-        representation_clustering=None,
-        use_transformer=False,
-        use_lda=True,
-        use_tfidf=False,
-        device=torch.device('cpu'),
-        transformer_modelname='paraphrase-mpnet-base-v2',
-        text_processor=TextProcessor(
-         methods=[
-             'remove_url',
-             'convert_to_lowercase',
-             'uppercase_based_missing_delimiter_fix',
-             # 'gtlt_normalize',
-             # 'substitute_more_than_two_letter_repetition_with_one',
-             'non_character_repetition_elimination',
-             # 'use_star_as_delimiter',
-             # 'remove_parantheses_and_their_contents',
-             'remove_questionexlamation_in_brackets',
-             'eliminate_phrase_repetition',
-             'strip'
-         ]
-        ),
-        token_processor_light=TokenProcessor(
-         methods=[
-             'keep_alphabetics_only',
-             # 'keep_nouns_only',
-             # 'spell_check_and_typo_fix',
-             # 'stem_words',
-             # 'remove_stopwords'
-         ]
-        ),
-        token_processor_heavy=TokenProcessor(
-         methods=[
-             'keep_alphabetics_only',
-             # 'keep_nouns_only',
-             # 'spell_check_and_typo_fix',
-             # 'stem_words',
-             # 'remove_stopwords'
-         ]
-    ))
-
-    logger.info("2) preparing query trajectory dataset...")
-    data, meta = prepare_trajectory_dataset(
-        trajectory=trajectory,
-        tweet_filepaths=tweet_filepaths,
-        overwrite=False
-    )
+            logger.error(f"failed to load the word clouds located in {word_clouds_folderpath}, re-creating them...\n\t error: {e}")
 
-    pipeline = TransformerLDATopicModelingPipeline(
-        **pipeline_args
-    )
+    logger.info("2) finding the word frequencies of every timespan...")
+    bucket_word_frequencies = get_bucket_word_frequencies(
+        trajectory=trajectory,
+        partitions=partitions,
+        bucket_count=len(timespans),
+        max_word_count=max_word_count)
 
     logger.info("3) finding word clouds...")
-    word_clouds_filepath = os.path.join(cache_folderpath, 'word_clouds', f"{trajectory_hash}-word_clouds.pkl.gz")
-    # if os.path.exists(word_clouds_filepath):
-    #     with gzip.open(word_clouds_filepath, 'rb') as handle:
-    #         word_clouds = pickle.load(handle)
-    # else:
-    word_clouds = []
-    for tmp_query_data in tqdm(data):
-        query_preprocessed_text_list, query_preprocessed_tokens_list, query_indices = pipeline.preprocess_and_get_text_and_tokens(
-            text_list=[e for e in tmp_query_data.tweet.tolist() if isinstance(e, str)],
-            verbose=0
-        )
-        if len(query_preprocessed_text_list) == 0:
-            word_clouds.append(
-                plotly_wordcloud(' '.join(['NONE']), max_words=max_word_count)
-            )
-        else:
-            word_clouds.append(
-                plotly_wordcloud(' '.join(query_preprocessed_text_list), max_words=max_word_count)
-            )
-    with gzip.open(word_clouds_filepath, 'wb') as handle:
-        pickle.dump(word_clouds, handle)
+    figs = [
+        plotly_wordcloud(layout)
+        for layout in get_word_cloud_layouts(
+            bucket_word_frequencies=[e if len(e) > 0 else {'NONE': 1} for e in bucket_word_frequencies],
+            max_word_count=max_word_count)]
+
+    # - the meta is written last, marking the panels as complete
+    os.makedirs(word_clouds_folderpath, exist_ok=True)
+    for bucket, fig in enumerate(figs):
+        write_figure_payload(fig=fig, filepath=os.path.join(word_clouds_folderpath, f"{bucket}.json.gz"))
+    word_clouds = [fig.to_json() for fig in figs]
+    write_pkl_gz(dict(timespans=timespans, max_word_count=max_word_count), os.path.join(word_clouds_folderpath, 'meta.pkl.gz'))
 
     return word_clouds, timespans
@@ -0,0 +1,589 @@
+import os
+import bisect
+import fnmatch
+import threading
+from collections import Counter
+from typing import List, Any, Dict, Tuple, Set
+import numpy
+from tqdm import tqdm
+from fame.topic_modeling.cortex.pipeline.bert_lda import TransformerLDATopicModelingPipeline
+
+from app import cache_folderpath, ngram_min_count, wildcard_max_expansions
+from app.libraries.io.read_write import read_pkl_gz, write_versioned_arrays, read_versioned_arrays
+from app.libraries.randomization.hashing import dict_hash
+from app.libraries.io.tweet_store import group_tweet_filepaths_by_handle, get_ingested_partitions
+from app.libraries.preprocessing.utilities import get_pipeline, get_preprocessing_hash
+from app.libraries.trajectory.partitions import get_partition_piece, get_partition_piece_filepath, \
+    get_preprocessed_partition, preprocess_partitions, get_days, get_bucket_indices_for_days
+from app.libraries.utilities.logging import get_logger
+logger = get_logger(__name__)
+
+count_cube_folderpath = os.path.join(cache_folderpath, 'count_cube')
+
+# - the process-wide copy of the latest count cube, see :func:`read_count_cube`
+count_cube = dict(signature=None, cube=None)
+count_cube_lock = threading.Lock()
+
+# - the orders of the n-grams counted besides the words, so that phrases can be queried
+ngram_orders = [2, 3]
+
+
+def normalize_query_term(term: str) -> str:
+    return ' '.join(term.split())
+
+
+def is_phrase(term: str) -> bool:
+    return ' ' in normalize_query_term(term)
+
+
+def is_wildcard(term: str) -> bool:
+    return '*' in term or '?' in term
+
+
+def expand_query_term(
+        vocabulary: List[str],
+        term: str,
+        term_totals: numpy.ndarray = None,
+        max_expansions: int = None
+) -> List[int]:
+    """
+    Parameters
+    ----------
+    vocabulary: `List[str]`, required
+        The sorted vocabulary.
+
+    term: `str`, required
+        The query term, which may include the `*` and `?` wildcards (e.g. `vaccin*`).
+
+    term_totals: `numpy.ndarray`, optional (default=None)
+        The total count of every term of the vocabulary, used to keep the most frequent expansions.
+
+    max_expansions: `int`, optional (default=None)
+        The maximum number of terms a wildcard expands to, `WILDCARD_MAX_EXPANSIONS` if `None`.
+
+    Returns
+    -------
+    `List[int]`: The indices of the matching terms in the vocabulary. The terms sharing the literal prefix of a
+    wildcard are found by bisection, and only those are matched against the pattern. A pattern without a space only
+    matches words, and a pattern starting with a wildcard (e.g. a bare `*`) matches nothing.
+    """
+    term = normalize_query_term(term)
+    if not is_wildcard(term):
+        i = bisect.bisect_left(vocabulary, term)
+        return [i] if i < len(vocabulary) and vocabulary[i] == term else []
+
+    prefix = term[:min([term.index(e) for e in '*?' if e in term])]
+    if len(prefix) == 0:
+        logger.warning(f"the query term {term} has no literal prefix, ignoring it.")
+        return []
+    start = bisect.bisect_left(vocabulary, prefix)
+    end = bisect.bisect_left(vocabulary, prefix + '\U0010ffff')
+    # - the wildcards match within a word, so a single-word pattern never expands to the n-grams
+    is_single_word = not is_phrase(term)
+    matches = [
+        i for i in range(start, end)
+        if (not is_single_word or ' ' not in vocabulary[i]) and fnmatch.fnmatchcase(vocabulary[i], term)]
+    return select_frequent_expansions(term, matches, term_totals=term_totals, max_expansions=max_expansions)
+
+
+def select_frequent_expansions(
+        term: str,
+        matches: List[int],
+        term_totals: Any = None,
+        max_expansions: int = None
+) -> List[int]:
+    """
+    Parameters
+    ----------
+    term: `str`, required
+        The wildcard query term.
+
+    matches: `List[int]`, required
+        The sorted indices of the terms of a sorted vocabulary that the query term matches.
+
+    term_totals: `Any`, optional (default=None)
+        The total count of the terms, indexed by their indices (e.g. a `numpy.ndarray` or a `Dict[int, int]`).
+
+    max_expansions: `int`, optional (default=None)
+        The maximum number of terms a wildcard expands to, `WILDCARD_MAX_EXPANSIONS` if `None`.
+
+    Returns
+    -------
+    `List[int]`: The sorted indices of the (at most `max_expansions`) most frequent matches, the ties being broken by
+    the order of the vocabulary.
+    """
+    max_expansions = wildcard_max_expansions if max_expansions is None else max_expansions
+    if len(matches) > max_expansions:
+        logger.warning(f"the query term {term} matches {len(matches)} terms, keeping the {max_expansions} most frequent ones.")
+        if term_totals is not None:
+            matches = sorted(matches, key=lambda i: -term_totals[i])
+        matches = sorted(matches[:max_expansions])
+    return matches
+
+
+def get_query_term_counts(freqs: List[Dict[str, int]], query_terms: List[str]) -> numpy.ndarray:
+    """
+    Parameters
+    ----------
+    freqs: `List[Dict[str, int]]`, required
+        The term (word or n-gram) counts of each timespan of a trajectory.
+
+    query_terms: `List[str]`, required
+        The terms to query, where the wildcards are expanded over the terms of the trajectory, keeping their most
+        frequent expansions within it as :func:`get_count_cube_counts` does.
+
+    Returns
+    -------
+    `numpy.ndarray`: The total count of the query terms in each timespan.
+    """
+    query_terms = [normalize_query_term(e) for e in query_terms]
+    terms = set([e for e in query_terms if not is_wildcard(e)])
+    if any([is_wildcard(e) for e in query_terms]):
+        totals = Counter()
+        for freq in freqs:
+            totals.update(freq)
+        vocabulary = sorted(totals.keys())
+        term_totals = numpy.array([totals[e] for e in vocabulary], dtype=numpy.int64)
+        for term in query_terms:
+            if is_wildcard(term):
+                terms.update([vocabulary[i] for i in expand_query_term(vocabulary, term, term_totals=term_totals)])
+    return numpy.array([sum([freq.get(e, 0) for e in terms]) for freq in freqs], dtype=numpy.int64)
+
+
+def get_partition_daily_word_frequencies_key(preprocessing_hash: str, partition: Tuple[str, str, str]) -> Dict[str, Any]:
+    return dict(partition=list(partition), preprocessing=preprocessing_hash)
+
+
+def get_partition_daily_ngram_frequencies_key(preprocessing_hash: str, partition: Tuple[str, str, str]) -> Dict[str, Any]:
+    return dict(
+        partition=list(partition), preprocessing=preprocessing_hash, ngram_orders=ngram_orders, ngram_min_count=ngram_min_count)
+
+
+def get_partition_daily_word_frequencies(
+        pipeline: TransformerLDATopicModelingPipeline,
+        preprocessing_hash: str,
+        partition: Tuple[str, str, str]
+) -> Dict[numpy.datetime64, Dict[str, int]]:
+    """
+    Parameters
+    ----------
+    pipeline: `TransformerLDATopicModelingPipeline`, required
+        The pipeline whose processors are used for the preprocessing.
+
+    preprocessing_hash: `str`, required
+        The fingerprint of the processors of the pipeline.
+
+    partition: `Tuple[str, str, str]`, required
+        The `(handle, month, fingerprint)` of the tweet store partition.
+
+    Returns
+    -------
+    `Dict[numpy.datetime64, Dict[str, int]]`: The word counts of the partition per day. These do not depend on the
+    requested range or time-step, so any trajectory overlapping the partition reuses them.
+    """
+    def compute():
+        corpus = get_preprocessed_partition(pipeline=pipeline, preprocessing_hash=preprocessing_hash, partition=partition)
+        days = get_days(corpus.dates)
+        return {day: corpus.get_term_counts(rows=numpy.flatnonzero(days == day)) for day in numpy.unique(days)}
+
+    return get_partition_piece(
+        namespace='word_frequencies',
+        key=get_partition_daily_word_frequencies_key(preprocessing_hash, partition),
+        compute=compute)
+
+
+def get_partition_daily_ngram_frequencies(
+        pipeline: TransformerLDATopicModelingPipeline,
+        preprocessing_hash: str,
+        partition: Tuple[str, str, str]
+) -> Dict[numpy.datetime64, Dict[str, int]]:
+    """
+    Parameters
+    ----------
+    pipeline: `TransformerLDATopicModelingPipeline`, required
+        The pipeline whose processors are used for the preprocessing.
+
+    preprocessing_hash: `str`, required
+        The fingerprint of the processors of the pipeline.
+
+    partition: `Tuple[str, str, str]`, required
+        The `(handle, month, fingerprint)` of the tweet store partition.
+
+    Returns
+    -------
+    `Dict[numpy.datetime64, Dict[str, int]]`: The counts of the :obj:`ngram_orders` n-grams (space-joined words)
+    of the partition per day. The n-grams seen less than `NGRAM_MIN_COUNT` times in the partition are pruned, so the
+    count cube and the queries outside of it count the same phrases.
+    """
+    def compute():
+        corpus = get_preprocessed_partition(pipeline=pipeline, preprocessing_hash=preprocessing_hash, partition=partition)
+        output = dict()
+        for day, words in zip(get_days(corpus.dates).tolist(), corpus.get_sequences(stream='words')):
+            counts = output.setdefault(numpy.datetime64(day, 'D'), Counter())
+            for n in ngram_orders:
+                counts.update([' '.join(words[i:i + n]) for i in range(len(words) - n + 1)])
+        totals = sum(output.values(), Counter())
+        return {k: {e: c for e, c in v.items() if totals[e] >= ngram_min_count} for k, v in output.items()}
+
+    return get_partition_piece(
+        namespace='word_frequencies',
+        key=get_partition_daily_ngram_frequencies_key(preprocessing_hash, partition),
+        compute=compute)
+
+
+def preprocess_uncounted_partitions(
+        pipeline: TransformerLDATopicModelingPipeline,
+        preprocessing_hash: str,
+        partitions: List[Tuple[str, str, str]],
+        words: bool = True,
+        ngrams: bool = False
+) -> None:
+    """
+    Preprocessing the partitions whose per-day counts are not cached yet over a single process pool, see
+    :func:`app.libraries.trajectory.partitions.preprocess_partitions`.
+
+    Parameters
+    ----------
+    pipeline: `TransformerLDATopicModelingPipeline`, required
+        The pipeline whose processors are used for the preprocessing.
+
+    preprocessing_hash: `str`, required
+        The fingerprint of the processors of the pipeline.
+
+    partitions: `List[Tuple[str, str, str]]`, required
+        The `(handle, month, fingerprint)` of the tweet store partitions.
+
+    words: `bool`, optional (default=True)
+        Whether the per-day word counts are to be read.
+
+    ngrams: `bool`, optional (default=False)
+        Whether the per-day n-gram counts are to be read.
+    """
+    get_keys = [get_partition_daily_word_frequencies_key] * words + [get_partition_daily_ngram_frequencies_key] * ngrams
+    preprocess_partitions(
+        pipeline=pipeline,
+        preprocessing_hash=preprocessing_hash,
+        partitions=[
+            e for e in partitions
+            if not all([os.path.exists(get_partition_piece_filepath(namespace='word_frequencies', key=get_key(preprocessing_hash, e)))
+                        for get_key in get_keys])])
+
+
+def get_phrase_counts(
+        pipeline: TransformerLDATopicModelingPipeline,
+        preprocessing_hash: str,
+        partitions: List[Tuple[str, str, str]],
+        trajectory: Dict[str, Any],
+        phrases: List[str],
+        bucket_count: int
+) -> numpy.ndarray:
+    """
+    Parameters
+    ----------
+    pipeline: `TransformerLDATopicModelingPipeline`, required
+        The pipeline whose processors are used for the preprocessing.
+
+    preprocessing_hash: `str`, required
+        The fingerprint of the processors of the pipeline.
+
+    partitions: `List[Tuple[str, str, str]]`, required
+        The `(handle, month, fingerprint)` of the partitions of the trajectory.
+
+    trajectory: `Dict[str, Any]`, required
+        The query trajectory.
+
+    phrases: `List[str]`, required
+        The multi-word query terms, which may include wildcards (e.g. `public heal*`).
+
+    bucket_count: `int`, required
+        The number of timespans of the trajectory.
+
+    Returns
+    -------
+    `numpy.ndarray`: The total count of the phrases in every timespan of the trajectory, looked up in the (cached)
+    per-day n-gram counts of the partitions, over which the wildcard phrases are expanded.
+    """
+    if len(phrases) == 0:
+        return numpy.zeros(bucket_count, dtype=numpy.int64)
+    preprocess_uncounted_partitions(
+        pipeline=pipeline, preprocessing_hash=preprocessing_hash, partitions=partitions, words=False, ngrams=True)
+    ngram_freqs = [Counter() for _ in range(bucket_count)]
+    for partition in partitions:
+        daily_ngram_freqs = get_partition_daily_ngram_frequencies(
+            pipeline=pipeline, preprocessing_hash=preprocessing_hash, partition=partition)
+        days = list(daily_ngram_freqs.keys())
+        for day, bucket in zip(days, get_bucket_indices_for_days(days=days, trajectory=trajectory).tolist()):
+            if bucket >= 0:
+                ngram_freqs[bucket].update(daily_ngram_freqs[day])
+    return get_query_term_counts(ngram_freqs, phrases)
+
+
+def get_count_cube_folderpath(preprocessing_hash: str) -> str:
+    return os.path.join(count_cube_folderpath, preprocessing_hash)
+
+
+def build_count_cube(tweet_filepaths: List[str]) -> None:
+    """
+    Building the sparse `(handle, day) x term` count matrix of the preprocessed words (and their frequent n-grams) of
+    every ingested handle, from the per-day word and n-gram counts of the tweet store partitions (which are cached, so
+    only the changed partitions are preprocessed). The matrix is stored by term (CSC), with the terms sorted, in
+    `cache/count_cube/<preprocessing hash>/`, along with the `(handle, month, fingerprint)` of the partitions it covers.
+    The word counts are also stored by row (CSR), so that the top words of a range only read the rows of its days.
+
+    Parameters
+    ----------
+    tweet_filepaths: `List[str]`, required
+        The list of tweet filepaths.
+    """
+    pipeline = get_pipeline()
+    preprocessing_hash = get_preprocessing_hash()
+    handles = sorted(group_tweet_filepaths_by_handle(tweet_filepaths).keys())
+
+    partitions = get_ingested_partitions(handles)
+    version = dict_hash(dict(
+        preprocessing=preprocessing_hash,
+        partitions=[list(e) for e in partitions],
+        ngram_orders=ngram_orders,
+        ngram_min_count=ngram_min_count,
+        word_rows=True))
+    folderpath = get_count_cube_folderpath(preprocessing_hash)
+    meta_filepath = os.path.join(folderpath, 'meta.pkl.gz')
+    if os.path.exists(meta_filepath) and read_pkl_gz(meta_filepath)['version'] == version:
+        logger.info("the count cube is up-to-date.")
+        return
+
+    preprocess_uncounted_partitions(
+        pipeline=pipeline, preprocessing_hash=preprocessing_hash, partitions=partitions, words=True, ngrams=True)
+
+    handle_index = {e: i for i, e in enumerate(handles)}
+    term_index = dict()
+    row_handles, row_days, entry_rows, entry_terms, entry_counts = [], [], [], [], []
+    for partition in tqdm(partitions):
+        daily_word_freqs = get_partition_daily_word_frequencies(
+            pipeline=pipeline, preprocessing_hash=preprocessing_hash, partition=partition)
+        daily_ngram_freqs = get_partition_daily_ngram_frequencies(
+            pipeline=pipeline, preprocessing_hash=preprocessing_hash, partition=partition)
+
+        # - the entries of the partition are moved into compact arrays before the next partition is read
+        partition_rows, partition_terms, partition_counts = [], [], []
+        for day in sorted(daily_word_freqs.keys()):
+            row = len(row_handles)
+            row_handles.append(handle_index[partition[0]])
+            row_days.append(day)
+            for term_freqs in [daily_word_freqs[day], daily_ngram_freqs.get(day, dict())]:
+                partition_rows += [row] * len(term_freqs)
+                partition_terms += [term_index.setdefault(e, len(term_index)) for e in term_freqs.keys()]
+                partition_counts += list(term_freqs.values())
+        entry_rows.append(numpy.array(partition_rows, dtype=numpy.int32))
+        entry_terms.append(numpy.array(partition_terms, dtype=numpy.int32))
+        entry_counts.append(numpy.array(partition_counts, dtype=numpy.int32))
+
+    entry_rows = numpy.concatenate(entry_rows + [numpy.array([], dtype=numpy.int32)])
+    entry_terms = numpy.concatenate(entry_terms + [numpy.array([], dtype=numpy.int32)])
+    entry_counts = numpy.concatenate(entry_counts + [numpy.array([], dtype=numpy.int32)])
+
+    # - sorting the vocabulary, so that prefixes can be expanded by bisection
+    vocabulary = sorted(term_index.keys())
+    term_ids = numpy.zeros(len(term_index), dtype=numpy.int32)
+    term_ids[numpy.array([term_index[e] for e in vocabulary], dtype=numpy.int64)] = numpy.arange(len(vocabulary), dtype=numpy.int32)
+    entry_terms = term_ids[entry_terms]
+    order = numpy.argsort(entry_terms, kind='stable')
+    term_offsets = numpy.zeros(len(vocabulary) + 1, dtype=numpy.int64)
+    numpy.cumsum(numpy.bincount(entry_terms, minlength=len(vocabulary)), out=term_offsets[1:])
+
+    # - the word (not n-gram) entries by row (CSR), in which the entries of a row are contiguous since the rows are
+    # appended in order
+    is_word_entry = numpy.array([' ' not in e for e in vocabulary], dtype=bool)[entry_terms]
+    word_row_offsets = numpy.zeros(len(row_handles) + 1, dtype=numpy.int64)
+    numpy.cumsum(numpy.bincount(entry_rows[is_word_entry], minlength=len(row_handles)), out=word_row_offsets[1:])
+
+    write_versioned_arrays(
+        folderpath=folderpath,
+        meta=dict(version=version, handles=handles, vocabulary=vocabulary, partitions=partitions),
+        arrays=dict(
+            term_offsets=term_offsets,
+            term_totals=numpy.bincount(entry_terms, weights=entry_counts, minlength=len(vocabulary)).astype(numpy.int64),
+            entry_rows=entry_rows[order],
+            entry_counts=entry_counts[order],
+            word_row_offsets=word_row_offsets,
+            word_row_terms=entry_terms[is_word_entry],
+            word_row_counts=entry_counts[is_word_entry],
+            row_handles=numpy.array(row_handles, dtype=numpy.int32),
+            row_days=numpy.array(row_days, dtype='datetime64[D]')))
+    logger.info(f"built the count cube of {len(partitions)} partitions and {len(vocabulary)} terms.")
+
+
+def read_count_cube(preprocessing_hash: str) -> Dict[str, Any]:
+    """
+    Parameters
+    ----------
+    preprocessing_hash: `str`, required
+        The fingerprint of the processors the words are preprocessed with.
+
+    Returns
+    -------
+    `Dict[str, Any]`: The latest count cube, with its arrays memory-mapped, or `None` if it has not been built. It is
+    kept in memory and only re-loaded when it is re-built.
+    """
+    meta_filepath = os.path.join(get_count_cube_folderpath(preprocessing_hash), 'meta.pkl.gz')
+    if not os.path.exists(meta_filepath):
+        return None
+    stat = os.stat(meta_filepath)
+    signature = (preprocessing_hash, stat.st_size, stat.st_mtime_ns)
+    with count_cube_lock:
+        if count_cube['signature'] == signature:
+            return count_cube['cube']
+        try:
+            cube = read_versioned_arrays(get_count_cube_folderpath(preprocessing_hash))
+        except Exception as e:
+            logger.error(f"failed to load the count cube located in {meta_filepath} - error: {e}")
+            return None
+        cube['partitions'] = set(cube['partitions'])
+        count_cube.update(signature=signature, cube=cube)
+        return cube
+
+
+def is_covered_by_count_cube(partitions: List[Tuple[str, str, str]]) -> bool:
+    """
+    Parameters
+    ----------
+    partitions: `List[Tuple[str, str, str]]`, required
+        The `(handle, month, fingerprint)` of the partitions of a trajectory.
+
+    Returns
+    -------
+    `bool`: Whether the count cube has been built over all of the given partitions.
+    """
+    cube = read_count_cube(get_preprocessing_hash())
+    return cube is not None and all([tuple(e) in cube['partitions'] for e in partitions])
+
+
+def get_count_cube_counts(
+        trajectory: Dict[str, Any],
+        partitions: List[Tuple[str, str, str]],
+        query_terms: List[str],
+        bucket_count: int
+) -> numpy.ndarray:
+    """
+    Parameters
+    ----------
+    trajectory: `Dict[str, Any]`, required
+        The query trajectory.
+
+    partitions: `List[Tuple[str, str, str]]`, required
+        The `(handle, month, fingerprint)` of the partitions of the trajectory.
+
+    query_terms: `List[str]`, required
+        The terms to query.
+
+    bucket_count: `int`, required
+        The number of timespans of the trajectory.
+
+    Returns
+    -------
+    `numpy.ndarray`: The total count of the query terms in every timespan of the trajectory, sliced from the count
+    cube, or `None` if the count cube does not cover all the given partitions.
+    """
+    if not is_covered_by_count_cube(partitions):
+        return None
+    cube = read_count_cube(get_preprocessing_hash())
+
+    vocabulary = cube['vocabulary']
+    handle_index = {e: i for i, e in enumerate(cube['handles'])}
+    handle_mask = numpy.zeros(len(cube['handles']), dtype=bool)
+    handle_mask[[handle_index[e[0]] for e in partitions]] = True
+
+    # - gathering the entries of every term that the query terms match, within the trajectory
+    candidates = [expand_query_term(vocabulary, e, max_expansions=len(vocabulary)) for e in query_terms]
+    candidate_ids = numpy.unique(numpy.array([i for e in candidates for i in e], dtype=numpy.int64))
+    term_offsets = numpy.asarray(cube['term_offsets'])
+    lengths = term_offsets[candidate_ids + 1] - term_offsets[candidate_ids]
+    positions = numpy.repeat(term_offsets[candidate_ids] - numpy.cumsum(lengths) + lengths, lengths) + \
+        numpy.arange(lengths.sum(), dtype=numpy.int64)
+    entry_terms = numpy.repeat(numpy.arange(len(candidate_ids)), lengths)
+    rows = numpy.asarray(cube['entry_rows'])[positions]
+    counts = numpy.asarray(cube['entry_counts'])[positions]
+    buckets = numpy.full(len(rows), -1, dtype=numpy.int64)
+    keep = handle_mask[numpy.asarray(cube['row_handles'])[rows]]
+    buckets[keep] = get_bucket_indices_for_days(days=numpy.asarray(cube['row_days'])[rows[keep]], trajectory=trajectory)
+    keep = buckets >= 0
+
+    # - the wildcards keep their most frequent expansions within the trajectory, as outside of the count cube
+    candidate_totals = numpy.bincount(entry_terms[keep], weights=counts[keep], minlength=len(candidate_ids))
+    term_totals = dict(zip(candidate_ids.tolist(), candidate_totals.tolist()))
+    selected = set()
+    for term, matches in zip(query_terms, candidates):
+        selected.update(select_frequent_expansions(term, matches, term_totals=term_totals))
+    keep &= numpy.isin(candidate_ids, list(selected))[entry_terms]
+    return numpy.bincount(buckets[keep], weights=counts[keep], minlength=bucket_count).astype(numpy.int64)
+
+
+def get_count_cube_top_words(
+        trajectory: Dict[str, Any],
+        partitions: List[Tuple[str, str, str]],
+        bucket_count: int,
+        top_n: int,
+        excluded_words: Set[str] = None
+) -> List[Dict[str, int]]:
+    """
+    Parameters
+    ----------
+    trajectory: `Dict[str, Any]`, required
+        The query trajectory.
+
+    partitions: `List[Tuple[str, str, str]]`, required
+        The `(handle, month, fingerprint)` of the partitions of the trajectory.
+
+    bucket_count: `int`, required
+        The number of timespans of the trajectory.
+
+    top_n: `int`, required
+        The number of words to keep per timespan.
+
+    excluded_words: `Set[str]`, optional (default=None)
+        The words to leave out (e.g. stopwords).
+
+    Returns
+    -------
+    `List[Dict[str, int]]`: The counts of the most frequent words (not n-grams) of every timespan of the trajectory,
+    or `None` if the count cube does not cover all the given partitions. Only the rows (days) of the trajectory are
+    read from the row-major copy of the word counts.
+    """
+    if not is_covered_by_count_cube(partitions):
+        return None
+    cube = read_count_cube(get_preprocessing_hash())
+    if 'word_row_offsets' not in cube['arrays']:
+        # - a count cube built before the word counts were stored by row, until the next ingestion re-builds it
+        return None
+    vocabulary = cube['vocabulary']
+    excluded_words = set() if excluded_words is None else excluded_words
+
+    handle_index = {e: i for i, e in enumerate(cube['handles'])}
+    handle_mask = numpy.zeros(len(cube['handles']), dtype=bool)
+    handle_mask[[handle_index[e[0]] for e in partitions]] = True
+    row_buckets = get_bucket_indices_for_days(days=numpy.asarray(cube['row_days']), trajectory=trajectory)
+    rows = numpy.flatnonzero((row_buckets >= 0) & handle_mask[numpy.asarray(cube['row_handles'])])
+
+    # - gathering the word entries of the rows of the trajectory only
+    word_row_offsets = numpy.asarray(cube['word_row_offsets'])
+    lengths = word_row_offsets[rows + 1] - word_row_offsets[rows]
+    positions = numpy.repeat(word_row_offsets[rows] - numpy.cumsum(lengths) + lengths, lengths) + \
+        numpy.arange(lengths.sum(), dtype=numpy.int64)
+    entry_terms = numpy.asarray(cube['word_row_terms'])[positions].astype(numpy.int64)
+    entry_counts = numpy.asarray(cube['word_row_counts'])[positions]
+    entry_buckets = numpy.repeat(row_buckets[rows], lengths).astype(numpy.int64)
+    excluded_ids = numpy.array(
+        [i for i in [bisect.bisect_left(vocabulary, e) for e in excluded_words]
+         if i < len(vocabulary) and vocabulary[i] in excluded_words], dtype=numpy.int64)
+    keep = ~numpy.isin(entry_terms, excluded_ids)
+
+    # - summing the entries per (timespan, word), the timespans coming out contiguous and in order
+    keys, inverse = numpy.unique(entry_buckets[keep] * len(vocabulary) + entry_terms[keep], return_inverse=True)
+    totals = numpy.bincount(inverse, weights=entry_counts[keep], minlength=len(keys))
+    bounds = numpy.searchsorted(keys, numpy.arange(bucket_count + 1, dtype=numpy.int64) * len(vocabulary))
+
+    output = []
+    for start, end in zip(bounds[:-1].tolist(), bounds[1:].tolist()):
+        top = start + numpy.argsort(-totals[start:end], kind='stable')[:top_n]
+        output.append({vocabulary[e]: int(c) for e, c in zip((keys[top] % len(vocabulary)).tolist(), totals[top].tolist())})
+    return output
@@ -0,0 +1,247 @@
+import os
+import threading
+from typing import List, Any, Dict
+import numpy
+import pandas
+from tqdm import tqdm
+
+from app import cache_folderpath
+from app.libraries.io.read_write import read_pkl_gz, write_versioned_arrays, read_versioned_arrays
+from app.libraries.io.tweet_store import group_tweet_filepaths_by_handle, get_ingested_partitions, \
+    read_tweet_store_partition
+from app.libraries.randomization.hashing import dict_hash
+from app.libraries.preprocessing.utilities import get_pipeline, get_preprocessing_hash
+from app.libraries.trajectory.partitions import get_preprocessed_partition, preprocess_partitions, get_days
+from app.libraries.word_frequency.count_cube import expand_query_term
+from app.libraries.utilities.logging import get_logger
+logger = get_logger(__name__)
+
+postings_folderpath = os.path.join(cache_folderpath, 'postings')
+
+# - the process-wide copy of the latest postings index, see :func:`read_postings_index`
+postings_index = dict(signature=None, index=None)
+postings_index_lock = threading.Lock()
+
+
+def get_postings_folderpath(preprocessing_hash: str) -> str:
+    return os.path.join(postings_folderpath, preprocessing_hash)
+
+
+def build_postings_index(tweet_filepaths: List[str]) -> None:
+    """
+    Building the inverted index from every preprocessed word to the sorted list of the tweets it appears in. The
+    tweets (documents) are sorted by day, so that the tweets of a timespan are a contiguous range of the postings,
+    and their `id`, handle, day, month and engagement are kept along. The index is stored in
+    `cache/postings/<preprocessing hash>/`.
+
+    Parameters
+    ----------
+    tweet_filepaths: `List[str]`, required
+        The list of tweet filepaths.
+    """
+    pipeline = get_pipeline()
+    preprocessing_hash = get_preprocessing_hash()
+    handles = sorted(group_tweet_filepaths_by_handle(tweet_filepaths).keys())
+    partitions = get_ingested_partitions(handles)
+    version = dict_hash(dict(preprocessing=preprocessing_hash, partitions=[list(e) for e in partitions]))
+    folderpath = get_postings_folderpath(preprocessing_hash)
+    meta_filepath = os.path.join(folderpath, 'meta.pkl.gz')
+    if os.path.exists(meta_filepath) and read_pkl_gz(meta_filepath)['version'] == version:
+        logger.info("the postings index is up-to-date.")
+        return
+
+    preprocess_partitions(pipeline=pipeline, preprocessing_hash=preprocessing_hash, partitions=partitions)
+    handle_index = {e: i for i, e in enumerate(handles)}
+    months = sorted(set([e[1] for e in partitions]))
+    month_index = {e: i for i, e in enumerate(months)}
+    term_index = dict()
+    doc_ids, doc_handles, doc_months, doc_days, doc_engagements, posting_terms, posting_docs = [], [], [], [], [], [], []
+    doc_count = 0
+    for partition in tqdm(partitions):
+        handle, month, _ = partition
+        corpus = get_preprocessed_partition(pipeline=pipeline, preprocessing_hash=preprocessing_hash, partition=partition)
+        df = read_tweet_store_partition(
+            handle=handle, month=month, columns=['id', 'replies_count', 'retweets_count', 'likes_count'])
+        df = df.drop_duplicates(subset='id').set_index('id').reindex(numpy.asarray(corpus.ids)).fillna(0)
+        doc_ids.append(numpy.asarray(corpus.ids))
+        doc_handles.append(numpy.full(len(corpus), handle_index[handle], dtype=numpy.int32))
+        doc_months.append(numpy.full(len(corpus), month_index[month], dtype=numpy.int32))
+        doc_days.append(get_days(corpus.dates))
+        doc_engagements.append((df.replies_count + df.retweets_count + df.likes_count).to_numpy(dtype=numpy.int64))
+
+        # - the distinct (document, word) pairs of the partition
+        offsets = numpy.asarray(corpus.offsets['words'])
+        local_docs = numpy.repeat(numpy.arange(len(corpus), dtype=numpy.int64), numpy.diff(offsets))
+        pairs = numpy.unique(local_docs * max(len(corpus.vocabulary), 1) + numpy.asarray(corpus.values['words']))
+        local_terms = numpy.array([term_index.setdefault(e, len(term_index)) for e in corpus.vocabulary], dtype=numpy.int64)
+        posting_terms.append(local_terms[pairs % max(len(corpus.vocabulary), 1)] if len(pairs) > 0 else pairs)
+        posting_docs.append(pairs // max(len(corpus.vocabulary), 1) + doc_count)
+        doc_count += len(corpus)
+
+    def concatenate(arrays: List[numpy.ndarray], dtype: Any) -> numpy.ndarray:
+        return numpy.concatenate([numpy.asarray(e, dtype=dtype) for e in arrays] + [numpy.array([], dtype=dtype)])
+
+    doc_days = concatenate(doc_days, 'datetime64[D]')
+    doc_order = numpy.argsort(doc_days, kind='stable')
+    doc_ranks = numpy.empty(len(doc_order), dtype=numpy.int64)
+    doc_ranks[doc_order] = numpy.arange(len(doc_order))
+
+    vocabulary = sorted(term_index.keys())
+    term_ids = numpy.zeros(len(term_index), dtype=numpy.int64)
+    term_ids[numpy.array([term_index[e] for e in vocabulary], dtype=numpy.int64)] = numpy.arange(len(vocabulary))
+    posting_terms = term_ids[concatenate(posting_terms, numpy.int64)]
+    posting_docs = doc_ranks[concatenate(posting_docs, numpy.int64)]
+    order = numpy.lexsort((posting_docs, posting_terms))
+    term_offsets = numpy.zeros(len(vocabulary) + 1, dtype=numpy.int64)
+    numpy.cumsum(numpy.bincount(posting_terms, minlength=len(vocabulary)), out=term_offsets[1:])
+
+    write_versioned_arrays(
+        folderpath=folderpath,
+        meta=dict(version=version, handles=handles, months=months, vocabulary=vocabulary, partitions=partitions),
+        arrays=dict(
+            term_offsets=term_offsets,
+            term_totals=numpy.diff(term_offsets),
+            posting_docs=posting_docs[order].astype(numpy.int32),
+            doc_ids=concatenate(doc_ids, numpy.int64)[doc_order],
+            doc_handles=concatenate(doc_handles, numpy.int32)[doc_order],
+            doc_months=concatenate(doc_months, numpy.int32)[doc_order],
+            doc_days=doc_days[doc_order],
+            doc_engagements=concatenate(doc_engagements, numpy.int64)[doc_order]))
+    logger.info(f"built the postings index of {len(doc_order)} tweets and {len(vocabulary)} terms.")
+
+
+def read_postings_index(preprocessing_hash: str) -> Dict[str, Any]:
+    """
+    Parameters
+    ----------
+    preprocessing_hash: `str`, required
+        The fingerprint of the processors the words are preprocessed with.
+
+    Returns
+    -------
+    `Dict[str, Any]`: The latest postings index, with its arrays memory-mapped, or `None` if it has not been built.
+    """
+    meta_filepath = os.path.join(get_postings_folderpath(preprocessing_hash), 'meta.pkl.gz')
+    if not os.path.exists(meta_filepath):
+        return None
+    stat = os.stat(meta_filepath)
+    signature = (preprocessing_hash, stat.st_size, stat.st_mtime_ns)
+    with postings_index_lock:
+        if postings_index['signature'] == signature:
+            return postings_index['index']
+        try:
+            index = read_versioned_arrays(get_postings_folderpath(preprocessing_hash))
+        except Exception as e:
+            logger.error(f"failed to load the postings index located in {meta_filepath} - error: {e}")
+            return None
+        postings_index.update(signature=signature, index=index)
+        return index
+
+
+def intersect_postings(postings: List[numpy.ndarray]) -> numpy.ndarray:
+    """
+    Intersecting sorted posting lists, starting from the shortest one and galloping (binary searching) each of its
+    surviving entries into the next list, so the cost depends on the shortest list rather than the longest.
+
+    Parameters
+    ----------
+    postings: `List[numpy.ndarray]`, required
+        The sorted posting lists.
+
+    Returns
+    -------
+    `numpy.ndarray`: The sorted entries present in all of the lists.
+    """
+    postings = sorted(postings, key=len)
+    output = numpy.asarray(postings[0])
+    for posting in postings[1:]:
+        if len(output) == 0:
+            break
+        positions = numpy.searchsorted(posting, output)
+        output = output[(positions < len(posting)) & (numpy.asarray(posting)[numpy.minimum(positions, len(posting) - 1)] == output)]
+    return output
+
+
+def get_example_tweets(
+        query_terms: List[str],
+        handles: List[str],
+        min_date: str,
+        max_date: str,
+        top_n: int = 10
+) -> List[Dict[str, Any]]:
+    """
+    Parameters
+    ----------
+    query_terms: `List[str]`, required
+        The terms that the tweets should all include, where the phrases require all of their words (anywhere in the
+        tweet) and the wildcards any of their expansions.
+
+    handles: `List[str]`, required
+        The lower-cased handles of the institutions.
+
+    min_date: `str`, required
+        The start of the timespan (inclusive).
+
+    max_date: `str`, required
+        The end of the timespan (exclusive).
+
+    top_n: `int`, optional (default=10)
+        The number of tweets to return.
+
+    Returns
+    -------
+    `List[Dict[str, Any]]`: The tweets with the highest engagement (replies, retweets and likes) among the matching
+    ones, or `None` if the postings index has not been built.
+    """
+    index = read_postings_index(get_preprocessing_hash())
+    if index is None:
+        return None
+
+    # - the tweets of the timespan are a contiguous range of documents
+    doc_days = index['doc_days']
+    start = numpy.searchsorted(doc_days, numpy.datetime64(pandas.Timestamp(min_date).date(), 'D'), side='left')
+    end = numpy.searchsorted(doc_days, numpy.datetime64(pandas.Timestamp(max_date).date(), 'D'), side='left')
+    term_offsets, posting_docs = index['term_offsets'], index['posting_docs']
+
+    def get_range_postings(term_id: int) -> numpy.ndarray:
+        posting = posting_docs[term_offsets[term_id]:term_offsets[term_id + 1]]
+        return numpy.asarray(posting[numpy.searchsorted(posting, start):numpy.searchsorted(posting, end)])
+
+    postings = []
+    for query_term in query_terms:
+        for word in query_term.split():
+            term_ids = expand_query_term(index['vocabulary'], word, term_totals=index['term_totals'])
+            postings.append(numpy.unique(numpy.concatenate(
+                [get_range_postings(e) for e in term_ids] + [numpy.array([], dtype=numpy.int32)])))
+    if len(postings) == 0:
+        return []
+    docs = intersect_postings(postings)
+
+    handle_mask = numpy.zeros(len(index['handles']), dtype=bool)
+    handle_index = {e: i for i, e in enumerate(index['handles'])}
+    handle_mask[[handle_index[e] for e in handles if e in handle_index]] = True
+    docs = docs[handle_mask[numpy.asarray(index['doc_handles'])[docs]]]
+    docs = docs[numpy.argsort(-numpy.asarray(index['doc_engagements'])[docs], kind='stable')[:top_n]]
+
+    # - reading the text of the selected tweets, once per partition
+    doc_ids = numpy.asarray(index['doc_ids'])[docs]
+    keys = [(index['handles'][index['doc_handles'][e]], index['months'][index['doc_months'][e]]) for e in docs.tolist()]
+    rows = dict()
+    for handle, month in sorted(set(keys)):
+        df = read_tweet_store_partition(
+            handle=handle,
+            month=month,
+            columns=['id', 'date', 'username', 'tweet', 'replies_count', 'retweets_count', 'likes_count'])
+        df = df[df.id.isin(doc_ids)]
+        rows.update({tweet_id: row for tweet_id, row in zip(df.id.tolist(), df.itertuples(index=False))})
+
+    return [
+        dict(
+            id=str(row.id),
+            date=str(row.date),
+            username=str(row.username),
+            tweet=str(row.tweet),
+            replies_count=int(row.replies_count),
+            retweets_count=int(row.retweets_count),
+            likes_count=int(row.likes_count))
+        for row in [rows.get(e, None) for e in doc_ids.tolist()] if row is not None]
@@ -0,0 +1,26 @@
+import argparse
+from app.libraries.io.tweet_filepaths import get_tweet_filepaths
+from app.libraries.io.tweet_store import ingest_tweet_store
+from app.libraries.word_frequency.count_cube import build_count_cube
+from app.libraries.word_frequency.postings import build_postings_index
+
+if __name__ == "__main__":
+    # - parsing the arguments
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--overwrite', action='store_true', help="""
+    re-ingest every handle, even the ones whose tweet files have not changed.
+    """)
+    parser.add_argument('--skip_count_cube', action='store_true', help="""
+    do not update the word-frequency count cube and the postings index after the ingestion.
+    """)
+    args = parser.parse_args()
+
+    # - converting the `TWEETS_ROOT` tree into the columnar tweet store
+    tweet_filepaths = get_tweet_filepaths()
+    ingest_tweet_store(tweet_filepaths=tweet_filepaths, overwrite=args.overwrite)
+
+    # - updating the `(handle, day) x term` counts that word-frequency queries are served from, and the postings
+    # that their example tweets are found with
+    if not args.skip_count_cube:
+        build_count_cube(tweet_filepaths=tweet_filepaths)
+        build_postings_index(tweet_filepaths=tweet_filepaths)
@@ -14,6 +14,18 @@ class Configurations(object):
     accounts_df_filepath = os.environ.get('ACCOUNTS_DF_FILEPATH')
     tweets_root = os.environ.get('TWEETS_ROOT')
     cache_folderpath = os.environ.get('CACHE_FOLDERPATH')
+    corpus_manifest_content_hash = (os.environ.get('CORPUS_MANIFEST_CONTENT_HASH') or 'true').lower() in ['1', 'true', 'yes']
+    corpus_loader_worker_count = int(os.environ.get('CORPUS_LOADER_WORKER_COUNT') or os.cpu_count() or 1)
+    tweet_catalog_refresh_interval_in_seconds = float(os.environ.get('TWEET_CATALOG_REFRESH_INTERVAL_IN_SECONDS') or 60)
+    preprocessing_worker_count = int(os.environ.get('PREPROCESSING_WORKER_COUNT') or os.cpu_count() or 1)
+    preprocessing_chunk_size = int(os.environ.get('PREPROCESSING_CHUNK_SIZE') or 2000)
+    token_cache_max_size = int(os.environ.get('TOKEN_CACHE_MAX_SIZE') or 500000)
+    ngram_min_count = int(os.environ.get('NGRAM_MIN_COUNT') or 5)
+    wildcard_max_expansions = int(os.environ.get('WILDCARD_MAX_EXPANSIONS') or 200)
+    word_cloud_worker_count = int(os.environ.get('WORD_CLOUD_WORKER_COUNT') or os.cpu_count() or 1)
+    topic_inference_worker_count = int(os.environ.get('TOPIC_INFERENCE_WORKER_COUNT') or os.cpu_count() or 1)
+    topic_inference_batch_size = int(os.environ.get('TOPIC_INFERENCE_BATCH_SIZE') or 20000)
+    topic_model_cache_size = int(os.environ.get('TOPIC_MODEL_CACHE_SIZE') or 4)
     SECRET_KEY = os.environ.get('SECRET_KEY') or 'secret_key2'
     ADMINS = ['shayan@cs.ucla.edu']
     LANGUAGES = ['en']
@@ -0,0 +1,9 @@
+import os
+import tempfile
+
+# - the configurations are read when `app` is imported, so the tests run against their own tweets and cache folders
+test_folderpath = tempfile.mkdtemp(prefix='mockingbird_tests_')
+os.environ['TWEETS_ROOT'] = os.path.join(test_folderpath, 'tweets')
+os.environ['CACHE_FOLDERPATH'] = os.path.join(test_folderpath, 'cache')
+os.environ['ACCOUNTS_DF_FILEPATH'] = os.path.join(test_folderpath, 'accounts.csv')
+os.makedirs(os.environ['TWEETS_ROOT'], exist_ok=True)
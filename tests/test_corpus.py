@@ -0,0 +1,46 @@
+import os
+import numpy
+
+from app import cache_folderpath
+from app.libraries.preprocessing.corpus import TokenCorpus
+
+
+def get_corpus():
+    return TokenCorpus.from_lists(
+        ids=[30, 10, 20],
+        dates=['2021-01-03', '2021-01-01', '2021-01-02'],
+        text_list=['public health now', 'health', ''],
+        tokens_list=[['public', 'health'], ['health'], []])
+
+
+def test_token_corpus_round_trip():
+    folderpath = os.path.join(cache_folderpath, 'tests', 'round_trip')
+    corpus = get_corpus()
+    corpus.write(folderpath, extra_arrays=dict(dropped_ids=numpy.array([40])))
+
+    for mmap in [True, False]:
+        read_corpus = TokenCorpus.read(folderpath, mmap=mmap)
+        assert numpy.asarray(read_corpus.ids).tolist() == [30, 10, 20]
+        assert read_corpus.get_tokens_list() == [['public', 'health'], ['health'], []]
+        assert read_corpus.get_text_list() == ['public health now', 'health', '']
+        assert read_corpus.get_term_counts() == {'public': 1, 'health': 2, 'now': 1}
+        assert read_corpus.get_term_counts(rows=numpy.array([1, 2]), stream='tokens') == {'health': 1}
+
+
+def test_token_corpus_select_and_concatenate():
+    corpus = get_corpus()
+    other = TokenCorpus.from_lists(ids=[40], dates=['2021-01-04'], text_list=['vaccine news'], tokens_list=[['vaccin']])
+    merged = TokenCorpus.concatenate([corpus.select(numpy.array([1, 0])), other])
+    assert numpy.asarray(merged.ids).tolist() == [10, 30, 40]
+    assert merged.get_tokens_list() == [['health'], ['public', 'health'], ['vaccin']]
+    assert merged.select(numpy.array([False, False, True])).get_text_list() == ['vaccine news']
+
+
+def test_token_corpus_write_replaces_the_previous_version():
+    folderpath = os.path.join(cache_folderpath, 'tests', 'versions')
+    corpus = get_corpus()
+    for rows in [[0], [1], [2]]:
+        corpus.select(numpy.array(rows)).write(folderpath)
+        assert numpy.asarray(TokenCorpus.read(folderpath).ids).tolist() == numpy.asarray(corpus.ids)[rows].tolist()
+    # - only the current and the previous versions are kept
+    assert len([e for e in os.listdir(folderpath) if os.path.isdir(os.path.join(folderpath, e))]) == 2
@@ -0,0 +1,103 @@
+import os
+import numpy
+import pytest
+from types import SimpleNamespace
+
+pytest.importorskip('fame')
+
+from app import cache_folderpath
+from app.libraries.io.read_write import write_pkl_gz
+from app.libraries.trajectory.partitions import get_partition_piece_filepath
+from app.libraries.topic_modeling import daily_topics as daily_topics_module
+from app.libraries.topic_modeling import utilities
+from app.libraries.topic_modeling.inference import get_partition_daily_topic_sums_key
+from app.libraries.topic_modeling.daily_topics import update_daily_topics, get_daily_topics_trajectory, \
+    is_covered_by_daily_topics
+
+pipeline = SimpleNamespace(lda_model=SimpleNamespace(num_topics=2))
+trajectory = dict(state=None, institution_type=None, dates=('2021-01-01', '2021-01-05', dict(days=2)))
+# - the per-day `(topic sums, tweet count)` of every partition
+pieces = {
+    ('cdcgov', '2021-01', 'a'): {
+        numpy.datetime64('2021-01-01'): (numpy.array([1., 1.]), 2),
+        numpy.datetime64('2021-01-03'): (numpy.array([0., 1.]), 1)},
+    ('who', '2021-01', 'b'): {
+        numpy.datetime64('2021-01-02'): (numpy.array([2., 0.]), 2)},
+    ('cdcgov', '2021-01', 'c'): {
+        numpy.datetime64('2021-01-04'): (numpy.array([3., 1.]), 4)}}
+
+
+@pytest.fixture
+def inferred_pieces(monkeypatch, request):
+    exp_id = request.node.name
+
+    def infer_partition_daily_topic_sums(pipeline, preprocessing_hash, exp_id, partitions):
+        for partition in partitions:
+            if partition in pieces:
+                write_pkl_gz(pieces[partition], get_partition_piece_filepath(
+                    namespace='trends', key=get_partition_daily_topic_sums_key(preprocessing_hash, exp_id, partition)))
+
+    monkeypatch.setattr(daily_topics_module, 'infer_partition_daily_topic_sums', infer_partition_daily_topic_sums)
+    return exp_id
+
+
+def update(exp_id, partitions):
+    return update_daily_topics(pipeline=pipeline, preprocessing_hash='tests', exp_id=exp_id, partitions=partitions)
+
+
+def test_update_daily_topics_adds_and_replaces_partitions(inferred_pieces):
+    exp_id = inferred_pieces
+    old_partitions = [('cdcgov', '2021-01', 'a'), ('who', '2021-01', 'b')]
+    daily_topics = update(exp_id, old_partitions)
+    topic_sums, tweet_counts = get_daily_topics_trajectory(
+        daily_topics=daily_topics, trajectory=trajectory, partitions=old_partitions, bucket_count=2)
+    assert topic_sums.tolist() == [[3., 1.], [0., 1.]]
+    assert tweet_counts.tolist() == [4, 1]
+
+    # - the partition of cdcgov gets a new fingerprint, the rows of who are kept
+    new_partitions = [('cdcgov', '2021-01', 'c'), ('who', '2021-01', 'b')]
+    daily_topics = update(exp_id, new_partitions)
+    assert sorted([tuple(e) for e in daily_topics['partitions']]) == sorted(new_partitions)
+    assert is_covered_by_daily_topics(exp_id, new_partitions)
+    assert not is_covered_by_daily_topics(exp_id, old_partitions)
+    topic_sums, tweet_counts = get_daily_topics_trajectory(
+        daily_topics=daily_topics, trajectory=trajectory, partitions=new_partitions, bucket_count=2)
+    assert topic_sums.tolist() == [[2., 0.], [3., 1.]]
+    assert tweet_counts.tolist() == [2, 4]
+
+    topic_sums, tweet_counts = get_daily_topics_trajectory(
+        daily_topics=daily_topics, trajectory=trajectory, partitions=[('who', '2021-01', 'b')], bucket_count=2)
+    assert tweet_counts.tolist() == [2, 0]
+
+
+def test_update_daily_topics_skips_unreadable_pieces(inferred_pieces):
+    exp_id = inferred_pieces
+    partitions = [('cdcgov', '2021-01', 'a'), ('who', '2021-02', 'd')]
+    daily_topics = update(exp_id, partitions)
+    assert [tuple(e) for e in daily_topics['partitions']] == [('cdcgov', '2021-01', 'a')]
+    assert not is_covered_by_daily_topics(exp_id, partitions)
+
+
+def test_processed_request_cache_plots_covered_trends(inferred_pieces, monkeypatch):
+    exp_id = inferred_pieces
+    partitions = [('cdcgov', '2021-01', 'a'), ('who', '2021-01', 'b')]
+    request_cache = dict(
+        trajectories=dict(query=trajectory),
+        partitions=dict(query=partitions),
+        exp_id=exp_id,
+        support_corpus_folderpath=os.path.join(cache_folderpath, 'tests', exp_id),
+        trajectory_trends_filepath=os.path.join(cache_folderpath, 'tests', f'{exp_id}-trends.pkl.gz'),
+        trends_figure_filepath=os.path.join(cache_folderpath, 'tests', f'{exp_id}-trends.json.gz'))
+    os.makedirs(os.path.join(cache_folderpath, 'tests'), exist_ok=True)
+    monkeypatch.setattr(utilities, 'get_request_cache', lambda **kwargs: request_cache)
+    monkeypatch.setattr(utilities, 'is_token_corpus_written', lambda folderpath: True)
+    monkeypatch.setattr(utilities, 'is_topic_model_saved', lambda exp_id: True)
+    args = dict(
+        support_institutions=None, query_institutions=None, topic_counts=2, support_min_date='2020-01-01',
+        support_max_date='2020-12-31', query_step_in_days=2, query_min_date='2021-01-01', query_max_date='2021-01-05')
+
+    assert utilities.get_processed_request_cache(**args) is None
+    update(exp_id, partitions)
+    assert utilities.get_processed_request_cache(**args) is request_cache
+    assert os.path.exists(request_cache['trends_figure_filepath'])
+    assert utilities.get_topic_modeling_figure_filepath(**args) == request_cache['trends_figure_filepath']
@@ -0,0 +1,49 @@
+import os
+import pytest
+
+pytest.importorskip('fame')
+
+from app import create_app, cache_folderpath
+from app.libraries.utilities.plotly import write_figure_payload, read_figure_payload
+from app.blueprints.word_frequency import views as word_frequency_views
+from app.blueprints.topic_modeling import views as topic_modeling_views
+
+
+@pytest.fixture
+def client():
+    return create_app().test_client()
+
+
+def get_queued_requests():
+    return sorted(os.listdir(os.path.join(cache_folderpath, 'requests', 'args')))
+
+
+def test_figure_views_do_not_queue_requests(client, monkeypatch):
+    monkeypatch.setattr(word_frequency_views, 'get_word_frequency_figure_payload_filepath', lambda **kwargs: None)
+    monkeypatch.setattr(topic_modeling_views, 'get_topic_modeling_figure_filepath', lambda **kwargs: None)
+    queued_requests = get_queued_requests()
+
+    assert client.get('/word_frequencies/figure?query_step_in_days=7').status_code == 400
+    assert client.get(
+        '/word_frequencies/figure?query_institutions=ethnic media&query_step_in_days=7&query_min_date=2021-01-01'
+        '&query_max_date=2021-03-01&query_terms=vaccine').status_code == 404
+    assert client.get(
+        '/topic_modeling/figure?support_institutions=ethnic media&query_institutions=ethnic media&topic_counts=5'
+        '&support_min_date=2021-01-01&support_max_date=2021-03-01&query_step_in_days=7&query_min_date=2021-01-01'
+        '&query_max_date=2021-03-01').status_code == 404
+    assert get_queued_requests() == queued_requests
+
+
+def test_figure_views_send_stored_payloads(client, monkeypatch):
+    import plotly_express as px
+    figure_filepath = os.path.join(cache_folderpath, 'tests', 'figure.json.gz')
+    write_figure_payload(px.line(x=[1, 2], y=[3, 4]), figure_filepath)
+    assert [e for e in os.listdir(os.path.dirname(figure_filepath)) if '.tmp' in e] == []
+    monkeypatch.setattr(
+        word_frequency_views, 'get_word_frequency_figure_payload_filepath', lambda **kwargs: figure_filepath)
+
+    response = client.get(
+        '/word_frequencies/figure?query_institutions=ethnic media&query_step_in_days=7&query_min_date=2021-01-01'
+        '&query_max_date=2021-03-01&query_terms=vaccine', headers={'Accept-Encoding': 'identity'})
+    assert response.status_code == 200
+    assert response.get_data(as_text=True) == read_figure_payload(figure_filepath)
@@ -0,0 +1,56 @@
+import numpy
+import pytest
+
+pytest.importorskip('fame')
+
+from app.libraries.io.tweet_store import ingest_handle, read_tweet_store_partition
+from app.libraries.preprocessing.corpus import TokenCorpus
+from app.libraries.word_frequency import postings
+from app.libraries.word_frequency.postings import intersect_postings, build_postings_index, get_example_tweets
+from test_tweet_store import write_tweet_file
+
+
+def get_preprocessed_partition(pipeline, preprocessing_hash, partition):
+    df = read_tweet_store_partition(handle=partition[0], month=partition[1], columns=['id', 'date', 'tweet'])
+    return TokenCorpus.from_lists(
+        ids=df.id.tolist(),
+        dates=df.date.tolist(),
+        text_list=df.tweet.tolist(),
+        tokens_list=[e.split() for e in df.tweet.tolist()])
+
+
+def test_intersect_postings():
+    assert intersect_postings([numpy.array([1, 3, 5, 7, 9]), numpy.array([3, 4, 9]), numpy.array([0, 3, 9, 10])]).tolist() == [3, 9]
+    assert intersect_postings([numpy.array([1, 2]), numpy.array([], dtype=numpy.int64)]).tolist() == []
+    assert intersect_postings([numpy.array([2, 4, 6])]).tolist() == [2, 4, 6]
+    assert intersect_postings([numpy.array([10, 20]), numpy.array([5, 30])]).tolist() == []
+
+
+def test_example_tweets_intersect_the_query_terms(monkeypatch):
+    monkeypatch.setattr(postings, 'get_pipeline', lambda: None)
+    monkeypatch.setattr(postings, 'get_preprocessing_hash', lambda: 'tests')
+    monkeypatch.setattr(postings, 'preprocess_partitions', lambda **kwargs: None)
+    monkeypatch.setattr(postings, 'get_preprocessed_partition', get_preprocessed_partition)
+    tweet_filepaths = [
+        write_tweet_file('postingsa', [
+            (1, '2021-01-02 10:00:00', 'public health vaccine'),
+            (2, '2021-01-03 10:00:00', 'vaccines public'),
+            (3, '2021-02-01 10:00:00', 'public health vaccinated')]),
+        write_tweet_file('postingsb', [
+            (4, '2021-01-04 10:00:00', 'health vaccine'),
+            (5, '2021-01-05 10:00:00', 'public health')])]
+    for handle, tweet_filepath in zip(['postingsa', 'postingsb'], tweet_filepaths):
+        ingest_handle(handle, [tweet_filepath])
+    build_postings_index(tweet_filepaths)
+
+    def get_example_ids(query_terms, handles=('postingsa', 'postingsb'), min_date='2021-01-01', max_date='2021-03-01'):
+        tweets = get_example_tweets(
+            query_terms=query_terms, handles=list(handles), min_date=min_date, max_date=max_date)
+        return sorted([int(e['id']) for e in tweets])
+
+    assert get_example_ids(['public health']) == [1, 3, 5]
+    assert get_example_ids(['public', 'vacc*']) == [1, 2, 3]
+    assert get_example_ids(['public health', 'vacc*']) == [1, 3]
+    assert get_example_ids(['public health', 'vacc*'], max_date='2021-02-01') == [1]
+    assert get_example_ids(['health'], handles=['postingsb']) == [4, 5]
+    assert get_example_ids(['measles']) == []
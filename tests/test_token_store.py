@@ -0,0 +1,29 @@
+import numpy
+import pytest
+
+pytest.importorskip('fame')
+
+from app.libraries.preprocessing.corpus import TokenCorpus
+from app.libraries.preprocessing.token_store import read_token_store_shard, write_token_store_shard
+
+
+def test_token_store_shard_merges_writes():
+    shard, dropped_ids = read_token_store_shard('tests', 'merged', '2021-01')
+    assert len(shard) == 0 and len(dropped_ids) == 0
+
+    write_token_store_shard('tests', 'merged', '2021-01', missed=TokenCorpus.from_lists(
+        ids=[30, 10],
+        dates=['2021-01-03', '2021-01-01'],
+        text_list=['public health', 'vaccine'],
+        tokens_list=[['public', 'health'], ['vaccine']]), missed_ids=numpy.array([10, 30, 40]))
+    # - a later writer of the same shard keeps the tweets written before it, including those it preprocessed again
+    write_token_store_shard('tests', 'merged', '2021-01', missed=TokenCorpus.from_lists(
+        ids=[20, 10],
+        dates=['2021-01-02', '2021-01-01'],
+        text_list=['health', 'vaccine'],
+        tokens_list=[['health'], ['vaccine']]), missed_ids=numpy.array([10, 20, 50]))
+
+    shard, dropped_ids = read_token_store_shard('tests', 'merged', '2021-01')
+    assert numpy.asarray(shard.ids).tolist() == [10, 20, 30]
+    assert shard.get_tokens_list() == [['vaccine'], ['health'], ['public', 'health']]
+    assert dropped_ids.tolist() == [40, 50]
@@ -0,0 +1,49 @@
+import os
+import pandas
+
+from app import tweets_repo
+from app.libraries.meta.features import important_twint_columns
+from app.libraries.io.tweet_store import ingest_handle, read_handle_meta, read_tweet_store_partition, read_tweet_store
+
+
+def write_tweet_file(handle, rows, folder='group'):
+    tweet_filepath = os.path.join(tweets_repo, folder, f'{handle}.csv')
+    os.makedirs(os.path.dirname(tweet_filepath), exist_ok=True)
+    pandas.DataFrame(
+        [[tweet_id, date, '0', 1, 2, 3, '[]', text, 7, handle, handle] for tweet_id, date, text in rows],
+        columns=important_twint_columns).to_csv(tweet_filepath, sep='\t', index=False)
+    return tweet_filepath
+
+
+def test_ingest_handle_partitions_tweets_by_month():
+    tweet_filepath = write_tweet_file('partitioned', [
+        (2, '2021-02-01 10:00:00', 'second'),
+        (1, '2021-01-31 23:00:00', 'first'),
+        (3, '2021-02-03 10:00:00', 'third')])
+    meta = ingest_handle('partitioned', [tweet_filepath])
+
+    assert sorted(meta['partitions'].keys()) == ['2021-01', '2021-02']
+    assert read_handle_meta('partitioned') == meta
+    assert read_tweet_store_partition('partitioned', '2021-02').id.tolist() == [2, 3]
+    assert read_tweet_store('partitioned', '2021-01-01', '2021-02-02', columns=['id']).id.tolist() == [1, 2]
+    # - an unchanged handle is not re-written
+    assert ingest_handle('partitioned', [tweet_filepath]) == meta
+
+
+def test_ingest_handle_deduplicates_tweets_and_applies_edits():
+    tweet_filepaths = [
+        write_tweet_file('deduplicated', [(1, '2021-01-05 10:00:00', 'a'), (2, '2021-02-05 10:00:00', 'b')], 'first'),
+        write_tweet_file('deduplicated', [(2, '2021-02-05 10:00:00', 'b')], 'second')]
+    ingest_handle('deduplicated', tweet_filepaths)
+    assert read_tweet_store('deduplicated', '2021-01-01', '2021-04-01', columns=['id']).id.tolist() == [1, 2]
+
+    # - an edited tweet replaces its stored copy, even when its date moves it to another partition
+    tweet_filepaths[0] = write_tweet_file('deduplicated', [
+        (1, '2021-01-05 10:00:00', 'a edited'),
+        (2, '2021-03-05 10:00:00', 'b moved'),
+        (3, '2021-01-06 10:00:00', 'c')], 'first')
+    meta = ingest_handle('deduplicated', tweet_filepaths)
+    assert sorted(meta['partitions'].keys()) == ['2021-01', '2021-03']
+    df = read_tweet_store('deduplicated', '2021-01-01', '2021-04-01', columns=['id', 'tweet', 'username'])
+    assert df[['id', 'tweet']].values.tolist() == [[1, 'a edited'], [3, 'c'], [2, 'b moved']]
+    assert str(df.username.dtype) == 'category'
@@ -0,0 +1,97 @@
+import numpy
+import pytest
+from collections import Counter
+
+pytest.importorskip('fame')
+
+from app.libraries.word_frequency import count_cube
+from app.libraries.word_frequency.count_cube import expand_query_term, get_query_term_counts, build_count_cube, \
+    get_count_cube_counts, get_phrase_counts
+
+trajectory = dict(state=None, institution_type=None, dates=('2021-01-01', '2021-01-05', dict(days=2)))
+partitions = [('cdcgov', '2021-01', 'a'), ('who', '2021-01', 'b')]
+daily_word_freqs = {
+    partitions[0]: {
+        numpy.datetime64('2021-01-01'): {'vaccine': 3, 'vaccines': 1, 'public': 2, 'health': 2},
+        numpy.datetime64('2021-01-04'): {'vaccinated': 2, 'health': 1}},
+    partitions[1]: {
+        numpy.datetime64('2021-01-02'): {'vaccine': 1, 'vacation': 4},
+        numpy.datetime64('2021-01-06'): {'vaccines': 5}}}
+daily_ngram_freqs = {
+    partitions[0]: {
+        numpy.datetime64('2021-01-01'): {'public health': 2},
+        numpy.datetime64('2021-01-04'): {'public healthcare': 1}},
+    partitions[1]: dict()}
+
+
+@pytest.fixture
+def partition_frequencies(monkeypatch):
+    monkeypatch.setattr(count_cube, 'get_pipeline', lambda: None)
+    monkeypatch.setattr(count_cube, 'get_preprocessing_hash', lambda: 'tests')
+    monkeypatch.setattr(count_cube, 'get_ingested_partitions', lambda handles: partitions)
+    monkeypatch.setattr(count_cube, 'preprocess_uncounted_partitions', lambda **kwargs: None)
+    monkeypatch.setattr(
+        count_cube, 'get_partition_daily_word_frequencies', lambda partition, **kwargs: daily_word_freqs[partition])
+    monkeypatch.setattr(
+        count_cube, 'get_partition_daily_ngram_frequencies', lambda partition, **kwargs: daily_ngram_freqs[partition])
+
+
+def get_fallback_counts(query_terms):
+    buckets = count_cube.get_bucket_indices_for_days
+    word_freqs = [Counter() for _ in range(2)]
+    for partition in partitions:
+        days = list(daily_word_freqs[partition].keys())
+        for day, bucket in zip(days, buckets(days=days, trajectory=trajectory).tolist()):
+            if bucket >= 0:
+                word_freqs[bucket].update(daily_word_freqs[partition][day])
+    return get_query_term_counts(word_freqs, [e for e in query_terms if not count_cube.is_phrase(e)]) + \
+        get_phrase_counts(
+            pipeline=None, preprocessing_hash='tests', partitions=partitions, trajectory=trajectory,
+            phrases=[e for e in query_terms if count_cube.is_phrase(e)], bucket_count=2)
+
+
+def test_expand_query_term_keeps_the_most_frequent_matches():
+    vocabulary = ['vacation', 'vaccinated', 'vaccine', 'vaccines']
+    term_totals = numpy.array([5, 1, 9, 2])
+    assert expand_query_term(vocabulary, 'vacc*', term_totals=term_totals) == [1, 2, 3]
+    assert expand_query_term(vocabulary, 'vacc*', term_totals=term_totals, max_expansions=2) == [2, 3]
+    assert expand_query_term(vocabulary, 'vaccine', term_totals=term_totals) == [2]
+    assert expand_query_term(vocabulary, 'measles', term_totals=term_totals) == []
+
+
+def test_query_term_counts_expand_wildcard_phrases():
+    freqs = [
+        Counter({'public health': 3, 'public heal': 1, 'public health care': 2}),
+        Counter({'public health': 1})]
+    assert get_query_term_counts(freqs, ['public heal*']).tolist() == [6, 1]
+    assert get_query_term_counts(freqs, ['public health']).tolist() == [3, 1]
+
+
+def test_count_cube_matches_fallback(partition_frequencies):
+    build_count_cube(tweet_filepaths=['cdcgov.csv', 'who.csv'])
+    for query_terms in [['vaccine'], ['vacc*'], ['public health', 'vaccines'], ['public heal*'], ['measles']]:
+        cube_counts = get_count_cube_counts(
+            trajectory=trajectory, partitions=partitions, query_terms=query_terms, bucket_count=2)
+        assert cube_counts.tolist() == get_fallback_counts(query_terms).tolist()
+    assert get_count_cube_counts(
+        trajectory=trajectory, partitions=partitions, query_terms=['vacc*'], bucket_count=2).tolist() == [5, 2]
+
+
+def test_count_cube_word_frequency_data_misses_without_preprocessing(partition_frequencies, monkeypatch):
+    from app.libraries.word_frequency import utilities
+
+    def fail(**kwargs):
+        raise AssertionError("the tweets should not be preprocessed")
+
+    build_count_cube(tweet_filepaths=['cdcgov.csv', 'who.csv'])
+    monkeypatch.setattr(utilities, 'get_tweet_filepaths', lambda: ['cdcgov.csv', 'who.csv'])
+    monkeypatch.setattr(count_cube, 'preprocess_uncounted_partitions', fail)
+    args = dict(query_institutions=None, query_step_in_days=2, query_min_date='2021-01-01',
+                query_max_date='2021-01-05', query_terms=['vacc*'])
+
+    monkeypatch.setattr(utilities, 'get_trajectory_partitions', lambda **kwargs: partitions)
+    assert utilities.get_count_cube_word_frequency_data(**args) is not None
+    assert utilities.get_word_frequency_figure_payload_filepath(**args) is not None
+
+    monkeypatch.setattr(utilities, 'get_trajectory_partitions', lambda **kwargs: partitions + [('who', '2021-02', 'c')])
+    assert utilities.get_count_cube_word_frequency_data(**args) is None